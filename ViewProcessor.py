@@ -1,26 +1,29 @@
 from decoders import *
-from copy import copy
+from ir import *
 
 class ObjectProcessor(object):
-    def __init__(self, ctx):
+    # Attributes read before process_attrs(), which are not properties of the object
+    consumed_attributes = frozenset(['id', 'customClass'])
+
+    def __init__(self, ctx, schema=None):
         self.ctx = ctx
+        self.schema = schema
         self.xib_id = None
         self.var_name = None
         self.class_name = None
 
     def process(self, obj):
-        attrs = copy(obj.attrib)
+        attrs = obj.attrib
         self.process_id(obj, attrs)
         self.process_class(obj, attrs)
         self.construct_instance(obj, attrs)
         self.process_attrs(attrs)
-        self.ctx.check_attributes(attrs)
         for e in obj:
             self.process_element(e)
         return self.var_name
 
     def process_id(self, obj, attrs):
-        self.xib_id = attrs.pop('id')
+        self.xib_id = attrs['id']
         self.var_name = self.generate_name()
         self.ctx.id_to_var[self.xib_id] = self.var_name
 
@@ -28,34 +31,56 @@ class ObjectProcessor(object):
         return self.ctx.generate_var_name('obj')
 
     def process_class(self, obj, attrs):
-        class_name = attrs.pop('customClass', None)
+        class_name = attrs.get('customClass', None)
         if class_name is None:
             class_name = self.default_class()
         self.class_name = class_name
 
     def default_class(self):
-        return UnknownAttributeValue()
+        if self.schema is None:
+            raise UnknownAttributeValue()
+        return self.schema.default_class
 
     def constructor_expr(self, obj, attrs):
-        return '[[' + self.class_name + ' alloc] init]'
+        return AllocInit(self.class_name)
 
     def construct_instance(self, obj, attrs):
         constructor_expr = self.constructor_expr(obj, attrs)
-        self.ctx.write(self.class_name + ' *' + self.var_name + ' = ' + constructor_expr + ';')
+        self.ctx.add(Alloc(self.var_name, self.class_name, constructor_expr, self.instance_defaults(), self.xib_id))
+
+    def instance_defaults(self):
+        # Custom classes may initialize their properties differently
+        if self.schema is None or self.class_name != self.schema.default_class:
+            return None
+        return self.schema.defaults
 
     def process_attrs(self, attrs):
+        ignored = self.schema.ignored if self.schema is not None else ()
+        unknown = []
         keys = list(attrs.keys())
         keys.sort()
         for key in keys:
+            if key in self.consumed_attributes or key in ignored:
+                continue
             decoder = self.decoder_for_attribute(key)
             if decoder is None:
+                unknown.append(key)
                 continue
-            value = attrs.pop(key)
-            value = decoder(value)
+            value = attrs[key]
+            try:
+                value = decoder(value)
+            except XIBError as error:
+                if error.attribute is None:
+                    error.attribute = key
+                if not error.args:
+                    error.args = (value,)
+                raise
             self.write_property(key, value)
+        if unknown:
+            raise UnknownAttribute(', '.join(unknown))
 
     def decoder_for_attribute(self, key):
-        return None
+        return self.schema.decoders.get(key)
 
     def process_element(self, e):
         val = self.ctx.parse_value_element(e)
@@ -63,10 +88,10 @@ class ObjectProcessor(object):
             (key, value) = val
             self.write_property(key, value)
         else:
-            raise UnknownTag()
+            raise UnknownTag(e)
 
     def should_skip_property(self, key):
-        return False
+        return key in self.schema.skipped
 
     def write_property(self, key, value):
         if self.should_skip_property(key):
@@ -74,60 +99,25 @@ class ObjectProcessor(object):
         self.write_property_impl(key, value)
 
     def write_property_impl(self, key, value):
-        property_name = self.property_name_for_key(key)
-        self.ctx.write(self.var_name + '.' + property_name + ' = ' + value + ';')
-
-    def property_name_for_key(self, key):
-        return key
+        self.ctx.add(SetProperty(self.var_name, key, value, self.schema.setters.get(key)))
 
 
 class ViewProcessor(ObjectProcessor):
-    decoder_func_for_attribute = {
-        'adjustsFontSizeToFit': decode_bool,
-        'baselineAdjustment': decode_baseline_adjustment,
-        'contentMode': decode_content_mode,
-        'horizontalHuggingPriority': decode_number,
-        'horizontalCompressionResistancePriority': decode_number,
-        'lineBreakMode': decode_line_break_mode,
-        'opaque': decode_bool,
-        'text': decode_string,
-        'textAlignment': decode_text_alignment,
-        'translatesAutoresizingMaskIntoConstraints': decode_bool,
-        'userInteractionEnabled': decode_bool,
-        'verticalHuggingPriority': decode_number,
-        'verticalCompressionResistancePriority': decode_number,
-        'multipleTouchEnabled': decode_bool,
-        'clipsSubviews': decode_bool,
-        'misplaced': decode_bool,
-        'minimumScaleFactor': decode_number,
-        'clearsContextBeforeDrawing': decode_bool
-    }
-
     def generate_name(self):
         return self.ctx.generate_var_name('v')
 
-    def default_class(self):
-        return 'UIView'
-
     def constructor_expr(self, obj, attrs):
         rect = self.find_frame(obj)
-        return '[[' + self.class_name + ' alloc] initWithFrame:' + rect + ']'
+        if rect is None:
+            raise BadXibFormat()
+        return AllocInit(self.class_name, 'initWithFrame', rect)
 
     def find_frame(self, view):
-        for r in view.findall('rect'):
+        for r in view.iterfind('rect'):
             if r.get('key') == 'frame':
-                attrs = copy(r.attrib)
-                attrs.pop('key')
-                return self.ctx.parse_rect(attrs, r, as_object=False)
+                return self.ctx.parse_rect(r.attrib, r, as_object=False)
         return None
 
-    def process_attrs(self, attrs):
-        attrs.pop('userLabel', None)
-        super().process_attrs(attrs)
-
-    def decoder_for_attribute(self, key):
-        return ViewProcessor.decoder_func_for_attribute.get(key) or super().decoder_for_attribute(key)
-
     def process_element(self, e):
         if e.tag == 'subviews':
             self.ctx.process_subviews(e, self.var_name)
@@ -140,89 +130,26 @@ class ViewProcessor(ObjectProcessor):
         else:
             super().process_element(e)
 
-    def should_skip_property(self, key):
-        return key in {'frame', 'misplaced'}
-
-    def write_property_impl(self, key, value):
-        if key == 'verticalHuggingPriority':
-            self.ctx.write('[' + self.var_name + ' setContentHuggingPriority:' + value + ' forAxis:UILayoutConstraintAxisVertical];')
-        elif key == 'horizontalHuggingPriority':
-            self.ctx.write('[' + self.var_name + ' setContentHuggingPriority:' + value + ' forAxis:UILayoutConstraintAxisHorizontal];')
-        elif key == 'horizontalCompressionResistancePriority':
-            self.ctx.write('[' + self.var_name + ' setContentCompressionResistancePriority:' + value + ' forAxis:UILayoutConstraintAxisHorizontal];')
-        elif key == 'verticalCompressionResistancePriority':
-            self.ctx.write('[' + self.var_name + ' setContentCompressionResistancePriority:' + value + ' forAxis:UILayoutConstraintAxisHorizontal];')
-        else:
-            super().write_property_impl(key, value)
-
-    def property_name_for_key(self, key):
-        if key == 'clipsSubviews':
-            return 'clipsToBounds'
-        return super().property_name_for_key(key)
-
 
 class RootViewProcessor(ViewProcessor):
     def generate_name(self):
         return 'self'
 
-    def should_skip_property(self, key):
-        skipped_properties = {
-            'autoresizingMask',
-            'simulatedStatusBarMetrics',
-            'simulatedDestinationMetrics',
-            'canvasLocation'
-        }
-        if key in skipped_properties:
-            return True
-        return ViewProcessor.should_skip_property(self, key)
-
     def construct_instance(self, view, attrs):
         pass
 
-    def process_attrs(self, attrs):
-        attrs.pop('contentMode', None)
-        super().process_attrs(attrs)
-
 
 class LabelProcessor(ViewProcessor):
-    def __init__(self, ctx):
-        ViewProcessor.__init__(self, ctx)
-        self.uses_attributed_text = None
-
-    decoder_func_for_attribute = {
-        'adjustsFontSizeToFit': decode_bool,
-        'adjustsLetterSpacingToFitWidth': decode_bool,
-        'baselineAdjustment': decode_baseline_adjustment,
-        'lineBreakMode': decode_line_break_mode,
-        'text': decode_string,
-        'textAlignment': decode_text_alignment,
-        'minimumScaleFactor': decode_number,
-        'minimumFontSize': decode_number,
-        'numberOfLines': decode_number
-    }
+    consumed_attributes = ViewProcessor.consumed_attributes | {'usesAttributedText'}
 
-    def default_class(self):
-        return 'UILabel'
+    def __init__(self, ctx, schema=None):
+        ViewProcessor.__init__(self, ctx, schema)
+        self.uses_attributed_text = None
 
     def process_attrs(self, attrs):
-        self.uses_attributed_text = self.ctx.get_bool(attrs.pop('usesAttributedText', 'NO'))
+        self.uses_attributed_text = self.ctx.get_bool(attrs.get('usesAttributedText', 'NO'))
         super().process_attrs(attrs)
 
-    def decoder_for_attribute(self, key):
-        return LabelProcessor.decoder_func_for_attribute.get(key) or super().decoder_for_attribute(key)
-
-    def property_name_for_key(self, key):
-        if key == 'adjustsFontSizeToFit':
-            return 'adjustsFontSizeToFitWidth'
-        elif key == 'fontDescription':
-            return 'font'
-        elif key == 'highlightedColor':
-            return 'highlightedTextColor'
-        elif key == 'clipsSubviews':
-            return 'clipsToBounds'
-        else:
-            return super().property_name_for_key(key)
-
     def write_property_impl(self, key, value):
         if key == 'text':
             if self.uses_attributed_text:
@@ -233,33 +160,10 @@ class LabelProcessor(ViewProcessor):
         super().write_property_impl(key, value)
 
 
-class ScrollViewProcessor(ViewProcessor):
-    decoder_func_for_attribute = {
-        'showsHorizontalScrollIndicator': decode_bool,
-        'showsVerticalScrollIndicator': decode_bool,
-        'pagingEnabled': decode_bool,
-    }
-
-    def default_class(self):
-        return 'UIScrollView'
-
-    def decoder_for_attribute(self, key):
-        return ScrollViewProcessor.decoder_func_for_attribute.get(key) or super().decoder_for_attribute(key)
-
-
 class ControlProcessor(ViewProcessor):
-    decoder_func_for_attribute = {
-        'contentHorizontalAlignment': decode_content_horizontal_alignment,
-        'contentVerticalAlignment': decode_content_vertical_alignment,
-    }
-
-    def decoder_for_attribute(self, key):
-        return ControlProcessor.decoder_func_for_attribute.get(key) or super().decoder_for_attribute(key)
-
     def process_element(self, e):
         if e.tag == 'state':
-            proc = self.make_state_processor()
-            proc.process(e)
+            self.ctx.process_control_state(e, self)
         else:
             return super().process_element(e)
 
@@ -267,10 +171,12 @@ class ControlProcessor(ViewProcessor):
         return ControlStateProcessor(self)
 
     def decoder_for_state_attribute(self, key):
-        return None
+        return self.schema.state_decoders.get(key)
 
 
 class ControlStateProcessor(ObjectProcessor):
+    consumed_attributes = frozenset(['key'])
+
     def __init__(self, parent_proc):
         ObjectProcessor.__init__(self, parent_proc.ctx)
         self.parent_proc = parent_proc
@@ -286,89 +192,22 @@ class ControlStateProcessor(ObjectProcessor):
         pass
 
     def process_attrs(self, attrs):
-        self.button_state = decode_control_state(attrs.pop('key'))
+        self.button_state = decode_control_state(attrs['key'])
         super().process_attrs(attrs)
 
     def decoder_for_attribute(self, key):
-        return self.parent_proc.decoder_for_state_attribute(key) or super().decoder_for_attribute(key)
-
-    def write_property_impl(self, key, value):
-        v_name = self.parent_proc.var_name
-        s_name = decode_enum_with_prefix(' set', key) + ':'
-        self.ctx.write('[' + v_name + s_name + value + ' forState:' + self.button_state + '];')
-
-
-class ButtonProcessor(ControlProcessor):
-    decoder_func_for_state_attribute = {
-        'title': decode_string,
-    }
-
-    def default_class(self):
-        return 'UIButton'
-
-    def constructor_expr(self, obj, attrs):
-        button_type = decode_button_type(attrs.pop('buttonType', 'custom'))
-        return '[' + self.class_name + ' buttonWithType:' + button_type + ']'
-
-    def find_frame(self, view):
-        for r in view.findall('rect'):
-            if r.get('key') == 'frame':
-                attrs = copy(r.attrib)
-                attrs.pop('key')
-                return self.ctx.parse_rect(attrs, r)
-        return None
+        return self.parent_proc.decoder_for_state_attribute(key)
 
     def should_skip_property(self, key):
-        if key == 'frame':
-            return False
-        return super().should_skip_property(key)
-
-    def decoder_for_state_attribute(self, key):
-        return ButtonProcessor.decoder_func_for_state_attribute.get(key) \
-            or super().decoder_for_state_attribute(key)
+        return False
 
     def write_property_impl(self, key, value):
-        if key == 'lineBreakMode':
-            key = 'titleLabel.' + key
-        super().write_property_impl(key, value)
-
-
-class ImageViewProcessor(ViewProcessor):
-    decoder_func_for_attribute = {
-        'image': decode_image_with_name,
-    }
-
-    def default_class(self):
-        return 'UIImageView'
-
-    def decoder_for_attribute(self, key):
-        return ImageViewProcessor.decoder_func_for_attribute.get(key) or super().decoder_for_attribute(key)
+        self.ctx.add(SetStateProperty(self.parent_proc.var_name, key, value, self.button_state))
 
 
-class MapViewProcessor(ViewProcessor):
-    decoder_func_for_attribute = {
-        'scrollEnabled': decode_bool,
-        'pitchEnabled': decode_bool,
-        'rotateEnabled': decode_bool,
-        'mapType': decode_map_type,
-        'zoomEnabled': decode_bool,
-        'showsUserLocation': decode_bool,
-    }
-
-    def default_class(self):
-        return 'MKMapView'
-
-    def decoder_for_attribute(self, key):
-        return MapViewProcessor.decoder_func_for_attribute.get(key) or super().decoder_for_attribute(key)
-
-
-class PageControlProcessor(ControlProcessor):
-    decoder_func_for_attribute = {
-        'numberOfPages': decode_number,
-    }
-
-    def default_class(self):
-        return 'UIPageControl'
+class ButtonProcessor(ControlProcessor):
+    consumed_attributes = ControlProcessor.consumed_attributes | {'buttonType'}
 
-    def decoder_for_attribute(self, key):
-        return PageControlProcessor.decoder_func_for_attribute.get(key) or super().decoder_for_attribute(key)
\ No newline at end of file
+    def constructor_expr(self, obj, attrs):
+        button_type = decode_button_type(attrs.get('buttonType', 'custom'))
+        return ClassMessage(self.class_name, 'buttonWithType', button_type)
@@ -0,0 +1,91 @@
+import json
+from ir import *
+
+
+def rect_size(rect):
+    # Width and height of a 'CGRectMake(x, y, width, height)' literal
+    if rect.__class__ is not str or not rect.startswith('CGRectMake('):
+        return None
+    parts = rect[len('CGRectMake('):-1].split(',')
+    try:
+        return [float(parts[2]), float(parts[3])]
+    except (IndexError, ValueError):
+        return None
+
+
+class ImageCollector(object):
+    """Finds the images used by a document, together with the views showing them."""
+
+    def __init__(self):
+        self.views = {}
+        self.sizes = {}
+        self.references = []
+        self.lazy = None
+        self.stmt = None
+
+    def visit_expr(self, e):
+        cls = e.__class__
+        if cls is ImageExpr:
+            self.add_reference(e.name)
+        elif cls is SharedValueExpr:
+            self.visit_expr(e.value)
+        elif cls is not str:
+            e.map_children(self.visit_expr)
+        return e
+
+    def add_reference(self, name):
+        var = getattr(self.stmt, 'var', None)
+        (class_name, xib_id) = self.views.get(var, (None, None))
+        self.references.append({
+            'name': name,
+            'id': xib_id,
+            'view': var,
+            'class': class_name,
+            'property': getattr(self.stmt, 'key', None),
+            'state': getattr(self.stmt, 'state', None),
+            'lazy': self.lazy,
+        })
+
+    def visit_body(self, body):
+        for stmt in body:
+            cls = stmt.__class__
+            if cls is Alloc:
+                self.views[stmt.var] = (stmt.class_name, stmt.xib_id)
+                if stmt.constructor.__class__ is AllocInit and stmt.constructor.selector == 'initWithFrame':
+                    self.sizes[stmt.var] = rect_size(stmt.constructor.arg)
+            elif cls is SetProperty and stmt.key == 'frame':
+                self.sizes[stmt.var] = rect_size(stmt.value)
+            elif cls is DispatchOnce:
+                self.visit_body(stmt.body)
+            elif cls is LazySubtree:
+                outer_lazy = self.lazy
+                self.lazy = stmt.name
+                self.visit_body(stmt.body)
+                self.lazy = outer_lazy
+            self.stmt = stmt
+            # The identity function leaves the statement as is
+            stmt.map_exprs(self.visit_expr)
+            self.stmt = None
+
+    def run(self, document: Document) -> list:
+        for method in document.methods:
+            self.visit_body(method.body)
+        for reference in self.references:
+            reference['size'] = self.sizes.get(reference['view'])
+        return self.references
+
+
+def image_references(document: Document) -> list:
+    return ImageCollector().run(document)
+
+
+def image_names(document: Document) -> list:
+    names = []
+    for reference in image_references(document):
+        if reference['name'] not in names:
+            names.append(reference['name'])
+    return names
+
+
+def image_manifest(xib_file, references: list) -> str:
+    return json.dumps({'xib': xib_file, 'images': references}, indent=2, sort_keys=True) + '\n'
@@ -0,0 +1,219 @@
+import xib2code
+import tool
+from xibgen import generate_xib
+import argparse
+import json
+import math
+import os
+import os.path
+import platform
+import random
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+arg_parser = argparse.ArgumentParser(description='Measure conversion throughput on synthetic XIB files')
+arg_parser.add_argument('-o', '--output', metavar='FILE', default='bench_results.json',
+                        help='Where to write results as JSON')
+arg_parser.add_argument('-n', '--views', metavar='N', type=int, default=500,
+                        help='Number of views in the single file benchmark')
+arg_parser.add_argument('-d', '--depth', metavar='N', type=int, default=6,
+                        help='Maximum nesting depth of subviews')
+arg_parser.add_argument('-c', '--constraints', metavar='K', type=float, default=2.0,
+                        help='Average number of constraints per view')
+arg_parser.add_argument('-f', '--fragments', metavar='N', type=int, default=2,
+                        help='Number of fragments in attributed strings')
+arg_parser.add_argument('-b', '--button-states', metavar='N', type=int, default=2,
+                        help='Number of states with a title per button')
+arg_parser.add_argument('-l', '--outlets', metavar='N', type=int, default=20,
+                        help='Number of outlets of the file owner')
+arg_parser.add_argument('-m', '--missing-assets', metavar='P', type=float, default=0.05,
+                        help='Fraction of custom fonts and images naming assets that do not exist')
+arg_parser.add_argument('--files', metavar='N', type=int, default=50,
+                        help='Number of files in the batch benchmark, 0 to skip it')
+arg_parser.add_argument('-j', '--jobs', metavar='N', type=int, default=os.cpu_count() or 1,
+                        help='Number of worker processes in the parallel batch benchmark')
+arg_parser.add_argument('-r', '--repeat', metavar='N', type=int, default=5,
+                        help='Number of measurements, the best one is reported')
+arg_parser.add_argument('--compare', metavar='FILE',
+                        help='Print changes relative to results of an earlier run')
+
+
+def measure(func, repeat):
+    best = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def peak_memory(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 1e6
+    finally:
+        tracemalloc.stop()
+
+
+def throughput(seconds, elements, size, files=None):
+    result = {
+        'seconds': seconds,
+        'elements_per_s': elements / seconds,
+        'mb_per_s': size / 1e6 / seconds,
+    }
+    if files is not None:
+        result['files_per_s'] = files / seconds
+    return result
+
+
+def count_elements(path):
+    return sum(1 for _ in ET.parse(path).getroot().iter())
+
+
+def bench_single(path, folder, repeat):
+    size = os.path.getsize(path)
+    elements = count_elements(path)
+    output_path = os.path.join(folder, 'single.inl')
+    root = ET.parse(path).getroot()
+    contexts = []
+
+    def process():
+        ctx = xib2code.Context()
+        ctx.process_document(root)
+        contexts.append(ctx)
+
+    def emit():
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        xib2code.write_if_changed(output_path, contexts[-1].output())
+
+    stages = {
+        'parse': measure(lambda: ET.parse(path), repeat),
+        'process': measure(process, repeat),
+        'emit': measure(emit, repeat),
+    }
+    stages['total'] = sum(stages.values())
+    streaming_options = xib2code.Options(streaming=True)
+    return {
+        'bytes': size,
+        'elements': elements,
+        'stages': {name: throughput(seconds, elements, size) for (name, seconds) in stages.items()},
+        'streaming': throughput(measure(lambda: xib2code.convert_xib(path, streaming_options), repeat),
+                                elements, size),
+        # Streaming writes code to the output file as it goes, so memory is measured with process_xib()
+        'peak_memory_mb': {
+            'tree': peak_memory(lambda: xib2code.process_xib(path, output_path, xib2code.Options())),
+            'streaming': peak_memory(lambda: xib2code.process_xib(path, output_path, streaming_options)),
+        },
+    }
+
+
+def convert_job(job, options):
+    xib2code.process_xib(job[0], job[1], options)
+
+
+def bench_batch(args, folder):
+    rnd = random.Random(1)
+    jobs = []
+    for i in range(args.files):
+        # Sizes are spread log-uniformly, like in a real project: many small files and a few big ones
+        views = int(math.exp(rnd.uniform(math.log(5), math.log(max(args.views * 2, 6)))))
+        input_path = os.path.join(folder, 'batch{:04d}.xib'.format(i))
+        generate_xib(input_path, views=views, depth=args.depth, constraints=args.constraints,
+                     fragments=args.fragments, button_states=args.button_states, outlets=args.outlets,
+                     missing_assets=args.missing_assets, seed=i)
+        jobs.append((input_path, os.path.join(folder, 'batch{:04d}.inl'.format(i))))
+    size = sum(os.path.getsize(job[0]) for job in jobs)
+    elements = sum(count_elements(job[0]) for job in jobs)
+    options = xib2code.Options()
+
+    def remove_outputs():
+        for (_, output_path) in jobs:
+            if os.path.exists(output_path):
+                os.remove(output_path)
+
+    def sequential():
+        remove_outputs()
+        for job in jobs:
+            convert_job(job, options)
+
+    def parallel():
+        remove_outputs()
+        for _ in tool.run_jobs(convert_job, jobs, args.jobs, options):
+            pass
+
+    return {
+        'files': len(jobs),
+        'bytes': size,
+        'elements': elements,
+        'sequential': throughput(measure(sequential, args.repeat), elements, size, len(jobs)),
+        'parallel': dict(throughput(measure(parallel, args.repeat), elements, size, len(jobs)), jobs=args.jobs),
+        'peak_memory_mb': peak_memory(sequential),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(data, prefix=''):
+    for (key, value) in data.items():
+        if isinstance(value, dict):
+            yield from flatten(value, prefix + key + '.')
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield prefix + key, value
+
+
+def print_results(results, baseline=None):
+    old = dict(flatten(baseline)) if baseline is not None else {}
+    for (key, value) in flatten(results):
+        if key.startswith('params.') or key == 'timestamp':
+            continue
+        line = '{:<45} {:>14.4f}'.format(key, value)
+        if key in old and old[key]:
+            line += '  {:>+8.1f}%'.format((value / old[key] - 1) * 100)
+        print(line)
+
+
+def run_benchmarks():
+    args = arg_parser.parse_args()
+    params = {
+        'views': args.views,
+        'depth': args.depth,
+        'constraints': args.constraints,
+        'fragments': args.fragments,
+        'button_states': args.button_states,
+        'outlets': args.outlets,
+        'missing_assets': args.missing_assets,
+    }
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'single.xib')
+        generate_xib(path, **params)
+        results = {
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'timestamp': time.time(),
+            'params': dict(params, files=args.files, repeat=args.repeat),
+            'single': bench_single(path, folder, args.repeat),
+        }
+        if args.files > 0:
+            results['batch'] = bench_batch(args, folder)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    baseline = None
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+
+if __name__ == '__main__':
+    run_benchmarks()
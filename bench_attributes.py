@@ -0,0 +1,114 @@
+from xibgen import XibGenerator
+from copy import copy
+import argparse
+import sys
+import timeit
+import xml.etree.ElementTree as ET
+
+arg_parser = argparse.ArgumentParser(description='Compare ways of consuming element attributes')
+arg_parser.add_argument('xibs', metavar='XIB', nargs='*',
+                        help='Take elements from these files instead of a synthetic one')
+arg_parser.add_argument('-n', '--repeat', metavar='N', type=int, default=5,
+                        help='Number of measurements, the best one is reported')
+
+# Handlers also ask for optional attributes that most elements do not have
+optional_keys = ['key', 'id', 'customClass', 'placeholder', 'priority']
+
+_required = object()
+
+
+class AttributeCursor(object):
+    # Tracks consumed keys one by one, instead of copying the attributes
+    __slots__ = ('attrib', 'consumed')
+
+    def __init__(self, attrib):
+        self.attrib = attrib
+        self.consumed = []
+
+    def pop(self, key, default=_required):
+        value = self.attrib.get(key, _required)
+        if value is _required or key in self.consumed:
+            if default is _required:
+                raise KeyError(key)
+            return default
+        self.consumed.append(key)
+        return value
+
+    def remaining(self):
+        return [key for key in self.attrib if key not in self.consumed]
+
+    def __len__(self):
+        return len(self.attrib) - len(self.consumed)
+
+
+def consume_copy(attrib, known):
+    attrs = copy(attrib)
+    for key in optional_keys:
+        attrs.pop(key, None)
+    for key in sorted(attrs.keys()):
+        attrs.pop(key)
+    return len(attrs) == 0
+
+
+def consume_cursor(attrib, known):
+    attrs = AttributeCursor(attrib)
+    for key in optional_keys:
+        attrs.pop(key, None)
+    for key in sorted(attrs.remaining()):
+        attrs.pop(key)
+    return len(attrs) == 0
+
+
+def consume_in_place(attrib, known):
+    # What xib2code does: read the attrib dict directly, then compare it with the keys the handler knows
+    for key in optional_keys:
+        attrib.get(key, None)
+    for key in sorted(attrib.keys()):
+        attrib[key]
+    return known.issuperset(attrib)
+
+
+def copy_size(attrib):
+    return sys.getsizeof(copy(attrib))
+
+
+def cursor_size(attrib):
+    attrs = AttributeCursor(attrib)
+    for key in attrib:
+        attrs.pop(key)
+    return sys.getsizeof(attrs) + sys.getsizeof(attrs.consumed)
+
+
+def in_place_size(attrib):
+    return 0
+
+
+def synthetic_elements():
+    root = ET.fromstring(XibGenerator(views=500, depth=6).generate())
+    return [e.attrib for e in root.iter()]
+
+
+def xib_elements(paths):
+    return [e.attrib for path in paths for e in ET.parse(path).iter()]
+
+
+def run_benchmarks():
+    args = arg_parser.parse_args()
+    if args.xibs:
+        elements = xib_elements(args.xibs)
+    else:
+        elements = synthetic_elements()
+    known = frozenset([key for attrib in elements for key in attrib])
+    print('{:<10} {:>10} {:>12} {:>16}'.format('method', 'elements', 'time, ms', 'bytes / element'))
+    for (name, consume, size) in [('copy', consume_copy, copy_size),
+                                  ('cursor', consume_cursor, cursor_size),
+                                  ('in place', consume_in_place, in_place_size)]:
+        assert all([consume(attrib, known) for attrib in elements])
+        timer = timeit.Timer(lambda: [consume(attrib, known) for attrib in elements])
+        best = min(timer.repeat(repeat=args.repeat, number=1))
+        allocated = sum([size(attrib) for attrib in elements]) / len(elements)
+        print('{:<10} {:>10} {:>12.2f} {:>16.0f}'.format(name, len(elements), best * 1000, allocated))
+
+
+if __name__ == '__main__':
+    run_benchmarks()
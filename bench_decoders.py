@@ -0,0 +1,102 @@
+import decoders
+import argparse
+import random
+import timeit
+import xml.etree.ElementTree as ET
+
+arg_parser = argparse.ArgumentParser(description='Microbenchmarks for decoders')
+arg_parser.add_argument('xibs', metavar='XIB', nargs='*',
+                        help='Take label texts and constraint attributes from these files instead of a synthetic corpus')
+arg_parser.add_argument('-n', '--repeat', metavar='N', type=int, default=5,
+                        help='Number of measurements, the best one is reported')
+
+words = ['Lorem', 'ipsum', 'dolor', 'sit', 'amet,', 'consectetur', '"adipiscing"', 'elit.', 'Sed\n', 'do\t',
+         'eiusmod', 'tempor', 'incididunt', 'ut', 'labore', 'et', 'dolore', 'magna', 'aliqua.', "don't", '\\']
+
+layout_attributes = ['leading', 'trailing', 'top', 'bottom', 'width', 'height', 'centerX', 'centerY',
+                     'baseline', 'firstBaseline', 'leadingMargin', 'trailingMargin']
+
+
+def reference_decode_string(s):
+    res = '@"'
+    for c in s:
+        esc = decoders.c_string_escapes.get(c)
+        res += (esc or c)
+    res += '"'
+    return res
+
+
+def reference_decode_enum_with_prefix(prefix, a):
+    return prefix + a[0].upper() + a[1:]
+
+
+def reference_decode_layout_attribute(a):
+    if a is None:
+        return 'NSLayoutAttributeNotAnAttribute'
+    return reference_decode_enum_with_prefix('NSLayoutAttribute', a)
+
+
+def reference_decode_layout_relation(a):
+    return reference_decode_enum_with_prefix('NSLayoutRelation', a)
+
+
+def synthetic_corpus():
+    rnd = random.Random(0)
+    texts = []
+    for _ in range(2000):
+        # Mostly short labels, with an occasional long attributed string fragment
+        n = rnd.choice([1, 2, 3, 5, 8, 400, 2000]) if rnd.random() < 0.05 else rnd.randint(1, 6)
+        texts.append(' '.join(rnd.choice(words) for _ in range(n)))
+    attributes = [rnd.choice(layout_attributes) for _ in range(20000)]
+    relations = [rnd.choice(['equal', 'equal', 'equal', 'greaterThanOrEqual', 'lessThanOrEqual'])
+                 for _ in range(10000)]
+    return texts, attributes, relations
+
+
+def xib_corpus(paths):
+    texts = []
+    attributes = []
+    relations = []
+    for path in paths:
+        for e in ET.parse(path).iter():
+            if e.tag == 'constraint':
+                attributes.append(e.get('firstAttribute'))
+                attributes.append(e.get('secondAttribute'))
+                relations.append(e.get('relation', 'equal'))
+            for key in ('text', 'content', 'title'):
+                if key in e.attrib:
+                    texts.append(e.attrib[key])
+            if e.tag == 'string' and e.text:
+                texts.append(e.text)
+    return texts, attributes, relations
+
+
+def measure(func, values, repeat):
+    timer = timeit.Timer(lambda: [func(v) for v in values])
+    return min(timer.repeat(repeat=repeat, number=1))
+
+
+def run_benchmarks():
+    args = arg_parser.parse_args()
+    if args.xibs:
+        (texts, attributes, relations) = xib_corpus(args.xibs)
+    else:
+        (texts, attributes, relations) = synthetic_corpus()
+    for (reference, fast) in [(reference_decode_string, decoders.decode_string),
+                              (reference_decode_layout_attribute, decoders.decode_layout_attribute),
+                              (reference_decode_layout_relation, decoders.decode_layout_relation)]:
+        assert all(reference(v) == fast(v) for v in texts + attributes + relations if v is not None)
+    print('{:<24} {:>8} {:>12} {:>12} {:>8}'.format('decoder', 'values', 'before, ms', 'after, ms', 'speedup'))
+    for (name, reference, fast, values) in [
+        ('decode_string', reference_decode_string, decoders.decode_string, texts),
+        ('decode_layout_attribute', reference_decode_layout_attribute, decoders.decode_layout_attribute, attributes),
+        ('decode_layout_relation', reference_decode_layout_relation, decoders.decode_layout_relation, relations),
+    ]:
+        before = measure(reference, values, args.repeat)
+        after = measure(fast, values, args.repeat)
+        print('{:<24} {:>8} {:>12.2f} {:>12.2f} {:>7.1f}x'.format(name, len(values), before * 1000, after * 1000,
+                                                                  before / after))
+
+
+if __name__ == '__main__':
+    run_benchmarks()
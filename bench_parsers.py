@@ -0,0 +1,55 @@
+import xib2code
+import parsers
+from xibgen import XibGenerator
+import argparse
+import io
+import timeit
+
+arg_parser = argparse.ArgumentParser(description='Compare XML parser backends')
+arg_parser.add_argument('xibs', metavar='XIB', nargs='*',
+                        help='Also measure these files, in addition to the synthetic ones')
+arg_parser.add_argument('-n', '--repeat', metavar='N', type=int, default=5,
+                        help='Number of measurements, the best one is reported')
+
+synthetic_sizes = [50, 500, 5000]
+
+
+def available_backends():
+    return [name for name in parsers.parser_backends if name != 'auto' and
+            (name != 'lxml' or parsers.lxml is not None)]
+
+
+def corpus(paths):
+    files = []
+    for views in synthetic_sizes:
+        files.append(('synthetic, {} views'.format(views), XibGenerator(views=views, depth=6).generate().encode('utf-8')))
+    for path in paths:
+        with open(path, 'rb') as f:
+            files.append((path, f.read()))
+    return files
+
+
+def measure(func, data, repeat):
+    timer = timeit.Timer(lambda: func(io.BytesIO(data)))
+    return min(timer.repeat(repeat=repeat, number=1))
+
+
+def run_benchmarks():
+    args = arg_parser.parse_args()
+    backends = available_backends()
+    print('{:<40} {:<8} {:>10} {:>12}'.format('file', 'backend', 'parse, ms', 'convert, ms'))
+    for (name, data) in corpus(args.xibs):
+        expected = None
+        for backend in backends:
+            options = xib2code.Options(parser=backend)
+            code = xib2code.convert_xib(io.BytesIO(data), options)
+            if expected is None:
+                expected = code
+            assert code == expected, backend + ' output differs for ' + name
+            parse = measure(lambda source: parsers.parse_document(source, backend), data, args.repeat)
+            convert = measure(lambda source: xib2code.convert_xib(source, options), data, args.repeat)
+            print('{:<40} {:<8} {:>10.2f} {:>12.2f}'.format(name[-40:], backend, parse * 1000, convert * 1000))
+
+
+if __name__ == '__main__':
+    run_benchmarks()
@@ -0,0 +1,192 @@
+import hashlib
+import json
+import os
+import time
+import uuid
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+DEFAULT_MAX_SIZE_MB = 512
+STATS_NAME = 'stats.json'
+LOCK_NAME = 'stats.lock'
+
+# Eviction goes below the limit, so that it does not run again after every stored entry
+eviction_target = 0.9
+# Temporary files older than this were left by killed writers
+stale_tmp_age = 3600
+
+stats_fields = ('hits', 'misses', 'evicted', 'entries', 'size')
+
+
+class OutputCache(object):
+    """Conversion results on disk, keyed by the XIB bytes, the converter and the options affecting output.
+
+    Several processes can use the same folder at once. Entries are written to temporary files and renamed into place,
+    so readers see either a complete entry or none, and missing or unreadable entries are misses. Hits refresh the
+    modification time of the entry, and eviction removes the least recently used entries first.
+
+    stats.json keeps hit and miss totals, and the number and size of entries, so that runs do not have to scan the
+    folder. Updates are serialized with a lock where fcntl is available. The size is approximate, and is recounted
+    by eviction.
+    """
+
+    def __init__(self, folder, max_size=DEFAULT_MAX_SIZE_MB << 20):
+        self.folder = folder
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, data: bytes, converter, options: dict) -> str:
+        h = hashlib.sha256()
+        h.update(json.dumps([converter, options], sort_keys=True).encode('utf-8'))
+        h.update(b'\0')
+        h.update(data)
+        return h.hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.folder, key[:2], key[2:] + '.json')
+
+    def load(self, key, required=()):
+        # Entries without all required fields, written by another version of the converter for example, are misses
+        path = self.entry_path(key)
+        try:
+            with open(path, 'rb') as f:
+                entry = json.loads(f.read().decode('utf-8'))
+        except (OSError, ValueError):
+            entry = None
+        if not isinstance(entry, dict) or not all([name in entry for name in required]):
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            # Evicted by another process in the meantime
+            pass
+        self.hits += 1
+        return entry
+
+    def store(self, key, entry):
+        # Failing to store only costs a miss next time, and does not fail the conversion
+        path = self.entry_path(key)
+        tmp_path = path + '.' + uuid.uuid4().hex + '.tmp'
+        data = json.dumps(entry, sort_keys=True).encode('utf-8')
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, 'xb') as f:
+                f.write(data)
+            try:
+                replaced = os.path.getsize(path)
+            except OSError:
+                replaced = None
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            return
+        if replaced is None:
+            self.update_stats(entries=1, size=len(data))
+        else:
+            self.update_stats(size=len(data) - replaced)
+
+    @contextmanager
+    def locked(self):
+        os.makedirs(self.folder, exist_ok=True)
+        fd = os.open(os.path.join(self.folder, LOCK_NAME), os.O_RDWR | os.O_CREAT)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            # Closing releases the lock
+            os.close(fd)
+
+    def read_stats(self) -> dict:
+        stats = dict.fromkeys(stats_fields, 0)
+        try:
+            with open(os.path.join(self.folder, STATS_NAME), 'r') as f:
+                data = json.load(f)
+            for name in stats_fields:
+                stats[name] = int(data.get(name, 0))
+        except (OSError, ValueError, AttributeError, TypeError):
+            pass
+        return stats
+
+    def write_stats(self, stats):
+        path = os.path.join(self.folder, STATS_NAME)
+        tmp_path = path + '.' + uuid.uuid4().hex + '.tmp'
+        try:
+            with open(tmp_path, 'x') as f:
+                json.dump(stats, f, sort_keys=True)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def update_stats(self, recount=None, **deltas):
+        # Adds deltas to the totals. recount replaces the number and size of entries after a scan of the folder.
+        try:
+            with self.locked():
+                stats = self.read_stats()
+                for (name, delta) in deltas.items():
+                    stats[name] += delta
+                if recount is not None:
+                    (stats['entries'], stats['size']) = recount
+                self.write_stats(stats)
+                return stats
+        except OSError:
+            return None
+
+    def entries(self):
+        # (mtime, size, path) of all entries, entries are in subfolders of the cache folder
+        result = []
+        now = time.time()
+        for (folder, _, names) in os.walk(self.folder):
+            if folder == self.folder:
+                continue
+            for name in names:
+                path = os.path.join(folder, name)
+                try:
+                    st = os.stat(path)
+                    if name.endswith('.tmp'):
+                        if now - st.st_mtime > stale_tmp_age:
+                            os.unlink(path)
+                    elif name.endswith('.json'):
+                        result.append((st.st_mtime_ns, st.st_size, path))
+                except OSError:
+                    pass
+        return result
+
+    def evict(self) -> int:
+        entries = self.entries()
+        size = sum([entry_size for (_, entry_size, _) in entries])
+        count = len(entries)
+        evicted = 0
+        if size > self.max_size:
+            for (_, entry_size, path) in sorted(entries):
+                if size <= self.max_size * eviction_target:
+                    break
+                try:
+                    os.unlink(path)
+                    evicted += 1
+                except FileNotFoundError:
+                    # Evicted by another process
+                    pass
+                size -= entry_size
+                count -= 1
+        self.update_stats(recount=(count, size), evicted=evicted)
+        return evicted
+
+    def finish_run(self, hits, misses) -> int:
+        # Records the counts of a run, and evicts entries if the recorded size is over the limit. The folder is only
+        # scanned then.
+        stats = self.update_stats(hits=hits, misses=misses)
+        if stats is None or stats['size'] <= self.max_size:
+            return 0
+        return self.evict()
+
+    def totals(self) -> dict:
+        return self.read_stats()
@@ -0,0 +1,131 @@
+import argparse
+import itertools
+import json
+import os.path
+import socket
+import subprocess
+import sys
+from passes import share_modes, constraint_modes
+from parsers import parser_backends
+from diagnostics import format_diagnostic
+
+arg_parser = argparse.ArgumentParser(description='Send a conversion request to a running server')
+arg_parser.add_argument('-u', '--socket', metavar='PATH',
+                        help='Server socket. If omitted, a server is started for the duration of the request')
+arg_parser.add_argument('-i', '--input', metavar='SRC', required=True,
+                        help='Input file')
+arg_parser.add_argument('-o', '--output', metavar='OUT',
+                        help='Output file. If omitted, generated code is printed')
+arg_parser.add_argument('-s', '--stream', action='store_true',
+                        help='Parse input incrementally')
+arg_parser.add_argument('--share-values', metavar='MODE', choices=share_modes,
+                        help='Create identical values only once, as locals or as dispatch_once statics')
+arg_parser.add_argument('--elide-defaults', action='store_true',
+                        help='Omit property assignments that match the UIKit default for the class')
+arg_parser.add_argument('--constraints', metavar='MODE', choices=constraint_modes, default='add',
+                        help='How constraints are installed: added per view, activated all at once, '
+                             'or activated all at once from a static table')
+arg_parser.add_argument('--lazy-subtrees', action='store_true',
+                        help='Build marked subviews only when their loader method is called')
+arg_parser.add_argument('--parser', metavar='BACKEND', choices=parser_backends, default='auto',
+                        help='XML parser used by the server: "lxml", "expat", "etree" or "auto"')
+arg_parser.add_argument('--prefetch-images', action='store_true',
+                        help='Add a prefetchImages class method, which loads and decodes the images in the background')
+arg_parser.add_argument('--max-statements', metavar='N', type=int,
+                        help='Split generated methods longer than N Objective-C statements into helper methods')
+arg_parser.add_argument('--check', action='store_true',
+                        help='Do not write anything, print a diff and fail if the output is out of date')
+
+server_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server.py')
+
+
+class Client(object):
+    def __init__(self, rfile, wfile, closer=None):
+        self.rfile = rfile
+        self.wfile = wfile
+        self.closer = closer
+        self.ids = itertools.count(1)
+
+    @classmethod
+    def connect(cls, socket_path):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(socket_path)
+        return cls(sock.makefile('rb'), sock.makefile('wb'), sock.close)
+
+    @classmethod
+    def spawn(cls, *server_args):
+        process = subprocess.Popen([sys.executable, server_script] + list(server_args),
+                                   stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+        def close():
+            process.stdin.close()
+            process.wait()
+
+        return cls(process.stdout, process.stdin, close)
+
+    def request(self, **fields):
+        request_id = next(self.ids)
+        fields['id'] = request_id
+        self.wfile.write(json.dumps(fields).encode('utf-8') + b'\n')
+        self.wfile.flush()
+        for line in self.rfile:
+            response = json.loads(line)
+            if response.get('id') == request_id:
+                return response
+        raise EOFError('Server closed the connection')
+
+    def convert(self, input_path=None, xml=None, output_path=None, options=None, check=False):
+        fields = {'options': options or {}}
+        if xml is not None:
+            fields['xml'] = xml
+        else:
+            fields['input'] = input_path
+        if output_path is not None:
+            fields['output'] = output_path
+            fields['check'] = check
+        return self.request(**fields)
+
+    def close(self):
+        if self.closer is not None:
+            self.closer()
+            self.closer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def run_client():
+    args = arg_parser.parse_args()
+    if args.socket is None:
+        client = Client.spawn()
+    else:
+        client = Client.connect(args.socket)
+    with client:
+        response = client.convert(input_path=os.path.abspath(args.input),
+                                  output_path=args.output and os.path.abspath(args.output),
+                                  options={'streaming': args.stream, 'share_values': args.share_values,
+                                           'elide_defaults': args.elide_defaults,
+                                           'constraints': args.constraints,
+                                           'lazy_subtrees': args.lazy_subtrees,
+                                           'max_statements': args.max_statements,
+                                           'prefetch_images': args.prefetch_images,
+                                           'parser': args.parser}, check=args.check)
+    if response['status'] != 'ok':
+        for d in response['diagnostics']:
+            if d.get('file') is None:
+                d['file'] = args.input
+            print(format_diagnostic(d), file=sys.stderr)
+        return 1
+    if 'code' in response:
+        sys.stdout.write(response['code'])
+    if response.get('diff'):
+        sys.stdout.write(response['diff'])
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(run_client())
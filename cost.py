@@ -0,0 +1,125 @@
+import csv
+import json
+from ir import *
+
+cost_metrics = ('allocations', 'property_sends', 'constraints', 'attributed_strings', 'paragraph_styles',
+                'image_loads', 'depth')
+
+# Relative cost of a single counted operation, used to rank files. Depth is not additive and does not add to the score.
+cost_weights = {
+    'allocations': 10,
+    'property_sends': 1,
+    'constraints': 5,
+    'attributed_strings': 8,
+    'paragraph_styles': 4,
+    'image_loads': 20,
+}
+
+
+class CostModel(object):
+    """Counts the work done by generated code, after all passes have been applied."""
+
+    def __init__(self):
+        self.counts = dict.fromkeys(cost_metrics, 0)
+        # Statements of lazy subtrees only run when their loader is called
+        self.deferred = dict.fromkeys(cost_metrics, 0)
+        self.current = self.counts
+        self.parents = {}
+
+    def count(self, metric, n=1):
+        self.current[metric] += n
+
+    def visit_expr(self, e):
+        cls = e.__class__
+        if cls is ImageExpr:
+            self.count('image_loads')
+        elif cls is ColorExpr or cls is FontExpr:
+            self.count('allocations')
+        elif cls is AttributedFragmentExpr:
+            self.count('attributed_strings')
+        if cls is not str:
+            e.map_children(self.visit_expr)
+        return e
+
+    def visit_body(self, body):
+        for stmt in body:
+            self.visit_stmt(stmt)
+
+    def visit_stmt(self, stmt):
+        cls = stmt.__class__
+        if cls is Alloc:
+            self.count('allocations')
+        elif cls is SetProperty or cls is SetStateProperty or cls is SetValueForKeyPath or cls is SetOutlet:
+            self.count('property_sends')
+        elif cls is DefineConstraint:
+            self.count('constraints')
+        elif cls is ConstraintTable:
+            self.count('constraints', len(stmt.constraints))
+        elif cls is DefineAttributedString:
+            self.count('attributed_strings')
+        elif cls is DefineParagraphStyle:
+            self.count('paragraph_styles')
+        elif cls is DefineAttributes:
+            self.count('allocations')
+        elif cls is AddSubview:
+            self.parents[stmt.child] = stmt.parent
+        elif cls is DispatchOnce:
+            self.visit_body(stmt.body)
+        elif cls is LazySubtree:
+            saved = self.current
+            self.current = self.deferred
+            self.visit_body(stmt.body)
+            self.current = saved
+        # The identity function leaves the statement as is
+        stmt.map_exprs(self.visit_expr)
+
+    def depth(self, view):
+        n = 0
+        while view in self.parents:
+            view = self.parents[view]
+            n += 1
+        return n
+
+    def run(self, document: Document) -> dict:
+        for method in document.methods:
+            self.visit_body(method.body)
+        self.counts['depth'] = max([self.depth(view) for view in self.parents], default=0)
+        return {
+            'score': sum([cost_weights[m] * self.counts[m] for m in cost_weights]),
+            'counts': self.counts,
+            'deferred': {m: n for (m, n) in self.deferred.items() if m != 'depth'},
+        }
+
+
+def estimate_cost(document: Document) -> dict:
+    return CostModel().run(document)
+
+
+def limit_violations(report, limits):
+    # limits maps metric names or 'score' to the largest allowed value
+    violations = []
+    for (metric, limit) in sorted(limits.items()):
+        value = report['score'] if metric == 'score' else report['counts'][metric]
+        if value > limit:
+            violations.append((metric, value, limit))
+    return violations
+
+
+def rank_reports(file_reports):
+    ranked = sorted(file_reports, key=lambda r: (-r['score'], r['path']))
+    for (i, report) in enumerate(ranked):
+        report['rank'] = i + 1
+    return ranked
+
+
+def write_json_report(f, ranked, limits):
+    json.dump({'limits': limits, 'files': ranked}, f, indent=2, sort_keys=True)
+
+
+def write_csv_report(f, ranked, limits):
+    writer = csv.writer(f)
+    writer.writerow(['rank', 'path', 'score'] + list(cost_metrics) + ['violations'])
+    for report in ranked:
+        violations = ' '.join([metric for (metric, _, _) in limit_violations(report, limits)])
+        writer.writerow([report['rank'], report['path'], report['score']] +
+                        [report['counts'][m] for m in cost_metrics] + [violations])
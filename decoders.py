@@ -1,4 +1,6 @@
 from errors import *
+from ir import ImageExpr
+from functools import lru_cache
 
 c_string_escapes = {
     '\"': '\\\"',
@@ -13,6 +15,12 @@ c_string_escapes = {
     '\v': '\\v'
 }
 
+# Backslash goes first, so that escapes produced by other replacements are not escaped again
+c_string_escape_sequence = sorted(c_string_escapes.items(), key=lambda item: item[0] != '\\')
+
+# Enum values and image names take a few hundred distinct values across a typical corpus
+decoder_cache_size = 1024
+
 line_break_mode_mapping = {
     'wordWrap': 'NSLineBreakByWordWrapping',
     'characterWrap': 'NSLineBreakByCharWrapping',
@@ -44,76 +52,90 @@ def decode_bool(b: str, as_object=False) -> str:
 
 
 def decode_string(s: str) -> str:
-    res = '@"'
-    for c in s:
-        esc = c_string_escapes.get(c)
-        res += (esc or c)
-    res += '"'
-    return res
+    for (c, esc) in c_string_escape_sequence:
+        if c in s:
+            s = s.replace(c, esc)
+    return '@"' + s + '"'
 
 
+@lru_cache(maxsize=decoder_cache_size)
 def decode_layout_attribute(a: str) -> str:
     if a is None:
         return 'NSLayoutAttributeNotAnAttribute'
     return decode_enum_with_prefix('NSLayoutAttribute', a)
 
 
+@lru_cache(maxsize=decoder_cache_size)
 def decode_layout_relation(a: str) -> str:
     return decode_enum_with_prefix('NSLayoutRelation', a)
 
 
+@lru_cache(maxsize=decoder_cache_size)
 def decode_content_mode(a: str) -> str:
     return decode_enum_with_prefix('UIViewContentMode', a)
 
 
+@lru_cache(maxsize=decoder_cache_size)
 def decode_text_alignment(a: str) -> str:
     return decode_enum_with_prefix('NSTextAlignment', a)
 
 
+@lru_cache(maxsize=decoder_cache_size)
 def decode_line_break_mode(a: str) -> str:
     return decode_enum_with_mapping(line_break_mode_mapping, a)
 
 
+@lru_cache(maxsize=decoder_cache_size)
 def decode_baseline_adjustment(a: str) -> str:
     return decode_enum_with_prefix('UIBaselineAdjustment', a)
 
 
+@lru_cache(maxsize=decoder_cache_size)
 def decode_content_horizontal_alignment(a: str) -> str:
     return decode_enum_with_prefix('UIControlContentHorizontalAlignment', a)
 
 
+@lru_cache(maxsize=decoder_cache_size)
 def decode_content_vertical_alignment(a: str) -> str:
     return decode_enum_with_prefix('UIControlContentVerticalAlignment', a)
 
 
+@lru_cache(maxsize=decoder_cache_size)
 def decode_control_state(a: str) -> str:
     return decode_enum_with_prefix('UIControlState', a)
 
 
+@lru_cache(maxsize=decoder_cache_size)
 def decode_control_event(a: str) -> str:
     return decode_enum_with_prefix('UIControlEvent', a)
 
 
+@lru_cache(maxsize=decoder_cache_size)
 def decode_font_weight(a: str) -> str:
     return decode_enum_with_prefix('UIFontWeight', a)
 
 
+@lru_cache(maxsize=decoder_cache_size)
 def decode_map_type(a: str) -> str:
     return decode_enum_with_prefix('MKMapType', a)
 
 
+@lru_cache(maxsize=decoder_cache_size)
 def decode_button_type(a: str) -> str:
     return decode_enum_with_prefix('UIButtonType', a)
 
 
-def decode_image_with_name(a: str) -> str:
-    return '[UIImage imageNamed:' + decode_string(a) + ']'
+@lru_cache(maxsize=decoder_cache_size)
+def decode_image_with_name(a: str) -> ImageExpr:
+    return ImageExpr(a)
 
 
+@lru_cache(maxsize=decoder_cache_size)
 def decode_string_attribute_name(a: str) -> str:
     return decode_enum_with_mapping(string_attribute_mapping, a)
 
 
+@lru_cache(maxsize=decoder_cache_size)
 def decode_writing_direction(a: str) -> str:
     return decode_enum_with_prefix('NSWritingDirection', a)
 
@@ -125,5 +147,6 @@ def decode_enum_with_mapping(mapping, a):
     return val
 
 
+@lru_cache(maxsize=decoder_cache_size)
 def decode_enum_with_prefix(prefix, a):
     return prefix + a[0].upper() + a[1:]
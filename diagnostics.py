@@ -0,0 +1,64 @@
+import json
+from xml.etree.ElementTree import ParseError
+from xml.parsers.expat import ExpatError
+
+
+def element_path(elements) -> str:
+    # elements go from the root down. Siblings with the same tag are told apart by a 1-based index.
+    segments = []
+    parent = None
+    for e in elements:
+        segment = e.tag
+        if parent is not None:
+            same = [c for c in parent if c.tag == e.tag]
+            if len(same) > 1:
+                index = next(i for (i, c) in enumerate(same) if c is e)
+                segment += '[{}]'.format(index + 1)
+        segments.append(segment)
+        parent = e
+    return '/' + '/'.join(segments)
+
+
+def error_position(error, element):
+    # (line, column), both 1-based, or None where unknown
+    if isinstance(error, ParseError):
+        (line, column) = error.position
+        return (line, column + 1)
+    if isinstance(error, ExpatError):
+        return (error.lineno, error.offset + 1)
+    if element is not None:
+        return (getattr(element, 'sourceline', None), getattr(element, 'sourcecolumn', None))
+    return (None, None)
+
+
+def describe(error, xib_file=None) -> dict:
+    elements = list(reversed(error.__dict__.get('elements', [])))
+    element = elements[-1] if elements else None
+    (line, column) = error_position(error, element)
+    tag = getattr(error, 'tag', None)
+    if tag is None and element is not None:
+        tag = element.tag
+    return {
+        'file': xib_file if isinstance(xib_file, str) else None,
+        'line': line,
+        'column': column,
+        'element_path': element_path(elements) if elements else None,
+        'tag': tag,
+        'attribute': getattr(error, 'attribute', None),
+        'type': type(error).__name__,
+        'message': str(error),
+    }
+
+
+def format_diagnostic(d) -> str:
+    # Diagnostics of errors outside of conversion only have the type and the message
+    location = ':'.join([str(d[key]) for key in ('file', 'line', 'column') if d.get(key) is not None])
+    text = '{}: {}'.format(d['type'], d['message']) if d['message'] else d['type']
+    if d.get('element_path') is not None:
+        text += ' (at {})'.format(d['element_path'])
+    return location + ': ' + text if location else text
+
+
+def write_diagnostics(f, files, diagnostics):
+    failed = len(set([d['file'] for d in diagnostics]))
+    json.dump({'files': files, 'failed': failed, 'diagnostics': diagnostics}, f, indent=2, sort_keys=True)
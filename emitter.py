@@ -0,0 +1,403 @@
+from decoders import decode_enum_with_prefix, decode_string
+from ir import *
+
+indent_unit = '    '
+
+constraint_table_fields = [
+    'NSInteger firstItem',
+    'NSLayoutAttribute firstAttribute',
+    'NSLayoutRelation relation',
+    'NSInteger secondItem',
+    'NSLayoutAttribute secondAttribute',
+    'CGFloat multiplier',
+    'CGFloat constant',
+    'UILayoutPriority priority',
+]
+
+constraint_table_loop = [
+    'NSInteger secondItem = constraintTable[i].secondItem;',
+    'constraints[i] = [NSLayoutConstraint constraintWithItem:constraintItems[constraintTable[i].firstItem]',
+    '                                              attribute:constraintTable[i].firstAttribute',
+    '                                              relatedBy:constraintTable[i].relation',
+    '                                                 toItem:secondItem < 0 ? nil : constraintItems[secondItem]',
+    '                                              attribute:constraintTable[i].secondAttribute',
+    '                                             multiplier:constraintTable[i].multiplier',
+    '                                               constant:constraintTable[i].constant];',
+    'constraints[i].priority = constraintTable[i].priority;',
+]
+
+
+class Emitter(object):
+    def __init__(self):
+        self.out = []
+        self.indent = indent_unit
+        self.in_block = False
+        self.weak_self_declared = False
+        self.statement_emitters = {
+            Alloc: self.emit_alloc,
+            DefineValue: self.emit_define_value,
+            SetProperty: self.emit_set_property,
+            SetStateProperty: self.emit_set_state_property,
+            SetValueForKeyPath: self.emit_set_value_for_key_path,
+            AddSubview: self.emit_add_subview,
+            DefineConstraint: self.emit_define_constraint,
+            AddConstraints: self.emit_add_constraints,
+            ActivateConstraints: self.emit_activate_constraints,
+            ConstraintTable: self.emit_constraint_table,
+            DefineParagraphStyle: self.emit_define_paragraph_style,
+            DefineAttributes: self.emit_define_attributes,
+            DefineAttributedString: self.emit_define_attributed_string,
+            AppendAttributedString: self.emit_append_attributed_string,
+            SetOutlet: self.emit_set_outlet,
+            AddTarget: self.emit_add_target,
+            DispatchOnce: self.emit_dispatch_once,
+            LazySubtree: self.emit_lazy_subtree,
+            RunLazyBuilder: self.emit_run_lazy_builder,
+            CallHelper: self.emit_call_helper,
+            PrefetchImages: self.emit_prefetch_images,
+        }
+        self.expr_renderers = {
+            VarRef: self.render_var_ref,
+            ArrayExpr: self.render_array,
+            ColorExpr: self.render_color,
+            FontExpr: self.render_font,
+            ImageExpr: self.render_image,
+            AllocInit: self.render_alloc_init,
+            ClassMessage: self.render_class_message,
+            AttributedFragmentExpr: self.render_attributed_fragment,
+            SharedValueExpr: self.render_shared_value,
+        }
+
+    def emit(self, document: Document) -> str:
+        for method in document.methods:
+            self.emit_method(method)
+        return ''.join(self.out)
+
+    def emit_method(self, method: Method):
+        self.begin_method(method)
+        self.emit_body(method.body)
+        self.end_method(method)
+
+    def begin_method(self, method: Method):
+        self.weak_self_declared = False
+        if len(method.results) == 1:
+            return_type = method.results[0][1] + ' *'
+        else:
+            return_type = 'void'
+        signature = self.message(method, lambda var, type_name: '(' + type_name + ' *)' + var,
+                                 lambda var, type_name: '(' + type_name + ' **)' + var + 'Out')
+        self.out.append(('+ (' if method.class_method else '- (') + return_type + ') ' + signature + ' {\n')
+
+    def end_method(self, method: Method):
+        if len(method.results) == 1:
+            self.line('return ' + method.results[0][0] + ';')
+        else:
+            for (var, _) in method.results:
+                self.line('*' + var + 'Out = ' + var + ';')
+        self.out.append('}\n')
+
+    def message(self, method: Method, argument, out_argument) -> str:
+        arguments = [(var, argument(var, type_name)) for (var, type_name) in method.params]
+        if len(method.results) > 1:
+            arguments += [(var, out_argument(var, type_name)) for (var, type_name) in method.results]
+        if not arguments:
+            return method.selector
+        parts = []
+        for (var, text) in arguments:
+            if parts:
+                parts.append(var + ':' + text)
+            else:
+                parts.append(method.selector + 'With' + var[0].upper() + var[1:] + ':' + text)
+        return ' '.join(parts)
+
+    def emit_body(self, body):
+        emitters = self.statement_emitters
+        for stmt in body:
+            emitters[stmt.__class__](stmt)
+
+    def emit_nested_body(self, body):
+        outer_indent = self.indent
+        self.indent = outer_indent + indent_unit
+        self.emit_body(body)
+        self.indent = outer_indent
+
+    def expr(self, e) -> str:
+        if e.__class__ is str:
+            return e
+        return self.expr_renderers[e.__class__](e)
+
+    def line(self, text):
+        self.out.append(self.indent + text + '\n')
+
+    def emit_alloc(self, s: Alloc):
+        self.line(s.class_name + ' *' + s.var + ' = ' + self.expr(s.constructor) + ';')
+
+    def declaration(self, type_name, var, declared):
+        if declared:
+            return type_name + ' *' + var
+        return var
+
+    def emit_define_value(self, s: DefineValue):
+        self.line(self.declaration(s.type_name, s.var, s.declared) + ' = ' + self.expr(s.value) + ';')
+
+    def emit_set_property(self, s: SetProperty):
+        if s.setter is None:
+            self.line(s.var + '.' + s.key + ' = ' + self.expr(s.value) + ';')
+        else:
+            self.line(s.setter.format(var=s.var, value=self.expr(s.value)))
+
+    def emit_set_state_property(self, s: SetStateProperty):
+        setter = decode_enum_with_prefix(' set', s.key)
+        self.line('[' + s.var + setter + ':' + self.expr(s.value) + ' forState:' + s.state + '];')
+
+    def emit_set_value_for_key_path(self, s: SetValueForKeyPath):
+        self.line('[' + s.var + ' setValue:' + self.expr(s.value) + ' forKeyPath:' + s.key_path + '];')
+
+    def emit_add_subview(self, s: AddSubview):
+        self.line('[' + s.parent + ' addSubview:' + s.child + '];')
+
+    def emit_define_constraint(self, s: DefineConstraint):
+        second = 'nil' if s.second is None else s.second
+        # Continuation lines align the selector parts on the colon
+        indent = self.indent + ' ' * (51 + len(s.var))
+        self.out.append(
+            self.indent + 'NSLayoutConstraint *' + s.var + ' = [NSLayoutConstraint constraintWithItem:' + s.first +
+            '\n' + indent + ' attribute:' + s.first_attribute +
+            '\n' + indent + ' relatedBy:' + s.relation +
+            '\n' + indent + '    toItem:' + second +
+            '\n' + indent + ' attribute:' + s.second_attribute +
+            '\n' + indent + 'multiplier:' + s.multiplier +
+            '\n' + indent + '  constant:' + s.constant + '];\n')
+        if s.priority is not None:
+            self.line(s.var + '.priority = ' + s.priority + ';')
+
+    def emit_add_constraints(self, s: AddConstraints):
+        self.line('[' + s.var + ' addConstraints:@[' + ', '.join(s.constraints) + ']];')
+
+    def emit_activate_constraints(self, s: ActivateConstraints):
+        self.line('[NSLayoutConstraint activateConstraints:@[' + ', '.join(s.constraints) + ']];')
+
+    def emit_constraint_table(self, s: ConstraintTable):
+        item_indices = {item: str(i) for (i, item) in enumerate(s.items)}
+        count = str(len(s.constraints))
+        self.line('static const struct {')
+        for field in constraint_table_fields:
+            self.line(indent_unit + field + ';')
+        self.line('} constraintTable[] = {')
+        for c in s.constraints:
+            second = '-1' if c.second is None else item_indices[c.second]
+            # UILayoutPriorityRequired is not a constant expression, so it cannot initialize a static
+            priority = '1000' if c.priority is None else c.priority
+            self.line(indent_unit + '{' + ', '.join([item_indices[c.first], c.first_attribute, c.relation, second,
+                                                     c.second_attribute, c.multiplier, c.constant, priority]) + '},')
+        self.line('};')
+        self.line('UIView *constraintItems[] = {' + ', '.join(s.items) + '};')
+        self.line('NSLayoutConstraint *constraints[' + count + '];')
+        self.line('for (NSUInteger i = 0; i < ' + count + '; i++) {')
+        for text in constraint_table_loop:
+            self.line(indent_unit + text)
+        self.line('}')
+        self.line('[NSLayoutConstraint activateConstraints:[NSArray arrayWithObjects:constraints count:' + count + ']];')
+        constraint_indices = {c.var: str(i) for (i, c) in enumerate(s.constraints)}
+        for var in s.aliases:
+            self.line('NSLayoutConstraint *' + var + ' = constraints[' + constraint_indices[var] + '];')
+
+    def emit_define_paragraph_style(self, s: DefineParagraphStyle):
+        self.line(self.declaration('NSMutableParagraphStyle', s.var, s.declared) +
+                  ' = [[NSParagraphStyle defaultParagraphStyle] mutableCopy];')
+        self.line(s.var + '.alignment = ' + s.alignment + ';')
+        self.line(s.var + '.lineBreakMode = ' + s.line_break_mode + ';')
+        self.line(s.var + '.baseWritingDirection = ' + s.base_writing_direction + ';')
+
+    def emit_define_attributes(self, s: DefineAttributes):
+        self.line(self.declaration('NSDictionary', s.var, s.declared) + ' = @{')
+        k = len(s.items)
+        for (name, value) in s.items:
+            self.line(indent_unit + name + ' : ' + self.expr(value) + (',' if k > 1 else ''))
+            k -= 1
+        self.line('};')
+
+    def emit_define_attributed_string(self, s: DefineAttributedString):
+        self.line('NSMutableAttributedString *' + s.var + ' = [[NSMutableAttributedString alloc] init];')
+
+    def emit_append_attributed_string(self, s: AppendAttributedString):
+        self.line('[' + s.var + ' appendAttributedString:' + self.expr(s.fragment) + '];')
+
+    def emit_set_outlet(self, s: SetOutlet):
+        if s.property_name[0] == '_':
+            # Inside blocks self is a local, and ivars have to be accessed through it explicitly
+            if s.host != 'self' or self.in_block:
+                target = s.host + '->' + s.property_name
+            else:
+                target = s.property_name
+        else:
+            target = s.host + '.' + s.property_name
+        self.line(target + ' = ' + self.expr(s.value) + ';')
+
+    def emit_add_target(self, s: AddTarget):
+        self.line('[' + s.host + ' addTarget: ' + s.target + ' action:@selector(' + s.selector + ')' +
+                  ' forControlEvents:' + s.event_type + '];')
+
+    def emit_dispatch_once(self, s: DispatchOnce):
+        for (type_name, var) in s.statics:
+            self.line('static ' + type_name + ' *' + var + ';')
+        self.line('static dispatch_once_t ' + s.token + ';')
+        self.line('dispatch_once(&' + s.token + ', ^{')
+        self.emit_nested_body(s.body)
+        self.line('});')
+
+    def emit_lazy_subtree(self, s: LazySubtree):
+        if not self.weak_self_declared:
+            self.line('__weak typeof(self) weakSelf = self;')
+            self.weak_self_declared = True
+        self.line('objc_setAssociatedObject(self, @selector(' + s.loader_selector() + '), ^{')
+        # Shadowing self keeps the block from retaining the owner, while the body still refers to self
+        self.line(indent_unit + '__strong typeof(weakSelf) self = weakSelf;')
+        self.line(indent_unit + 'if (self == nil) {')
+        self.line(indent_unit * 2 + 'return;')
+        self.line(indent_unit + '}')
+        outer_in_block = self.in_block
+        self.in_block = True
+        self.emit_nested_body(s.body)
+        self.in_block = outer_in_block
+        self.line('}, OBJC_ASSOCIATION_COPY_NONATOMIC);')
+
+    def emit_call_helper(self, s: CallHelper):
+        call = '[self ' + self.message(s.method, lambda var, type_name: var, lambda var, type_name: '&' + var) + ']'
+        results = s.method.results
+        if not results:
+            self.line(call + ';')
+        elif len(results) == 1:
+            (var, type_name) = results[0]
+            self.line(type_name + ' *' + var + ' = ' + call + ';')
+        else:
+            for (var, type_name) in results:
+                self.line(type_name + ' *' + var + ';')
+            self.line(call + ';')
+
+    def emit_run_lazy_builder(self, s: RunLazyBuilder):
+        key = '@selector(' + s.selector + ')'
+        self.line('void (^build)(void) = objc_getAssociatedObject(self, ' + key + ');')
+        self.line('if (build != nil) {')
+        self.line(indent_unit + 'objc_setAssociatedObject(self, ' + key + ', nil, OBJC_ASSOCIATION_COPY_NONATOMIC);')
+        self.line(indent_unit + 'build();')
+        self.line('}')
+
+    def emit_prefetch_images(self, s: PrefetchImages):
+        if not s.names:
+            return
+        self.line('NSArray *names = @[' + ', '.join([decode_string(name) for name in s.names]) + '];')
+        self.line('dispatch_async(dispatch_get_global_queue(QOS_CLASS_UTILITY, 0), ^{')
+        self.line(indent_unit + 'for (NSString *name in names) {')
+        self.line(indent_unit * 2 + 'UIImage *image = [UIImage imageNamed:name];')
+        # Images are decoded when first drawn, which would otherwise happen on the main thread
+        self.line(indent_unit * 2 + 'UIGraphicsBeginImageContext(CGSizeMake(1, 1));')
+        self.line(indent_unit * 2 + '[image drawAtPoint:CGPointZero];')
+        self.line(indent_unit * 2 + 'UIGraphicsEndImageContext();')
+        self.line(indent_unit + '}')
+        self.line('});')
+
+    def render_var_ref(self, e: VarRef) -> str:
+        return e.name
+
+    def render_array(self, e: ArrayExpr) -> str:
+        return '@[' + ', '.join([self.expr(item) for item in e.items]) + ']'
+
+    def render_color(self, e: ColorExpr) -> str:
+        if e.kind == 'system':
+            return '[UIColor ' + e.args[0] + ']'
+        if e.kind == 'white':
+            (white, alpha) = e.args
+            return '[UIColor colorWithWhite:' + white + ' alpha:' + alpha + ']'
+        (red, green, blue, alpha) = e.args
+        return '[UIColor colorWithRed:' + red + ' green:' + green + ' blue:' + blue + ' alpha:' + alpha + ']'
+
+    def render_font(self, e: FontExpr) -> str:
+        if e.kind == 'named':
+            (name, size) = e.args
+            return '[UIFont fontWithName: ' + decode_string(name) + ' size:' + size + ']'
+        if e.kind == 'system':
+            return '[UIFont systemFontOfSize:' + e.args[0] + ']'
+        (size, weight) = e.args
+        return '[UIFont systemFontOfSize:' + size + ' weight:' + weight + ']'
+
+    def render_image(self, e: ImageExpr) -> str:
+        return '[UIImage imageNamed:' + decode_string(e.name) + ']'
+
+    def render_alloc_init(self, e: AllocInit) -> str:
+        if e.selector is None:
+            return '[[' + e.class_name + ' alloc] init]'
+        return '[[' + e.class_name + ' alloc] ' + e.selector + ':' + self.expr(e.arg) + ']'
+
+    def render_class_message(self, e: ClassMessage) -> str:
+        return '[' + e.class_name + ' ' + e.selector + ':' + self.expr(e.arg) + ']'
+
+    def render_attributed_fragment(self, e: AttributedFragmentExpr) -> str:
+        return ('[[NSAttributedString alloc] initWithString:' + self.expr(e.content) +
+                ' attributes:' + self.expr(e.attributes) + ']')
+
+    def render_shared_value(self, e: SharedValueExpr) -> str:
+        return '[' + e.class_name + ' ' + e.accessor + ']'
+
+
+def emit_document(document: Document) -> str:
+    return Emitter().emit(document)
+
+
+class StreamedBody(object):
+    """Stands for the body of a method, writing statements to a file as they are added instead of keeping them."""
+
+    def __init__(self, method: Method, f):
+        self.method = method
+        self.f = f
+        self.emitter = Emitter()
+        self.count = 0
+        self.emitter.begin_method(method)
+        self.flush()
+
+    def flush(self):
+        self.f.write(''.join(self.emitter.out))
+        self.emitter.out.clear()
+
+    def append(self, stmt: Stmt):
+        self.emitter.emit_body((stmt,))
+        self.count += 1
+        self.flush()
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self.emitter.end_method(self.method)
+        self.flush()
+
+
+def shared_value_declarations(values) -> dict:
+    # accessor -> [type name, code creating the value], for the values collected by passes.collect_shared_values().
+    # Unlike the expressions, declarations can be stored as JSON.
+    emitter = Emitter()
+    return {accessor: [e.type_name, emitter.expr(e.value)] for (accessor, e) in values.items()}
+
+
+def emit_shared_header(class_name, declarations) -> str:
+    out = ['#import <UIKit/UIKit.h>\n', '\n', '@interface ' + class_name + ' : NSObject\n']
+    for accessor in sorted(declarations):
+        out.append('+ (' + declarations[accessor][0] + ' *) ' + accessor + ';\n')
+    out.append('@end\n')
+    return ''.join(out)
+
+
+def emit_shared_implementation(class_name, declarations) -> str:
+    out = ['#import "' + class_name + '.h"\n', '\n', '@implementation ' + class_name + '\n']
+    for accessor in sorted(declarations):
+        (type_name, value) = declarations[accessor]
+        out.append('+ (' + type_name + ' *) ' + accessor + ' {\n')
+        out.append(indent_unit + 'static ' + type_name + ' *value;\n')
+        out.append(indent_unit + 'static dispatch_once_t onceToken;\n')
+        out.append(indent_unit + 'dispatch_once(&onceToken, ^{\n')
+        out.append(indent_unit * 2 + 'value = ' + value + ';\n')
+        out.append(indent_unit + '});\n')
+        out.append(indent_unit + 'return value;\n')
+        out.append('}\n')
+    out.append('@end\n')
+    return ''.join(out)
@@ -1,5 +1,7 @@
 class XIBError(Exception):
-    pass
+    # The offending attribute or child tag, when known where the error is raised
+    attribute = None
+    tag = None
 
 
 class BadXibFormat(XIBError):
@@ -7,7 +9,9 @@ class BadXibFormat(XIBError):
 
 
 class UnknownAttribute(XIBError):
-    pass
+    def __init__(self, attribute=None):
+        XIBError.__init__(self, *([attribute] if attribute is not None else []))
+        self.attribute = attribute
 
 
 class UnknownAttributeValue(XIBError):
@@ -15,8 +19,25 @@ class UnknownAttributeValue(XIBError):
 
 
 class UnknownTag(XIBError):
-    pass
+    def __init__(self, element=None):
+        if element is None:
+            XIBError.__init__(self)
+        else:
+            XIBError.__init__(self, element.tag)
+            self.tag = element.tag
+            add_location(self, element)
 
 
 class MultipleRootObjects(XIBError):
     pass
+
+
+class BadLazySubtree(XIBError):
+    pass
+
+
+def add_location(error, element):
+    # Errors collect the elements they propagate through, innermost first
+    elements = error.__dict__.setdefault('elements', [])
+    if not elements or elements[-1] is not element:
+        elements.append(element)
@@ -0,0 +1,517 @@
+# Intermediate representation of generated code.
+#
+# Expressions are either plain strings, holding literal source text, or instances of the Expr subclasses below.
+# Statements reference local variables by name, and report them through defs() and uses().
+# Passes rewrite expressions through Stmt.map_exprs() and transform_expr().
+
+
+def expr_vars(e):
+    if e.__class__ is str:
+        return ()
+    return e.vars()
+
+
+def transform_expr(e, fn):
+    # Applies fn bottom-up to e and all its subexpressions
+    if e.__class__ is not str:
+        e = e.map_children(lambda child: transform_expr(child, fn))
+    return fn(e)
+
+
+class Expr(object):
+    __slots__ = ()
+
+    def vars(self):
+        return ()
+
+    def map_children(self, fn):
+        return self
+
+
+class VarRef(Expr):
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    def vars(self):
+        return (self.name,)
+
+
+class ArrayExpr(Expr):
+    __slots__ = ('items',)
+
+    def __init__(self, items):
+        self.items = items
+
+    def vars(self):
+        return [name for item in self.items for name in expr_vars(item)]
+
+    def map_children(self, fn):
+        return ArrayExpr([fn(item) for item in self.items])
+
+
+class ColorExpr(Expr):
+    __slots__ = ('kind', 'args')
+
+    # kind is one of 'system', 'white' or 'rgb'
+    def __init__(self, kind, args):
+        self.kind = kind
+        self.args = args
+
+
+class FontExpr(Expr):
+    __slots__ = ('kind', 'args')
+
+    # kind is one of 'named', 'system' or 'systemWeight'
+    def __init__(self, kind, args):
+        self.kind = kind
+        self.args = args
+
+
+class ImageExpr(Expr):
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+
+class SharedValueExpr(Expr):
+    __slots__ = ('class_name', 'accessor', 'type_name', 'value')
+
+    # Calls a cached class accessor of the shared resource module, which returns value
+    def __init__(self, class_name, accessor, type_name, value):
+        self.class_name = class_name
+        self.accessor = accessor
+        self.type_name = type_name
+        self.value = value
+
+
+class AllocInit(Expr):
+    __slots__ = ('class_name', 'selector', 'arg')
+
+    def __init__(self, class_name, selector=None, arg=None):
+        self.class_name = class_name
+        self.selector = selector
+        self.arg = arg
+
+    def vars(self):
+        if self.arg is None:
+            return ()
+        return expr_vars(self.arg)
+
+    def map_children(self, fn):
+        if self.arg is None:
+            return self
+        return AllocInit(self.class_name, self.selector, fn(self.arg))
+
+
+class ClassMessage(Expr):
+    __slots__ = ('class_name', 'selector', 'arg')
+
+    def __init__(self, class_name, selector, arg):
+        self.class_name = class_name
+        self.selector = selector
+        self.arg = arg
+
+    def vars(self):
+        return expr_vars(self.arg)
+
+    def map_children(self, fn):
+        return ClassMessage(self.class_name, self.selector, fn(self.arg))
+
+
+class AttributedFragmentExpr(Expr):
+    __slots__ = ('content', 'attributes')
+
+    def __init__(self, content, attributes):
+        self.content = content
+        self.attributes = attributes
+
+    def vars(self):
+        return tuple(expr_vars(self.content)) + tuple(expr_vars(self.attributes))
+
+    def map_children(self, fn):
+        return AttributedFragmentExpr(fn(self.content), fn(self.attributes))
+
+
+class Stmt(object):
+    __slots__ = ()
+
+    def defs(self):
+        return ()
+
+    def uses(self):
+        return ()
+
+    def def_types(self):
+        # (variable, class name) pairs for defs()
+        return []
+
+    def map_exprs(self, fn):
+        pass
+
+
+class Alloc(Stmt):
+    __slots__ = ('var', 'class_name', 'constructor', 'defaults', 'xib_id')
+
+    # defaults maps attribute keys to property values of a freshly constructed instance, when they are known
+    def __init__(self, var, class_name, constructor, defaults=None, xib_id=None):
+        self.var = var
+        self.class_name = class_name
+        self.constructor = constructor
+        self.defaults = defaults
+        self.xib_id = xib_id
+
+    def defs(self):
+        return (self.var,)
+
+    def def_types(self):
+        return [(self.var, self.class_name)]
+
+    def uses(self):
+        return expr_vars(self.constructor)
+
+    def map_exprs(self, fn):
+        self.constructor = fn(self.constructor)
+
+
+class DefineValue(Stmt):
+    __slots__ = ('var', 'type_name', 'value', 'declared')
+
+    # Undeclared definitions assign to a variable declared elsewhere
+    def __init__(self, var, type_name, value, declared=True):
+        self.var = var
+        self.type_name = type_name
+        self.value = value
+        self.declared = declared
+
+    def defs(self):
+        return (self.var,)
+
+    def def_types(self):
+        return [(self.var, self.type_name)]
+
+    def uses(self):
+        return expr_vars(self.value)
+
+    def map_exprs(self, fn):
+        self.value = fn(self.value)
+
+
+class SetProperty(Stmt):
+    __slots__ = ('var', 'key', 'value', 'setter')
+
+    # setter is a format string with {var} and {value} placeholders, or None for plain property assignment
+    def __init__(self, var, key, value, setter=None):
+        self.var = var
+        self.key = key
+        self.value = value
+        self.setter = setter
+
+    def uses(self):
+        return (self.var,) + tuple(expr_vars(self.value))
+
+    def map_exprs(self, fn):
+        self.value = fn(self.value)
+
+
+class SetStateProperty(Stmt):
+    __slots__ = ('var', 'key', 'value', 'state')
+
+    def __init__(self, var, key, value, state):
+        self.var = var
+        self.key = key
+        self.value = value
+        self.state = state
+
+    def uses(self):
+        return (self.var,) + tuple(expr_vars(self.value))
+
+    def map_exprs(self, fn):
+        self.value = fn(self.value)
+
+
+class SetValueForKeyPath(Stmt):
+    __slots__ = ('var', 'key_path', 'value')
+
+    def __init__(self, var, key_path, value):
+        self.var = var
+        self.key_path = key_path
+        self.value = value
+
+    def uses(self):
+        return (self.var,) + tuple(expr_vars(self.value))
+
+    def map_exprs(self, fn):
+        self.value = fn(self.value)
+
+
+class AddSubview(Stmt):
+    __slots__ = ('parent', 'child')
+
+    def __init__(self, parent, child):
+        self.parent = parent
+        self.child = child
+
+    def uses(self):
+        return self.parent, self.child
+
+
+class DefineConstraint(Stmt):
+    __slots__ = ('var', 'first', 'first_attribute', 'relation', 'second', 'second_attribute',
+                 'multiplier', 'constant', 'priority')
+
+    # second is None for constraints that do not relate two items
+    def __init__(self, var, first, first_attribute, relation, second, second_attribute,
+                 multiplier, constant, priority=None):
+        self.var = var
+        self.first = first
+        self.first_attribute = first_attribute
+        self.relation = relation
+        self.second = second
+        self.second_attribute = second_attribute
+        self.multiplier = multiplier
+        self.constant = constant
+        self.priority = priority
+
+    def defs(self):
+        return (self.var,)
+
+    def def_types(self):
+        return [(self.var, 'NSLayoutConstraint')]
+
+    def uses(self):
+        if self.second is None:
+            return (self.first,)
+        return self.first, self.second
+
+
+class AddConstraints(Stmt):
+    __slots__ = ('var', 'constraints')
+
+    def __init__(self, var, constraints):
+        self.var = var
+        self.constraints = constraints
+
+    def uses(self):
+        return [self.var] + self.constraints
+
+
+class ActivateConstraints(Stmt):
+    __slots__ = ('constraints',)
+
+    def __init__(self, constraints):
+        self.constraints = constraints
+
+    def uses(self):
+        return self.constraints
+
+
+class ConstraintTable(Stmt):
+    __slots__ = ('items', 'constraints', 'aliases')
+
+    # Creates and activates constraints from a static table indexing into items.
+    # aliases lists the constraint variables that later statements refer to.
+    def __init__(self, items, constraints, aliases):
+        self.items = items
+        self.constraints = constraints
+        self.aliases = aliases
+
+    def defs(self):
+        return self.aliases
+
+    def def_types(self):
+        return [(var, 'NSLayoutConstraint') for var in self.aliases]
+
+    def uses(self):
+        return self.items
+
+
+class DefineParagraphStyle(Stmt):
+    __slots__ = ('var', 'alignment', 'line_break_mode', 'base_writing_direction', 'declared')
+
+    def __init__(self, var, alignment, line_break_mode, base_writing_direction, declared=True):
+        self.var = var
+        self.alignment = alignment
+        self.line_break_mode = line_break_mode
+        self.base_writing_direction = base_writing_direction
+        self.declared = declared
+
+    def defs(self):
+        return (self.var,)
+
+    def def_types(self):
+        return [(self.var, 'NSMutableParagraphStyle')]
+
+
+class DefineAttributes(Stmt):
+    __slots__ = ('var', 'items', 'declared')
+
+    # items is a list of (attribute name, value expression) pairs
+    def __init__(self, var, items, declared=True):
+        self.var = var
+        self.items = items
+        self.declared = declared
+
+    def defs(self):
+        return (self.var,)
+
+    def def_types(self):
+        return [(self.var, 'NSDictionary')]
+
+    def uses(self):
+        return [name for (_, value) in self.items for name in expr_vars(value)]
+
+    def map_exprs(self, fn):
+        self.items = [(name, fn(value)) for (name, value) in self.items]
+
+
+class DefineAttributedString(Stmt):
+    __slots__ = ('var',)
+
+    def __init__(self, var):
+        self.var = var
+
+    def defs(self):
+        return (self.var,)
+
+    def def_types(self):
+        return [(self.var, 'NSMutableAttributedString')]
+
+
+class AppendAttributedString(Stmt):
+    __slots__ = ('var', 'fragment')
+
+    def __init__(self, var, fragment):
+        self.var = var
+        self.fragment = fragment
+
+    def uses(self):
+        return (self.var,) + tuple(expr_vars(self.fragment))
+
+    def map_exprs(self, fn):
+        self.fragment = fn(self.fragment)
+
+
+class SetOutlet(Stmt):
+    __slots__ = ('host', 'property_name', 'value')
+
+    def __init__(self, host, property_name, value):
+        self.host = host
+        self.property_name = property_name
+        self.value = value
+
+    def uses(self):
+        return (self.host,) + tuple(expr_vars(self.value))
+
+    def map_exprs(self, fn):
+        self.value = fn(self.value)
+
+
+class AddTarget(Stmt):
+    __slots__ = ('host', 'target', 'selector', 'event_type')
+
+    def __init__(self, host, target, selector, event_type):
+        self.host = host
+        self.target = target
+        self.selector = selector
+        self.event_type = event_type
+
+    def uses(self):
+        return self.host, self.target
+
+
+class DispatchOnce(Stmt):
+    __slots__ = ('token', 'statics', 'body')
+
+    # statics is a list of (type name, variable) pairs, assigned by undeclared definitions in body
+    def __init__(self, token, statics, body):
+        self.token = token
+        self.statics = statics
+        self.body = body
+
+    def defs(self):
+        return [var for (_, var) in self.statics]
+
+    def def_types(self):
+        return [(var, type_name) for (type_name, var) in self.statics]
+
+
+class LazySubtree(Stmt):
+    __slots__ = ('name', 'root', 'body')
+
+    # Stores body as a block, which is run by the loader method for the subtree
+    def __init__(self, name, root, body):
+        self.name = name
+        self.root = root
+        self.body = body
+
+    def loader_selector(self):
+        return 'load' + self.name[0].upper() + self.name[1:]
+
+    def defs(self):
+        return ()
+
+    def uses(self):
+        # Variables captured by the block
+        defined = set()
+        captured = []
+        for stmt in self.body:
+            for var in stmt.uses():
+                if var not in defined and var not in captured:
+                    captured.append(var)
+            defined.update(stmt.defs())
+        return captured
+
+
+class RunLazyBuilder(Stmt):
+    __slots__ = ('selector',)
+
+    def __init__(self, selector):
+        self.selector = selector
+
+
+class CallHelper(Stmt):
+    __slots__ = ('method',)
+
+    def __init__(self, method):
+        self.method = method
+
+    def defs(self):
+        return [var for (var, _) in self.method.results]
+
+    def def_types(self):
+        return self.method.results
+
+    def uses(self):
+        return [var for (var, _) in self.method.params]
+
+
+class PrefetchImages(Stmt):
+    __slots__ = ('names',)
+
+    # Loads and decodes the named images on a background queue
+    def __init__(self, names):
+        self.names = names
+
+
+class Method(object):
+    __slots__ = ('selector', 'body', 'params', 'results', 'class_method')
+
+    # params and results are lists of (variable, class name) pairs.
+    # A single result is returned as is, several are passed back through out-parameters, which can be nil
+    # unlike the elements of an array.
+    def __init__(self, selector, body=None, params=None, results=None, class_method=False):
+        self.selector = selector
+        self.body = body if body is not None else []
+        self.params = params or []
+        self.results = results or []
+        self.class_method = class_method
+
+
+class Document(object):
+    __slots__ = ('methods',)
+
+    def __init__(self, methods=None):
+        self.methods = methods if methods is not None else []
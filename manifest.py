@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import uuid
+
+MANIFEST_NAME = '.xib2code-manifest.json'
+
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def fingerprint(path):
+    st = os.stat(path)
+    return {
+        'size': st.st_size,
+        'mtime': st.st_mtime_ns,
+        'digest': file_digest(path),
+    }
+
+
+class Manifest(object):
+    def __init__(self, folder, version, options):
+        self.folder = folder
+        self.path = os.path.join(folder, MANIFEST_NAME)
+        self.version = version
+        self.options = options
+        self.entries = {}
+        self.dirty = False
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get('version') != self.version or data.get('options') != self.options:
+            # Everything is stale, and will be rewritten on save
+            self.dirty = True
+            return
+        self.entries = data.get('files', {})
+
+    def key(self, path):
+        return os.path.relpath(path, self.folder)
+
+    def path_for_key(self, key):
+        return os.path.normpath(os.path.join(self.folder, key))
+
+    def is_fresh(self, input_path, output_path):
+        entry = self.entries.get(self.key(input_path))
+        if entry is None or entry['output'] != self.key(output_path):
+            return False
+        try:
+            st = os.stat(input_path)
+        except OSError:
+            return False
+        if st.st_size != entry['size']:
+            return False
+        if st.st_mtime_ns != entry['mtime']:
+            # Touched, but possibly not modified
+            if file_digest(input_path) != entry['digest']:
+                return False
+            entry['mtime'] = st.st_mtime_ns
+            self.dirty = True
+        if 'images' in entry and not os.path.exists(self.path_for_key(entry['images'])):
+            return False
+        return os.path.exists(output_path)
+
+    def record(self, input_path, output_path, input_fingerprint, shared_values=None, image_manifest_path=None):
+        entry = dict(input_fingerprint)
+        entry['output'] = self.key(output_path)
+        if image_manifest_path is not None:
+            entry['images'] = self.key(image_manifest_path)
+        if shared_values is not None:
+            # Declarations of the shared resources used by the output, see emitter.shared_value_declarations()
+            entry['shared'] = shared_values
+        self.entries[self.key(input_path)] = entry
+        self.dirty = True
+
+    def shared_values(self) -> dict:
+        values = {}
+        for entry in self.entries.values():
+            values.update(entry.get('shared', {}))
+        return values
+
+    def forget(self, input_path):
+        if self.entries.pop(self.key(input_path), None) is not None:
+            self.dirty = True
+
+    def removed_inputs(self):
+        for (key, entry) in sorted(self.entries.items()):
+            input_path = self.path_for_key(key)
+            if not os.path.exists(input_path):
+                yield input_path, self.path_for_key(entry['output'])
+
+    def save(self):
+        if not self.dirty or not os.path.isdir(self.folder):
+            return
+        data = {
+            'version': self.version,
+            'options': self.options,
+            'files': self.entries,
+        }
+        # Created like the outputs, so that the umask applies
+        tmp_path = self.path + '.' + uuid.uuid4().hex + '.tmp'
+        try:
+            with open(tmp_path, 'x') as f:
+                json.dump(data, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        self.dirty = False
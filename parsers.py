@@ -0,0 +1,101 @@
+import xml.etree.ElementTree as ET
+from xml.parsers import expat
+
+try:
+    import lxml.etree
+except ImportError:
+    lxml = None
+
+parser_backends = ('auto', 'lxml', 'expat', 'etree')
+
+
+class LocatedElement(ET.Element):
+    # Like lxml elements, knows the line it starts at. Also knows the column, 1-based like the line.
+    __slots__ = ('sourceline', 'sourcecolumn')
+
+
+class ExpatTreeBuilder(object):
+    """Builds an ElementTree document straight from expat callbacks, recording source lines."""
+
+    def __init__(self):
+        self.parser = expat.ParserCreate()
+        self.parser.buffer_text = True
+        self.parser.StartElementHandler = self.start
+        self.parser.EndElementHandler = self.end
+        self.parser.CharacterDataHandler = self.data
+        self.stack = []
+        self.root = None
+        # Character data goes to the text of the open element, or to the tail of the last closed one
+        self.last_closed = None
+        self.data_parts = []
+
+    def flush(self):
+        if not self.data_parts:
+            return
+        text = ''.join(self.data_parts)
+        self.data_parts = []
+        if self.last_closed is not None:
+            self.last_closed.tail = text
+        elif self.stack:
+            self.stack[-1].text = text
+
+    def start(self, tag, attrib):
+        self.flush()
+        e = LocatedElement(tag)
+        e.attrib = attrib
+        e.sourceline = self.parser.CurrentLineNumber
+        e.sourcecolumn = self.parser.CurrentColumnNumber + 1
+        if self.stack:
+            self.stack[-1].append(e)
+        else:
+            self.root = e
+        self.stack.append(e)
+        self.last_closed = None
+
+    def end(self, tag):
+        self.flush()
+        self.last_closed = self.stack.pop()
+
+    def data(self, text):
+        self.data_parts.append(text)
+
+    def parse(self, source):
+        if isinstance(source, str):
+            with open(source, 'rb') as f:
+                self.parser.ParseFile(f)
+        else:
+            self.parser.ParseFile(source)
+        return self.root
+
+
+def parse_with_lxml(source):
+    parser = lxml.etree.XMLParser(remove_comments=True, remove_pis=True, resolve_entities=False)
+    return lxml.etree.parse(source, parser).getroot()
+
+
+def parse_with_expat(source):
+    return ExpatTreeBuilder().parse(source)
+
+
+def parse_with_etree(source):
+    return ET.parse(source).getroot()
+
+
+def resolve_backend(name):
+    if name == 'auto':
+        return 'lxml' if lxml is not None else 'etree'
+    if name == 'lxml' and lxml is None:
+        raise ImportError('lxml is not installed')
+    return name
+
+
+parsers = {
+    'lxml': parse_with_lxml,
+    'expat': parse_with_expat,
+    'etree': parse_with_etree,
+}
+
+
+def parse_document(source, backend='auto'):
+    # Returns the root element. All backends provide the subset of the ElementTree interface used by processors.
+    return parsers[resolve_backend(backend)](source)
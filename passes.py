@@ -0,0 +1,712 @@
+import hashlib
+import heapq
+from collections import Counter
+from errors import BadLazySubtree
+from ir import *
+from assets import image_names
+
+shared_value_types = {
+    ColorExpr: ('color', 'UIColor'),
+    FontExpr: ('font', 'UIFont'),
+}
+
+shared_resource_types = {
+    ColorExpr: ('color', 'UIColor'),
+    FontExpr: ('font', 'UIFont'),
+    ImageExpr: ('image', 'UIImage'),
+}
+
+share_modes = ('local', 'static')
+
+constraint_modes = ('add', 'activate', 'table')
+
+
+def value_key(e):
+    cls = e.__class__
+    if cls is str:
+        return e
+    if cls in shared_value_types:
+        return cls, e.kind, e.args
+    if cls is SharedValueExpr:
+        return cls, e.accessor
+    return None
+
+
+class ValueSharing(object):
+    """Emits identical colors, fonts, paragraph styles and attribute dictionaries once per method."""
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.var_keys = {}
+        self.shared_defs = set()
+        self.value_counts = Counter()
+        self.value_names = {}
+        self.name_counters = Counter()
+        self.renames = {}
+        self.hoisted_values = []
+        self.hoisted_defs = []
+
+    def definition_key(self, stmt):
+        if stmt.__class__ is DefineParagraphStyle:
+            return DefineParagraphStyle, stmt.alignment, stmt.line_break_mode, stmt.base_writing_direction
+        if stmt.__class__ is DefineAttributes:
+            items = []
+            for (name, value) in stmt.items:
+                if value.__class__ is VarRef:
+                    key = self.var_keys.get(value.name)
+                else:
+                    key = value_key(value)
+                if key is None:
+                    return None
+                items.append((name, key))
+            return DefineAttributes, tuple(items)
+        return None
+
+    def find_shared_definitions(self, body):
+        counts = Counter()
+        for stmt in body:
+            key = self.definition_key(stmt)
+            if key is not None:
+                self.var_keys[stmt.var] = key
+                counts[key] += 1
+        self.shared_defs = {key for (key, n) in counts.items() if n > 1}
+        # Attributes can only be hoisted together with the paragraph styles they refer to
+        for key in list(self.shared_defs):
+            if key[0] is DefineAttributes:
+                for (_, value_key) in key[1]:
+                    if value_key.__class__ is tuple and value_key[0] is DefineParagraphStyle:
+                        if value_key not in self.shared_defs:
+                            self.shared_defs.discard(key)
+
+    def count_value(self, e):
+        key = value_key(e)
+        if key is not None and key.__class__ is tuple:
+            self.value_counts[key] += 1
+        return e
+
+    def count_values(self, body):
+        seen = set()
+        for stmt in body:
+            key = self.var_keys.get(getattr(stmt, 'var', None))
+            if key in self.shared_defs:
+                # Duplicates are dropped, so only the first definition counts
+                if key in seen:
+                    continue
+                seen.add(key)
+            stmt.map_exprs(lambda e: transform_expr(e, self.count_value))
+
+    def shared_value(self, e):
+        cls = e.__class__
+        if cls is VarRef:
+            name = self.renames.get(e.name)
+            if name is not None:
+                return VarRef(name)
+            return e
+        key = value_key(e)
+        if key is None or key.__class__ is not tuple or self.value_counts[key] < 2:
+            return e
+        name = self.value_names.get(key)
+        if name is None:
+            if cls is SharedValueExpr:
+                (prefix, type_name) = shared_resource_types[e.value.__class__]
+            else:
+                (prefix, type_name) = shared_value_types[cls]
+            self.name_counters[prefix] += 1
+            name = prefix + str(self.name_counters[prefix])
+            self.value_names[key] = name
+            self.hoisted_values.append(DefineValue(name, type_name, e))
+        return VarRef(name)
+
+    def run(self, method: Method):
+        self.find_shared_definitions(method.body)
+        self.count_values(method.body)
+        canonical = {}
+        body = []
+        for stmt in method.body:
+            key = self.var_keys.get(getattr(stmt, 'var', None))
+            if key in canonical:
+                self.renames[stmt.var] = canonical[key]
+                continue
+            stmt.map_exprs(lambda e: transform_expr(e, self.shared_value))
+            if key not in self.shared_defs:
+                body.append(stmt)
+            else:
+                canonical[key] = stmt.var
+                self.hoisted_defs.append(stmt)
+        hoisted = self.hoisted_values + self.hoisted_defs
+        if not hoisted:
+            return
+        if self.mode == 'static':
+            statics = []
+            for stmt in hoisted:
+                stmt.declared = False
+                statics.append((self.static_type(stmt), stmt.var))
+            hoisted = [DispatchOnce('onceToken', statics, hoisted)]
+        method.body = hoisted + body
+
+    def static_type(self, stmt):
+        if stmt.__class__ is DefineValue:
+            return stmt.type_name
+        if stmt.__class__ is DefineParagraphStyle:
+            return 'NSMutableParagraphStyle'
+        return 'NSDictionary'
+
+
+def share_values(method: Method, mode):
+    ValueSharing(mode).run(method)
+
+
+def shared_accessor(e) -> str:
+    # Derived from the value alone, so that files converted in different runs agree on the names
+    (prefix, _) = shared_resource_types[e.__class__]
+    if e.__class__ is ImageExpr:
+        parts = [prefix, e.name]
+    else:
+        parts = [prefix, e.kind] + list(e.args)
+    return prefix + '_' + hashlib.sha1('\0'.join(parts).encode('utf-8')).hexdigest()[:10]
+
+
+def use_shared_resources(method: Method, class_name):
+    def shared_resource(e):
+        types = shared_resource_types.get(e.__class__)
+        if types is None:
+            return e
+        return SharedValueExpr(class_name, shared_accessor(e), types[1], e)
+
+    for stmt in method.body:
+        stmt.map_exprs(lambda e: transform_expr(e, shared_resource))
+
+
+def collect_shared_values(document: Document) -> dict:
+    values = {}
+
+    def collect(e):
+        if e.__class__ is SharedValueExpr:
+            values[e.accessor] = e
+        elif e.__class__ is not str:
+            e.map_children(collect)
+        return e
+
+    def collect_body(body):
+        for stmt in body:
+            if stmt.__class__ is DispatchOnce or stmt.__class__ is LazySubtree:
+                collect_body(stmt.body)
+            stmt.map_exprs(collect)
+
+    for method in document.methods:
+        collect_body(method.body)
+    return values
+
+
+def is_default_value(value, default):
+    if value == default:
+        return True
+    try:
+        return float(value) == float(default)
+    except ValueError:
+        return False
+
+
+def elide_defaults(method: Method) -> int:
+    defaults = {}
+    body = []
+    elided = 0
+    for stmt in method.body:
+        if stmt.__class__ is Alloc:
+            if stmt.defaults:
+                defaults[stmt.var] = stmt.defaults
+        elif stmt.__class__ is SetProperty and stmt.value.__class__ is str:
+            default = defaults.get(stmt.var, {}).get(stmt.key)
+            if default is not None and is_default_value(stmt.value, default):
+                elided += 1
+                continue
+        body.append(stmt)
+    method.body = body
+    return elided
+
+
+def activate_constraints(method: Method):
+    constraints = []
+    body = []
+    position = 0
+    for stmt in method.body:
+        if stmt.__class__ is AddConstraints:
+            constraints.extend(stmt.constraints)
+            position = len(body)
+        else:
+            if stmt.__class__ is AddSubview:
+                position = len(body) + 1
+            body.append(stmt)
+    if not constraints:
+        return
+    # Every item must already be in the hierarchy when constraints are activated
+    body.insert(position, ActivateConstraints(constraints))
+    method.body = body
+
+
+def tabulate_constraints(method: Method):
+    definitions = []
+    body = []
+    position = 0
+    for stmt in method.body:
+        if stmt.__class__ is DefineConstraint:
+            definitions.append(stmt)
+        elif stmt.__class__ is AddConstraints:
+            position = len(body)
+        else:
+            if stmt.__class__ is AddSubview:
+                position = len(body) + 1
+            body.append(stmt)
+    if not definitions:
+        return
+    items = []
+    item_set = set()
+    for c in definitions:
+        for var in c.uses():
+            if var not in item_set:
+                item_set.add(var)
+                items.append(var)
+    constraint_vars = {c.var for c in definitions}
+    used = {var for stmt in body for var in stmt.uses() if var in constraint_vars}
+    aliases = [c.var for c in definitions if c.var in used]
+    body.insert(position, ConstraintTable(items, definitions, aliases))
+    method.body = body
+
+
+class LazySubtreeResolver(object):
+    """Moves statements that refer to variables of lazy subtrees into the blocks building those subtrees."""
+
+    def __init__(self, method: Method):
+        self.method = method
+        self.containers = []
+        self.parents = {}
+        self.depths = {}
+        self.nested = {}
+        self.owners = {}
+        self.moved = {}
+
+    def collect(self, container, parent):
+        self.containers.append(container)
+        self.parents[container] = parent
+        self.depths[container] = 0 if parent is None else self.depths[parent] + 1
+        body = []
+        nested = []
+        for stmt in container.body:
+            if stmt.__class__ is LazySubtree:
+                nested.append(stmt)
+            else:
+                body.append(stmt)
+                for var in stmt.defs():
+                    self.owners[var] = container
+        container.body = body
+        self.nested[container] = nested
+        self.moved[container] = []
+        for subtree in nested:
+            self.collect(subtree, container)
+
+    def target(self, container, stmt):
+        # The innermost block that can see all variables used by the statement
+        owners = [self.owners.get(var, self.method) for var in stmt.uses()]
+        target = max(owners, key=lambda c: self.depths[c], default=container)
+        if self.depths[target] <= self.depths[container]:
+            return container
+        chain = set()
+        c = target
+        while c is not None:
+            chain.add(c)
+            c = self.parents[c]
+        if container not in chain or any(owner not in chain for owner in owners):
+            raise BadLazySubtree()
+        return target
+
+    def move_constraints(self, container):
+        moved = {}
+        body = []
+        for stmt in container.body:
+            if stmt.__class__ is DefineConstraint:
+                target = self.target(container, stmt)
+                if target is not container:
+                    moved[stmt.var] = target
+                    self.owners[stmt.var] = target
+                    self.moved[target].append(stmt)
+                    continue
+            body.append(stmt)
+        if moved:
+            container.body = []
+            for stmt in body:
+                if stmt.__class__ is AddConstraints:
+                    targets = {}
+                    for c in stmt.constraints:
+                        if c in moved:
+                            targets.setdefault(moved[c], []).append(c)
+                    for (target, constraints) in targets.items():
+                        self.moved[target].append(AddConstraints(stmt.var, constraints))
+                    stmt.constraints = [c for c in stmt.constraints if c not in moved]
+                    if not stmt.constraints:
+                        continue
+                container.body.append(stmt)
+
+    def move_statements(self, container):
+        body = []
+        for stmt in container.body:
+            target = self.target(container, stmt)
+            if target is container:
+                body.append(stmt)
+            else:
+                self.moved[target].append(stmt)
+        container.body = body
+
+    def run(self) -> list:
+        self.collect(self.method, None)
+        if len(self.containers) == 1:
+            return []
+        for container in self.containers:
+            self.move_constraints(container)
+        for container in self.containers:
+            self.move_statements(container)
+        # Blocks go last, so that every variable they capture is already defined
+        for container in self.containers:
+            container.body += self.moved[container] + self.nested[container]
+        loaders = []
+        selectors = set()
+        for subtree in self.containers[1:]:
+            selector = subtree.loader_selector()
+            if selector in selectors:
+                raise BadLazySubtree()
+            selectors.add(selector)
+            loaders.append(Method(selector, [RunLazyBuilder(selector)]))
+        return loaders
+
+
+# Registering a lazy subtree block, and the strong reference to self and its nil check at the start of the block
+lazy_block_statements = 4
+
+
+def call_statements(results) -> int:
+    # Several results are declared before the call, which passes their addresses
+    return len(results) + 1 if len(results) > 1 else 1
+
+
+statement_counts = {
+    DefineConstraint: lambda s: 1 if s.priority is None else 2,
+    ConstraintTable: lambda s: 8 + len(s.aliases),
+    DefineParagraphStyle: lambda s: 4,
+    DispatchOnce: lambda s: len(s.statics) + 2 + body_size(s.body),
+    LazySubtree: lambda s: lazy_block_statements + body_size(s.body),
+    RunLazyBuilder: lambda s: 4,
+    CallHelper: lambda s: call_statements(s.method.results),
+    PrefetchImages: lambda s: 7 if s.names else 0,
+}
+
+
+def statement_count(stmt) -> int:
+    # Objective-C statements emitter.py writes for stmt, including the ones nested in blocks and loops
+    counter = statement_counts.get(stmt.__class__)
+    return 1 if counter is None else counter(stmt)
+
+
+def body_size(body) -> int:
+    return sum([statement_count(stmt) for stmt in body])
+
+
+def method_overhead(body, results) -> int:
+    # Statements of a method besides its body: passing results back, and the weak reference to self for blocks
+    return len(results) + (1 if any([stmt.__class__ is LazySubtree for stmt in body]) else 0)
+
+
+def collect_var_types(body, var_types):
+    for stmt in body:
+        var_types.update(stmt.def_types())
+        if stmt.__class__ is LazySubtree:
+            collect_var_types(stmt.body, var_types)
+    return var_types
+
+
+class Span(object):
+    __slots__ = ('var', 'items', 'size')
+
+    # Statements building the subtree of a subview, up to adding it to its parent
+    def __init__(self, var, items):
+        self.var = var
+        self.items = items
+        self.size = sum([item_size(item) for item in items])
+
+
+def item_size(item):
+    return item.size if item.__class__ is Span else statement_count(item)
+
+
+def flatten_items(items, out):
+    for item in items:
+        if item.__class__ is Span:
+            flatten_items(item.items, out)
+        else:
+            out.append(item)
+    return out
+
+
+def parse_spans(body):
+    children = {stmt.child for stmt in body if stmt.__class__ is AddSubview}
+    stack = [(None, [])]
+    for stmt in body:
+        if stmt.__class__ is Alloc and stmt.var in children:
+            stack.append((stmt.var, [stmt]))
+        elif stmt.__class__ is AddSubview and stack[-1][0] == stmt.child:
+            (var, items) = stack.pop()
+            items.append(stmt)
+            stack[-1][1].append(Span(var, items))
+        else:
+            stack[-1][1].append(stmt)
+    while len(stack) > 1:
+        (_, items) = stack.pop()
+        stack[-1][1].extend(items)
+    return stack[0][1]
+
+
+class MethodSplitter(object):
+    """Moves groups of subtrees out of a method or a lazy subtree block longer than a limit into helper methods.
+
+    Sizes are counted in emitted Objective-C statements, see statement_count(). Statements in lazy subtree blocks
+    count toward the method containing the block, so blocks have to be split before their method. Helpers longer than
+    the limit are split again.
+    """
+
+    def __init__(self, container, selector, limit, var_types, reserved=0):
+        # reserved is the number of statements around the body of a container that is not a method
+        self.container = container
+        self.selector = selector
+        self.limit = limit
+        self.reserved = reserved
+        self.helpers = []
+        self.var_types = var_types
+        # Constraint variable -> the AddConstraints statement of the body being split that adds it
+        self.adders = {}
+        # Statement id -> its position in the body being split, and variable -> position of its last use there
+        self.positions = {}
+        self.last_uses = {}
+        self.live_out = set()
+
+    def index(self, body):
+        self.positions = {id(stmt): i for (i, stmt) in enumerate(body)}
+        self.last_uses = {}
+        for (i, stmt) in enumerate(body):
+            for var in stmt.uses():
+                self.last_uses[var] = i
+        # Results of the body are used after all of it
+        for var in self.live_out:
+            self.last_uses[var] = len(body)
+
+    def results(self, stmts):
+        # Variables defined by stmts and used after them
+        end = self.positions[id(stmts[-1])]
+        return [(var, type_name) for stmt in stmts for (var, type_name) in stmt.def_types()
+                if self.last_uses.get(var, -1) > end]
+
+    def added_constraints(self, stmts):
+        # Ids of the AddConstraints statements localize_constraints() would add to stmts if they were extracted,
+        # and of the ones stmts already contain
+        needed = set()
+        contained = set()
+        for stmt in stmts:
+            if stmt.__class__ is DefineConstraint:
+                adder = self.adders.get(stmt.var)
+                if adder is not None:
+                    needed.add(id(adder))
+            elif stmt.__class__ is AddConstraints:
+                contained.add(id(stmt))
+        return needed, contained
+
+    def helper_size(self, stmts):
+        # Statements of a helper made of stmts
+        (needed, contained) = self.added_constraints(stmts)
+        return body_size(stmts) + len(needed - contained) + method_overhead(stmts, self.results(stmts))
+
+    def expand(self, items):
+        result = []
+        for item in items:
+            if item.__class__ is Span and self.helper_size(flatten_items([item], [])) > self.limit:
+                result.extend(self.expand(item.items))
+            else:
+                result.append(item)
+        return result
+
+    def chunk(self, items):
+        # Groups are sized as helpers, with a slot for each AddConstraints statement they could get from
+        # localize_constraints(), and for passing back each result
+        groups = []
+        current = []
+        size = 0
+        needed = set()
+        contained = set()
+        # Last uses of the variables the group defines that are used after it
+        live = []
+        lazy = False
+        for item in items:
+            stmts = flatten_items([item], [])
+            (item_needed, item_contained) = self.added_constraints(stmts)
+            end = self.positions[id(stmts[-1])]
+            item_live = [self.last_uses[var] for stmt in stmts for var in stmt.defs()
+                         if self.last_uses.get(var, -1) > end]
+            item_lazy = any([stmt.__class__ is LazySubtree for stmt in stmts])
+            while live and live[0] <= end:
+                heapq.heappop(live)
+            n = len((needed | item_needed) - (contained | item_contained)) + len(live) + len(item_live)
+            if current and size + item_size(item) + n + (lazy or item_lazy) > self.limit:
+                groups.append(flatten_items(current, []))
+                current = []
+                size = 0
+                needed = set()
+                contained = set()
+                live = []
+                lazy = False
+            current.append(item)
+            size += item_size(item)
+            needed |= item_needed
+            contained |= item_contained
+            for last_use in item_live:
+                heapq.heappush(live, last_use)
+            lazy = lazy or item_lazy
+        if current:
+            groups.append(flatten_items(current, []))
+        return groups
+
+    def select(self, groups, target):
+        extracted = set()
+        if len(groups) < 2:
+            return extracted
+        sizes = [body_size(group) for group in groups]
+        size = sum(sizes)
+        for i in sorted(range(len(groups)), key=lambda i: sizes[i], reverse=True):
+            if size <= target:
+                break
+            call = call_statements(self.results(groups[i]))
+            if sizes[i] > call:
+                extracted.add(i)
+                size -= sizes[i] - call
+        return extracted
+
+    def localize_constraints(self, groups, extracted):
+        # Constraints are added by the helper creating them, instead of being returned to the caller
+        constraint_groups = {}
+        for i in extracted:
+            for stmt in groups[i]:
+                if stmt.__class__ is DefineConstraint:
+                    constraint_groups[stmt.var] = i
+        if not constraint_groups:
+            return
+        for (j, group) in enumerate(groups):
+            for stmt in list(group):
+                if stmt.__class__ is not AddConstraints:
+                    continue
+                moved = {}
+                for c in stmt.constraints:
+                    i = constraint_groups.get(c)
+                    if i is not None and i != j:
+                        moved.setdefault(i, []).append(c)
+                for (i, constraints) in moved.items():
+                    groups[i].append(AddConstraints(stmt.var, constraints))
+                if moved:
+                    stmt.constraints = [c for c in stmt.constraints if constraint_groups.get(c, j) == j]
+                    if not stmt.constraints:
+                        group.remove(stmt)
+
+    def make_helper(self, stmts) -> CallHelper:
+        defined = set()
+        params = []
+        passed = set()
+        for stmt in stmts:
+            for var in stmt.uses():
+                if var not in defined and var in self.var_types and var not in passed:
+                    params.append((var, self.var_types[var]))
+                    passed.add(var)
+            for (var, _) in stmt.def_types():
+                defined.add(var)
+        selector = self.selector + 'Part' + str(len(self.helpers) + 1)
+        helper = Method(selector, stmts, params, self.results(stmts))
+        self.helpers.append(helper)
+        return CallHelper(helper)
+
+    def split_body(self, body, target):
+        self.adders = {c: stmt for stmt in body if stmt.__class__ is AddConstraints for c in stmt.constraints}
+        self.index(body)
+        groups = self.chunk(self.expand(parse_spans(body)))
+        extracted = self.select(groups, target)
+        self.localize_constraints(groups, extracted)
+        self.index([stmt for group in groups for stmt in group])
+        new_body = []
+        for (i, group) in enumerate(groups):
+            if i in extracted:
+                new_body.append(self.make_helper(group))
+            else:
+                new_body += group
+        return new_body
+
+    def split(self, owner, results, reserved):
+        self.live_out = {var for (var, _) in results}
+        body = owner.body
+        size = body_size(body)
+        while size + method_overhead(body, results) + reserved > self.limit:
+            new_body = self.split_body(body, self.limit - method_overhead(body, results) - reserved)
+            new_size = body_size(new_body)
+            if new_size >= size:
+                break
+            body = new_body
+            size = new_size
+            # Helpers called from the new body can be grouped into helpers again
+            collect_var_types(body, self.var_types)
+        owner.body = body
+
+    def run(self) -> list:
+        self.split(self.container, getattr(self.container, 'results', []), self.reserved)
+        i = 0
+        while i < len(self.helpers):
+            helper = self.helpers[i]
+            self.split(helper, helper.results, 0)
+            i += 1
+        return self.helpers
+
+
+def statement_containers(method: Method):
+    yield method
+    for stmt in method.body:
+        if stmt.__class__ is LazySubtree:
+            yield from statement_containers(stmt)
+
+
+def optimize_document(document: Document, options) -> Counter:
+    counts = Counter()
+    for method in list(document.methods):
+        document.methods += LazySubtreeResolver(method).run()
+    for method in document.methods:
+        # Lazy subtree blocks are optimized like methods of their own
+        for container in list(statement_containers(method)):
+            if options.constraints == 'activate':
+                activate_constraints(container)
+            elif options.constraints == 'table':
+                tabulate_constraints(container)
+            if options.elide_defaults:
+                counts['elided_defaults'] += elide_defaults(container)
+            if options.shared_resources is not None:
+                use_shared_resources(container, options.shared_resources)
+            if options.share_values is not None:
+                share_values(container, options.share_values)
+    if options.max_statements is not None:
+        methods = []
+        for method in document.methods:
+            methods.append(method)
+            var_types = collect_var_types(method.body, {})
+            # Blocks come before the blocks and the method containing them
+            for container in reversed(list(statement_containers(method))):
+                if container is method:
+                    splitter = MethodSplitter(method, method.selector, options.max_statements, var_types)
+                else:
+                    # The block is added to its method with the weak reference to self
+                    splitter = MethodSplitter(container, container.loader_selector(), options.max_statements,
+                                              var_types, lazy_block_statements + 1)
+                helpers = splitter.run()
+                methods += helpers
+                counts['helper_methods'] += len(helpers)
+        document.methods = methods
+    if options.prefetch_images:
+        document.methods.append(Method('prefetchImages', [PrefetchImages(image_names(document))], class_method=True))
+    return counts
@@ -0,0 +1,269 @@
+from ViewProcessor import *
+
+
+class ClassSchema(object):
+    def __init__(self, name, base=None, tag=None, default_class=None, processor=None,
+                 decoders=None, state_decoders=None, renames=None, setters=None, defaults=None,
+                 ignored=(), skipped=(), unskipped=()):
+        self.name = name
+        self.base = base
+        self.tag = tag
+        self.default_class = default_class or name
+        self.processor = processor
+        self.decoders = decoders or {}
+        self.state_decoders = state_decoders or {}
+        self.renames = renames or {}
+        self.setters = setters or {}
+        # None marks a default inherited from the base class as unknown for this class
+        self.defaults = defaults or {}
+        self.ignored = set(ignored)
+        self.skipped = set(skipped)
+        self.unskipped = set(unskipped)
+
+
+def merged(base, name, table):
+    result = dict(getattr(base, name, {}))
+    result.update(table)
+    return result
+
+
+class CompiledClass(object):
+    def __init__(self, schema: ClassSchema, base=None):
+        self.name = schema.name
+        self.tag = schema.tag
+        self.default_class = schema.default_class
+        self.processor = schema.processor or getattr(base, 'processor', None)
+        self.decoders = merged(base, 'decoders', schema.decoders)
+        self.state_decoders = merged(base, 'state_decoders', schema.state_decoders)
+        self.renames = merged(base, 'renames', schema.renames)
+        self.explicit_setters = merged(base, 'explicit_setters', schema.setters)
+        self.all_defaults = merged(base, 'all_defaults', schema.defaults)
+        self.defaults = {key: value for (key, value) in self.all_defaults.items() if value is not None}
+        self.ignored = frozenset(getattr(base, 'ignored', frozenset()) | schema.ignored)
+        self.skipped = frozenset((getattr(base, 'skipped', frozenset()) | schema.skipped) - schema.unskipped)
+        # Renames are folded into setters, so that writing a property takes a single lookup
+        self.setters = {key: '{var}.' + name + ' = {value};' for (key, name) in self.renames.items()}
+        self.setters.update(self.explicit_setters)
+
+    def make_processor(self, ctx):
+        return self.processor(ctx, self)
+
+
+def compile_schema(entries):
+    compiled = {}
+    for entry in entries:
+        base = None
+        if entry.base is not None:
+            base = compiled[entry.base]
+        compiled[entry.name] = CompiledClass(entry, base)
+    return compiled
+
+
+uikit_schema = [
+    ClassSchema(
+        'UIView',
+        tag='view',
+        processor=ViewProcessor,
+        decoders={
+            'adjustsFontSizeToFit': decode_bool,
+            'baselineAdjustment': decode_baseline_adjustment,
+            'contentMode': decode_content_mode,
+            'horizontalHuggingPriority': decode_number,
+            'horizontalCompressionResistancePriority': decode_number,
+            'lineBreakMode': decode_line_break_mode,
+            'opaque': decode_bool,
+            'text': decode_string,
+            'textAlignment': decode_text_alignment,
+            'translatesAutoresizingMaskIntoConstraints': decode_bool,
+            'userInteractionEnabled': decode_bool,
+            'verticalHuggingPriority': decode_number,
+            'verticalCompressionResistancePriority': decode_number,
+            'multipleTouchEnabled': decode_bool,
+            'clipsSubviews': decode_bool,
+            'misplaced': decode_bool,
+            'minimumScaleFactor': decode_number,
+            'clearsContextBeforeDrawing': decode_bool,
+        },
+        renames={
+            'clipsSubviews': 'clipsToBounds',
+        },
+        setters={
+            'verticalHuggingPriority':
+                '[{var} setContentHuggingPriority:{value} forAxis:UILayoutConstraintAxisVertical];',
+            'horizontalHuggingPriority':
+                '[{var} setContentHuggingPriority:{value} forAxis:UILayoutConstraintAxisHorizontal];',
+            'horizontalCompressionResistancePriority':
+                '[{var} setContentCompressionResistancePriority:{value} forAxis:UILayoutConstraintAxisHorizontal];',
+            'verticalCompressionResistancePriority':
+                '[{var} setContentCompressionResistancePriority:{value} forAxis:UILayoutConstraintAxisVertical];',
+        },
+        defaults={
+            'autoresizingMask': 'UIViewAutoresizingNone',
+            'clearsContextBeforeDrawing': 'YES',
+            'clipsSubviews': 'NO',
+            'contentMode': 'UIViewContentModeScaleToFill',
+            'horizontalHuggingPriority': '250',
+            'verticalHuggingPriority': '250',
+            'horizontalCompressionResistancePriority': '750',
+            'verticalCompressionResistancePriority': '750',
+            'multipleTouchEnabled': 'NO',
+            'opaque': 'YES',
+            'translatesAutoresizingMaskIntoConstraints': 'YES',
+            'userInteractionEnabled': 'YES',
+        },
+        ignored={'userLabel'},
+        skipped={'frame', 'misplaced'},
+    ),
+    ClassSchema(
+        'rootView',
+        base='UIView',
+        default_class='UIView',
+        processor=RootViewProcessor,
+        ignored={'contentMode'},
+        skipped={
+            'autoresizingMask',
+            'simulatedStatusBarMetrics',
+            'simulatedDestinationMetrics',
+            'canvasLocation',
+        },
+    ),
+    ClassSchema(
+        'UILabel',
+        base='UIView',
+        tag='label',
+        processor=LabelProcessor,
+        decoders={
+            'adjustsFontSizeToFit': decode_bool,
+            'adjustsLetterSpacingToFitWidth': decode_bool,
+            'baselineAdjustment': decode_baseline_adjustment,
+            'lineBreakMode': decode_line_break_mode,
+            'text': decode_string,
+            'textAlignment': decode_text_alignment,
+            'minimumScaleFactor': decode_number,
+            'minimumFontSize': decode_number,
+            'numberOfLines': decode_number,
+        },
+        renames={
+            'adjustsFontSizeToFit': 'adjustsFontSizeToFitWidth',
+            'fontDescription': 'font',
+            'highlightedColor': 'highlightedTextColor',
+        },
+        defaults={
+            'adjustsFontSizeToFit': 'NO',
+            'adjustsLetterSpacingToFitWidth': 'NO',
+            'baselineAdjustment': 'UIBaselineAdjustmentAlignBaselines',
+            'contentMode': None,
+            'lineBreakMode': 'NSLineBreakByTruncatingTail',
+            'minimumScaleFactor': '0',
+            'numberOfLines': '1',
+            'opaque': None,
+            'userInteractionEnabled': 'NO',
+        },
+    ),
+    ClassSchema(
+        'UIScrollView',
+        base='UIView',
+        tag='scrollView',
+        decoders={
+            'showsHorizontalScrollIndicator': decode_bool,
+            'showsVerticalScrollIndicator': decode_bool,
+            'pagingEnabled': decode_bool,
+        },
+        defaults={
+            'clipsSubviews': 'YES',
+            'pagingEnabled': 'NO',
+            'showsHorizontalScrollIndicator': 'YES',
+            'showsVerticalScrollIndicator': 'YES',
+        },
+    ),
+    ClassSchema(
+        'UIControl',
+        base='UIView',
+        processor=ControlProcessor,
+        decoders={
+            'contentHorizontalAlignment': decode_content_horizontal_alignment,
+            'contentVerticalAlignment': decode_content_vertical_alignment,
+        },
+        defaults={
+            'contentHorizontalAlignment': 'UIControlContentHorizontalAlignmentCenter',
+            'contentVerticalAlignment': 'UIControlContentVerticalAlignmentCenter',
+            'contentMode': None,
+            'opaque': None,
+        },
+    ),
+    ClassSchema(
+        'UIButton',
+        base='UIControl',
+        tag='button',
+        processor=ButtonProcessor,
+        state_decoders={
+            'title': decode_string,
+        },
+        renames={
+            'lineBreakMode': 'titleLabel.lineBreakMode',
+        },
+        defaults={
+            'lineBreakMode': 'NSLineBreakByTruncatingMiddle',
+        },
+        unskipped={'frame'},
+    ),
+    ClassSchema(
+        'UIImageView',
+        base='UIView',
+        tag='imageView',
+        decoders={
+            'image': decode_image_with_name,
+        },
+        defaults={
+            'opaque': None,
+            'userInteractionEnabled': 'NO',
+        },
+    ),
+    ClassSchema(
+        'MKMapView',
+        base='UIView',
+        tag='mapView',
+        decoders={
+            'scrollEnabled': decode_bool,
+            'pitchEnabled': decode_bool,
+            'rotateEnabled': decode_bool,
+            'mapType': decode_map_type,
+            'zoomEnabled': decode_bool,
+            'showsUserLocation': decode_bool,
+        },
+        defaults={
+            'mapType': 'MKMapTypeStandard',
+            'pitchEnabled': 'YES',
+            'rotateEnabled': 'YES',
+            'scrollEnabled': 'YES',
+            'showsUserLocation': 'NO',
+            'zoomEnabled': 'YES',
+        },
+    ),
+    ClassSchema(
+        'UIPageControl',
+        base='UIControl',
+        tag='pageControl',
+        decoders={
+            'numberOfPages': decode_number,
+        },
+        defaults={
+            'numberOfPages': '0',
+        },
+    ),
+    ClassSchema(
+        'UISwitch',
+        base='UIControl',
+        tag='switch',
+        decoders={
+            'on': decode_bool,
+        },
+        defaults={
+            'on': 'NO',
+        },
+    ),
+]
+
+uikit_classes = compile_schema(uikit_schema)
+
+uikit_classes_by_tag = {c.tag: c for c in uikit_classes.values() if c.tag is not None}
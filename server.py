@@ -0,0 +1,150 @@
+import xib2code
+import argparse
+import io
+import json
+import os
+import signal
+import socketserver
+import stat
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+arg_parser = argparse.ArgumentParser(description='Serve XIB conversion requests as JSON lines')
+arg_parser.add_argument('-u', '--socket', metavar='PATH',
+                        help='Listen on a Unix socket instead of reading requests from stdin')
+arg_parser.add_argument('-t', '--threads', metavar='N', type=int, default=4,
+                        help='Number of requests handled concurrently')
+
+option_names = frozenset(vars(xib2code.Options()))
+# Options needing a module generated from all files of a batch, which a request for a single file cannot write
+batch_option_names = frozenset(['shared_resources'])
+
+
+def make_options(values):
+    unknown = set(values) - option_names
+    if unknown:
+        raise ValueError('Unknown options: ' + ', '.join(sorted(unknown)))
+    batch_only = [name for name in sorted(batch_option_names & set(values)) if values[name] is not None]
+    if batch_only:
+        raise ValueError('Options only supported by batch runs of tool.py: ' + ', '.join(batch_only))
+    return xib2code.Options(**values)
+
+
+def diagnostic(error, source=None, options=None):
+    # Errors of the conversion itself are located in the source
+    if source is not None:
+        d = xib2code.diagnose_failure(source, options, error)
+    else:
+        d = {'type': type(error).__name__, 'message': str(error)}
+    d['severity'] = 'error'
+    return d
+
+
+def handle_request(request):
+    start = time.perf_counter()
+    response = {'id': request.get('id')}
+    source = None
+    try:
+        options = make_options(request.get('options', {}))
+        if 'xml' in request:
+            source = io.BytesIO(request['xml'].encode('utf-8'))
+        else:
+            source = request['input']
+        try:
+            code = xib2code.convert_xib(source, options)
+        except Exception as e:
+            response['diagnostics'] = [diagnostic(e, source, options)]
+            raise
+        output_path = request.get('output')
+        if output_path is None:
+            response['code'] = code
+        elif request.get('check', False):
+            response['diff'] = xib2code.diff_output(output_path, code)
+        else:
+            response['changed'] = xib2code.write_if_changed(output_path, code)
+        response['status'] = 'ok'
+        response['diagnostics'] = []
+    except Exception as e:
+        response['status'] = 'error'
+        if 'diagnostics' not in response:
+            response['diagnostics'] = [diagnostic(e)]
+    response['time_ms'] = (time.perf_counter() - start) * 1000
+    return response
+
+
+def handle_line(line):
+    try:
+        request = json.loads(line)
+        if not isinstance(request, dict):
+            raise ValueError('Request must be a JSON object')
+    except ValueError as e:
+        return {'id': None, 'status': 'error', 'diagnostics': [diagnostic(e)]}
+    return handle_request(request)
+
+
+def serve_stream(rfile, wfile, executor):
+    lock = threading.Lock()
+
+    def serve_line(line):
+        data = json.dumps(handle_line(line)).encode('utf-8') + b'\n'
+        with lock:
+            try:
+                wfile.write(data)
+                wfile.flush()
+            except (OSError, ValueError):
+                # Client has gone away
+                pass
+
+    futures = []
+    for line in rfile:
+        if not line.strip():
+            continue
+        # Replies may come out of order, clients match them by id
+        futures.append(executor.submit(serve_line, line))
+        futures = [f for f in futures if not f.done()]
+    for future in futures:
+        future.result()
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        serve_stream(self.rfile, self.wfile, self.server.executor)
+
+
+class ConversionServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, executor):
+        self.executor = executor
+        socketserver.UnixStreamServer.__init__(self, socket_path, RequestHandler)
+
+
+def remove_stale_socket(socket_path):
+    try:
+        if stat.S_ISSOCK(os.stat(socket_path).st_mode):
+            os.unlink(socket_path)
+    except FileNotFoundError:
+        pass
+
+
+def run_server():
+    args = arg_parser.parse_args()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        if args.socket is None:
+            serve_stream(sys.stdin.buffer, sys.stdout.buffer, executor)
+            return
+        remove_stale_socket(args.socket)
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        with ConversionServer(args.socket, executor) as server:
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                os.unlink(args.socket)
+
+
+if __name__ == '__main__':
+    run_server()
@@ -0,0 +1,127 @@
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+
+class FileStats(object):
+    # Conversion counts elements, statements and variables
+    instrumented = True
+
+    def __init__(self, path):
+        self.path = path
+        self.stages = {}
+        self.tags = Counter()
+        self.attributes = Counter()
+        self.statements = 0
+        self.variables = Counter()
+        self.optimizations = Counter()
+
+    @contextmanager
+    def stage(self, name):
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            self.stages[name] = {
+                'wall': time.perf_counter() - wall,
+                'cpu': time.process_time() - cpu,
+            }
+
+    def count_element(self, e):
+        self.tags[e.tag] += 1
+        self.attributes.update(e.attrib.keys())
+
+    def record_optimizations(self, counts):
+        self.optimizations.update(counts)
+
+    def report(self):
+        return {
+            'path': self.path,
+            'stages': self.stages,
+            'tags': dict(self.tags),
+            'attributes': dict(self.attributes),
+            'statements': self.statements,
+            'variables': dict(self.variables),
+            'optimizations': dict(self.optimizations),
+        }
+
+
+class NoStats(object):
+    instrumented = False
+
+    def stage(self, name):
+        return nullcontext()
+
+    def record_optimizations(self, counts):
+        pass
+
+
+no_stats = NoStats()
+
+
+class OptimizationStats(NoStats):
+    # Only keeps what the passes did, which is reported by normal runs too
+    def __init__(self):
+        self.optimizations = Counter()
+
+    def record_optimizations(self, counts):
+        self.optimizations.update(counts)
+
+    def report(self):
+        return {'optimizations': dict(self.optimizations)}
+
+
+def percentile(sorted_values, p):
+    # Nearest-rank percentile
+    if not sorted_values:
+        return None
+    rank = max(int(-(-p * len(sorted_values) // 100)), 1)
+    return sorted_values[rank - 1]
+
+
+def batch_report(file_reports, wall, skipped=0):
+    stages = {}
+    tags = Counter()
+    attributes = Counter()
+    variables = Counter()
+    optimizations = Counter()
+    statements = 0
+    for report in file_reports:
+        for (name, times) in report['stages'].items():
+            stage = stages.setdefault(name, {'wall': [], 'cpu': []})
+            stage['wall'].append(times['wall'])
+            stage['cpu'].append(times['cpu'])
+        tags.update(report['tags'])
+        attributes.update(report['attributes'])
+        variables.update(report['variables'])
+        optimizations.update(report['optimizations'])
+        statements += report['statements']
+    totals = {}
+    percentiles = {}
+    for (name, stage) in stages.items():
+        totals[name] = {clock: sum(values) for (clock, values) in stage.items()}
+        percentiles[name] = {}
+        for (clock, values) in stage.items():
+            values.sort()
+            percentiles[name][clock] = {
+                'p50': percentile(values, 50),
+                'p90': percentile(values, 90),
+                'p99': percentile(values, 99),
+                'max': values[-1],
+            }
+    return {
+        'wall': wall,
+        'converted': len(file_reports),
+        'skipped': skipped,
+        'totals': {
+            'stages': totals,
+            'tags': dict(tags),
+            'attributes': dict(attributes),
+            'statements': statements,
+            'variables': dict(variables),
+            'optimizations': dict(optimizations),
+        },
+        'percentiles': percentiles,
+        'files': file_reports,
+    }
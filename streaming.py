@@ -0,0 +1,88 @@
+import xml.etree.ElementTree as ET
+from collections import deque
+
+
+class StreamElement(object):
+    __slots__ = ('reader', 'element', 'children', 'closed')
+
+    def __init__(self, reader, element):
+        self.reader = reader
+        self.element = element
+        self.children = deque()
+        self.closed = False
+
+    @property
+    def tag(self):
+        return self.element.tag
+
+    @property
+    def attrib(self):
+        return self.element.attrib
+
+    @property
+    def text(self):
+        self.read_to_end()
+        return self.element.text
+
+    def get(self, key, default=None):
+        return self.element.attrib.get(key, default)
+
+    def read_to_end(self):
+        while not self.closed:
+            self.reader.advance()
+
+    def __iter__(self):
+        # Children are released as soon as iteration moves past them,
+        # so only the path from the root to the current element stays in memory
+        children = self.children
+        while True:
+            while not children and not self.closed:
+                self.reader.advance()
+            if not children:
+                return
+            yield children.popleft()
+
+    def iterfind(self, tag):
+        # Looks ahead without releasing anything, stops as soon as the caller does
+        children = self.children
+        i = 0
+        while True:
+            while i >= len(children) and not self.closed:
+                self.reader.advance()
+            if i >= len(children):
+                return
+            child = children[i]
+            i += 1
+            if child.tag == tag:
+                yield child
+
+    def findall(self, tag):
+        return list(self.iterfind(tag))
+
+
+class StreamReader(object):
+    def __init__(self, source):
+        self.events = ET.iterparse(source, events=('start', 'end'))
+        self.stack = []
+        self.root = None
+
+    def read_root(self):
+        while self.root is None:
+            self.advance()
+        return self.root
+
+    def advance(self):
+        (event, element) = next(self.events)
+        if event == 'start':
+            node = StreamElement(self, element)
+            if self.stack:
+                self.stack[-1].children.append(node)
+            else:
+                self.root = node
+            self.stack.append(node)
+        else:
+            node = self.stack.pop()
+            node.closed = True
+            if self.stack:
+                # Detach finished element from the tree built by the parser
+                self.stack[-1].element.remove(element)
@@ -1,49 +1,526 @@
 import xib2code
+from manifest import Manifest, fingerprint
+from stats import FileStats, OptimizationStats, batch_report
+from watcher import make_watcher, watch_changes
+from passes import share_modes, constraint_modes
+from parsers import parser_backends, resolve_backend
+from emitter import emit_shared_header, emit_shared_implementation
+from cost import cost_metrics, limit_violations, rank_reports, write_csv_report, write_json_report
+from diagnostics import format_diagnostic, write_diagnostics
+from cache import OutputCache, DEFAULT_MAX_SIZE_MB
 import argparse
+import os
 import os.path
 import glob
+import json
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 
 arg_parser = argparse.ArgumentParser(description='Convert XIB files into code')
 arg_parser.add_argument('-i', '--input', metavar='SRC', required=True,
                         help='Input file or folder')
 arg_parser.add_argument('-r', '--recursive', action='store_true',
                         help='Scan input folder recursively. Ignored if source is a single file')
-arg_parser.add_argument('-o', '--output', metavar='OUT', required=True,
-                        help='Output file or folder')
+arg_parser.add_argument('-o', '--output', metavar='OUT',
+                        help='Output file or folder. Required unless --validate or --cost-report is given')
 arg_parser.add_argument('-t', '--keep-tree', action='store_true',
                         help='If input and output are folders, then reflect structure of input subfolders in the output')
 arg_parser.add_argument('-x', '--suffix', metavar='EXT', default='.inl',
                         help='Suffix for generated files')
+arg_parser.add_argument('-j', '--jobs', metavar='N', type=int, default=os.cpu_count() or 1,
+                        help='Number of worker processes. Defaults to the number of CPUs')
+arg_parser.add_argument('-s', '--stream', action='store_true',
+                        help='Parse input incrementally and write code as it is generated, keeping only the current '
+                             'branch of the document in memory. Cannot be combined with options that change the whole '
+                             'document: --share-values, --elide-defaults, --constraints other than "add", '
+                             '--lazy-subtrees, --max-statements, --shared-resources, --prefetch-images and '
+                             '--image-manifest. Outputs are not cached')
+arg_parser.add_argument('-f', '--force', action='store_true',
+                        help='Convert all files, even if their outputs are up to date')
+arg_parser.add_argument('--prune', action='store_true',
+                        help='Remove outputs of input files that no longer exist')
+arg_parser.add_argument('--check', action='store_true',
+                        help='Do not write anything, print a diff and fail if any output is out of date')
+arg_parser.add_argument('--validate', action='store_true',
+                        help='Do not generate or write anything, only report every input file that cannot be converted')
+arg_parser.add_argument('-w', '--watch', action='store_true',
+                        help='Keep running and convert input files as they change')
+arg_parser.add_argument('--debounce', metavar='MS', type=int, default=30,
+                        help='In watch mode, wait until there are no changes for this long before converting')
+arg_parser.add_argument('--parser', metavar='BACKEND', choices=parser_backends, default='auto',
+                        help='XML parser: "lxml", "expat" (builds the tree directly from expat callbacks), "etree" '
+                             '(xml.etree.ElementTree) or "auto", which uses lxml when it is installed and ElementTree '
+                             'otherwise. Ignored with --stream')
+arg_parser.add_argument('--share-values', metavar='MODE', choices=share_modes,
+                        help='Create identical colors, fonts, paragraph styles and attribute dictionaries only once, '
+                             'as locals ("local") or as statics initialized with dispatch_once ("static")')
+arg_parser.add_argument('--elide-defaults', action='store_true',
+                        help='Omit property assignments that match the UIKit default for the class, and print the '
+                             'number of omitted assignments of each converted file')
+arg_parser.add_argument('--constraints', metavar='MODE', choices=constraint_modes, default='add',
+                        help='How constraints are installed: "add" adds them to their views as the hierarchy is built, '
+                             '"activate" activates all of them at once after the hierarchy is built, '
+                             '"table" does the same, creating them in a loop from a static table')
+arg_parser.add_argument('--lazy-subtrees', action='store_true',
+                        help='Build subviews marked with a "lazy:NAME" user label, or a "xib2code.lazy" runtime '
+                             'attribute holding NAME, only when the generated loadNAME method is called')
+arg_parser.add_argument('--max-statements', metavar='N', type=int,
+                        help='Move groups of subviews into helper methods, so that no generated method has more than '
+                             'N Objective-C statements, counting the ones in its blocks. Single statements that cannot '
+                             'be split, like the dispatch_once block of --share-values static or a constraint table, '
+                             'can still make a method longer')
+arg_parser.add_argument('--image-manifest', action='store_true',
+                        help='Also write the images used by each file, with the views showing them and their sizes, '
+                             'to a .images.json file next to its output')
+arg_parser.add_argument('--prefetch-images', action='store_true',
+                        help='Add a prefetchImages class method, which loads and decodes the images of the file on a '
+                             'background queue')
+arg_parser.add_argument('--shared-resources', metavar='NAME',
+                        help='Create colors, fonts and images through cached class methods of NAME, which is written '
+                             'to NAME.h and NAME.m next to the outputs. Generated files need NAME.h to be imported')
+arg_parser.add_argument('--cost-report', metavar='FILE',
+                        help='Do not write anything, estimate the construction cost of each input file and write them '
+                             'ranked to FILE, as CSV if it ends with .csv, as JSON otherwise')
+arg_parser.add_argument('--cost-limit', metavar='METRIC=N', action='append', default=[],
+                        help='With --cost-report, fail if any file has more than N of METRIC, which is "score" or one '
+                             'of: ' + ', '.join(cost_metrics) + '. Can be repeated')
+arg_parser.add_argument('--cache-dir', metavar='DIR', default=os.environ.get('XIB2CODE_CACHE_DIR'),
+                        help='Keep generated code in DIR, keyed by the contents of the input and the options, and reuse '
+                             'it for identical inputs instead of converting them. DIR can be shared by several '
+                             'workspaces and concurrent runs. Defaults to $XIB2CODE_CACHE_DIR, without it there is no '
+                             'cache. Not used with --stream')
+arg_parser.add_argument('--cache-size', metavar='MB', type=int, default=DEFAULT_MAX_SIZE_MB,
+                        help='Remove least recently used entries when the cache grows over this size. The size is '
+                             'tracked in DIR/stats.json and checked at the end of each run. Defaults to ' +
+                             str(DEFAULT_MAX_SIZE_MB))
+arg_parser.add_argument('--cache-stats', action='store_true',
+                        help='Print cache hits and misses of this run, and totals of the cache')
+arg_parser.add_argument('--diagnostics', metavar='FILE',
+                        help='Write the problems of all files that cannot be converted to FILE as JSON, with their '
+                             'source lines and columns, element paths and offending tags or attributes')
+arg_parser.add_argument('--stats', metavar='FILE',
+                        help='Write per-stage timings and per-tag counters of converted files to FILE as JSON')
 
 
-def iterate_files(args):
+def output_path_for(args, input_path):
+    if os.path.isdir(args.input):
+        if args.keep_tree:
+            output_path = os.path.relpath(input_path, args.input)
+        else:
+            output_path = os.path.basename(input_path)
+        (output_path, _) = os.path.splitext(output_path)
+        output_path = output_path + args.suffix
+        return os.path.join(args.output, output_path)
+    if os.path.isdir(args.output):
+        return os.path.join(args.output, os.path.basename(args.input) + args.suffix)
+    return args.output
+
+
+def is_input_file(args, path):
+    if not os.path.isdir(args.input):
+        return os.path.normpath(path) == os.path.normpath(args.input)
+    (folder, name) = os.path.split(os.path.normpath(path))
+    if not name.endswith('.xib') or name.startswith('.'):
+        return False
+    if args.recursive:
+        return not os.path.relpath(folder, args.input).startswith(os.pardir)
+    return folder == os.path.normpath(args.input)
+
+
+def input_files(args):
     if os.path.isdir(args.input):
         if args.recursive:
             glob_path = args.input + '/**/*.xib'
         else:
             glob_path = args.input + '/*.xib'
-        for input_path in glob.iglob(glob_path, recursive=args.recursive):
-
-            if args.keep_tree:
-                output_path = os.path.relpath(input_path, args.input)
-            else:
-                output_path = os.path.basename(input_path)
-            (output_path, _) = os.path.splitext(output_path)
-            output_path = output_path + args.suffix
-            output_path = os.path.join(args.output, output_path)
-            yield input_path, output_path
+        yield from glob.iglob(glob_path, recursive=args.recursive)
     else:
-        if os.path.isdir(args.output):
-            output_path = os.path.join(args.output, os.path.basename(args.input) + args.suffix)
+        yield args.input
+
+
+def iterate_files(args):
+    for input_path in input_files(args):
+        if args.output is None:
+            yield input_path, None
+        else:
+            yield input_path, output_path_for(args, input_path)
+
+
+def output_options(args):
+    return {
+        'suffix': args.suffix,
+        'keep_tree': args.keep_tree,
+        'share_values': args.share_values,
+        'elide_defaults': args.elide_defaults,
+        'constraints': args.constraints,
+        'lazy_subtrees': args.lazy_subtrees,
+        'max_statements': args.max_statements,
+        'shared_resources': args.shared_resources,
+        'prefetch_images': args.prefetch_images,
+        'image_manifest': args.image_manifest,
+    }
+
+
+def manifest_folder(args):
+    if os.path.isdir(args.output):
+        return args.output
+    return os.path.dirname(args.output) or '.'
+
+
+def conversion_options(args):
+    return xib2code.Options(
+        streaming=args.stream,
+        share_values=args.share_values,
+        elide_defaults=args.elide_defaults,
+        constraints=args.constraints,
+        lazy_subtrees=args.lazy_subtrees,
+        max_statements=args.max_statements,
+        shared_resources=args.shared_resources,
+        prefetch_images=args.prefetch_images,
+        parser=args.parser,
+    )
+
+
+def image_manifest_path(output_path):
+    return os.path.splitext(output_path)[0] + '.images.json'
+
+
+def convert_file(job, options, collect_stats=False, image_manifest=False, cache=None):
+    # Failures are returned as diagnostics, so that one bad file does not stop the others.
+    # Cache hits are counted by the caller, as the cache is a copy in worker processes.
+    (input_path, output_path) = job
+    hits = cache and cache.hits
+    shared_values = None
+    try:
+        input_fingerprint = fingerprint(input_path)
+        if collect_stats:
+            file_stats = FileStats(input_path)
+        elif options.elide_defaults:
+            # Elided assignments are reported for every file
+            file_stats = OptimizationStats()
+        else:
+            file_stats = None
+        manifest_path = image_manifest_path(output_path) if image_manifest else None
+        if options.shared_resources is None:
+            xib2code.process_xib(input_path, output_path, options, file_stats, manifest_path, cache)
+        else:
+            # Values of the file are recorded in the manifest, which the shared module is written from
+            results = xib2code.conversion_results(input_path, options, file_stats, image_manifest, cache)
+            xib2code.write_outputs(xib2code.results_outputs(input_path, output_path, results, manifest_path),
+                                   file_stats)
+            shared_values = results['shared']
+    except Exception as e:
+        return None, None, [xib2code.diagnose_failure(input_path, options, e)], None, None
+    cache_hit = None if cache is None else cache.hits > hits
+    return input_fingerprint, file_stats and file_stats.report(), [], cache_hit, shared_values
+
+
+def elided_defaults(file_report):
+    return file_report['optimizations'].get('elided_defaults', 0)
+
+
+def make_cache(args):
+    if args.cache_dir is None or args.stream:
+        return None
+    return OutputCache(args.cache_dir, args.cache_size << 20)
+
+
+def report_cache(args, cache, hits, misses):
+    evicted = cache.finish_run(hits, misses)
+    if args.cache_stats:
+        totals = cache.totals()
+        print('Cache: {} hits, {} misses, {} evicted; in total {} hits, {} misses, {} entries, {:.1f} of {} MB'.format(
+            hits, misses, evicted, totals['hits'], totals['misses'], totals['entries'], totals['size'] / (1 << 20),
+            args.cache_size), file=sys.stderr)
+    return {'hits': hits, 'misses': misses, 'evicted': evicted}
+
+
+def shared_module(args, values):
+    # Paths and contents of the shared resource header and implementation
+    base = os.path.join(manifest_folder(args), args.shared_resources)
+    return [
+        (base + '.h', emit_shared_header(args.shared_resources, values)),
+        (base + '.m', emit_shared_implementation(args.shared_resources, values)),
+    ]
+
+
+def write_shared_module(args, values):
+    for (path, text) in shared_module(args, values):
+        xib2code.write_if_changed(path, text)
+
+
+def check_file(job, options, image_manifest=False):
+    (input_path, output_path) = job
+    manifest_path = image_manifest_path(output_path) if image_manifest else None
+    try:
+        results = xib2code.conversion_results(input_path, options, images=image_manifest)
+        outputs = xib2code.results_outputs(input_path, output_path, results, manifest_path)
+        return xib2code.diff_outputs(outputs), [], results.get('shared')
+    except Exception as e:
+        return '', [xib2code.diagnose_failure(input_path, options, e)], None
+
+
+def input_size(job):
+    try:
+        return os.path.getsize(job[0])
+    except OSError:
+        return 0
+
+
+def run_jobs(worker, files, jobs, *worker_args):
+    if jobs <= 1 or len(files) <= 1:
+        for job in files:
+            yield job, worker(job, *worker_args)
+        return
+    # Largest files go first, so that a single big file does not hold up the end of the run
+    order = sorted(range(len(files)), key=lambda i: input_size(files[i]), reverse=True)
+    executor = ProcessPoolExecutor(max_workers=jobs)
+    try:
+        futures = [None] * len(files)
+        for i in order:
+            futures[i] = executor.submit(worker, files[i], *worker_args)
+        # Results are reported in input order, regardless of the completion order
+        for (job, future) in zip(files, futures):
+            yield job, future.result()
+    except BaseException:
+        executor.shutdown(wait=True, cancel_futures=True)
+        raise
+    executor.shutdown(wait=True)
+
+
+def parse_cost_limits(args):
+    limits = {}
+    for item in args.cost_limit:
+        (metric, _, value) = item.partition('=')
+        if metric != 'score' and metric not in cost_metrics:
+            arg_parser.error('unknown cost metric: ' + metric)
+        try:
+            limits[metric] = int(value)
+        except ValueError:
+            arg_parser.error('invalid cost limit: ' + item)
+    return limits
+
+
+def analyze_file(job, options):
+    try:
+        return xib2code.analyze_xib(job[0], options), []
+    except Exception as e:
+        return None, [xib2code.diagnose_failure(job[0], options, e)]
+
+
+def report_costs(files, args, limits):
+    reports = []
+    diagnostics = []
+    for (_, (report, problems)) in run_jobs(analyze_file, files, args.jobs, conversion_options(args)):
+        if problems:
+            # Files that cannot be converted are left out of the ranking
+            diagnostics.extend(problems)
         else:
-            output_path = args.output
-        yield args.input, output_path
+            reports.append(report)
+    ranked = rank_reports(reports)
+    with open(args.cost_report, 'w', newline='') as f:
+        if args.cost_report.endswith('.csv'):
+            write_csv_report(f, ranked, limits)
+        else:
+            write_json_report(f, ranked, limits)
+    within_limits = True
+    for report in ranked:
+        for (metric, value, limit) in limit_violations(report, limits):
+            print('{}: {} is {}, over the limit of {}'.format(report['path'], metric, value, limit), file=sys.stderr)
+            within_limits = False
+    failed = report_diagnostics(args, files, diagnostics)
+    return 0 if within_limits and failed == 0 else 1
+
+
+def validate_file(job, options):
+    return xib2code.validate_xib(job[0], options)
+
+
+def report_diagnostics(args, files, diagnostics):
+    for d in diagnostics:
+        print(format_diagnostic(d), file=sys.stderr)
+    if args.diagnostics is not None:
+        with open(args.diagnostics, 'w') as f:
+            write_diagnostics(f, len(files), diagnostics)
+    failed = len(set([d['file'] for d in diagnostics]))
+    if failed:
+        print('{} of {} files cannot be converted'.format(failed, len(files)), file=sys.stderr)
+    return failed
+
+
+def validate_files(files, args):
+    diagnostics = []
+    for (_, problems) in run_jobs(validate_file, files, args.jobs, conversion_options(args)):
+        diagnostics.extend(problems)
+    if not report_diagnostics(args, files, diagnostics):
+        print('0 of {} files cannot be converted'.format(len(files)), file=sys.stderr)
+    return 0 if not diagnostics else 1
+
+
+def check_files(files, args):
+    up_to_date = True
+    diagnostics = []
+    values = {}
+    for (_, (diff, problems, file_values)) in run_jobs(check_file, files, args.jobs, conversion_options(args),
+                                                       args.image_manifest):
+        if diff:
+            sys.stdout.write(diff)
+            up_to_date = False
+        diagnostics.extend(problems)
+        values.update(file_values or {})
+    if report_diagnostics(args, files, diagnostics):
+        up_to_date = False
+    if args.shared_resources is not None:
+        for (path, text) in shared_module(args, values):
+            diff = xib2code.diff_output(path, text)
+            if diff:
+                sys.stdout.write(diff)
+                up_to_date = False
+    return 0 if up_to_date else 1
+
+
+def report_removed_input(args, manifest, input_path, output_path):
+    if args.prune:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        if os.path.exists(image_manifest_path(output_path)):
+            os.remove(image_manifest_path(output_path))
+        manifest.forget(input_path)
+        print('Removed ' + output_path, file=sys.stderr)
+    else:
+        print(output_path + ': input ' + input_path + ' no longer exists', file=sys.stderr)
+
+
+def watch_files(args, manifest, options, cache):
+    if os.path.isdir(args.input):
+        watcher = make_watcher(args.input, args.recursive, '.xib')
+    else:
+        watcher = make_watcher(os.path.dirname(args.input) or '.', False, os.path.basename(args.input))
+    print('Watching ' + args.input + ' for changes', file=sys.stderr)
+    try:
+        for paths in watch_changes(watcher, args.debounce / 1000):
+            for input_path in sorted(paths):
+                if not is_input_file(args, input_path):
+                    continue
+                output_path = output_path_for(args, input_path)
+                if not os.path.exists(input_path):
+                    report_removed_input(args, manifest, input_path, output_path)
+                    continue
+                if manifest.is_fresh(input_path, output_path):
+                    continue
+                start = time.perf_counter()
+                (input_fingerprint, file_report, problems, _, shared_values) = convert_file(
+                    (input_path, output_path), options, False, args.image_manifest, cache)
+                if problems:
+                    for d in problems:
+                        print(format_diagnostic(d), file=sys.stderr)
+                    continue
+                manifest.record(input_path, output_path, input_fingerprint, shared_values,
+                                image_manifest_path(output_path) if args.image_manifest else None)
+                if shared_values is not None:
+                    write_shared_module(args, manifest.shared_values())
+                elapsed = (time.perf_counter() - start) * 1000
+                if options.elide_defaults:
+                    print('Converted {} in {:.0f} ms, elided {} default assignments'.format(
+                        input_path, elapsed, elided_defaults(file_report)), file=sys.stderr)
+                else:
+                    print('Converted {} in {:.0f} ms'.format(input_path, elapsed), file=sys.stderr)
+            manifest.save()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
 
 
 def run_tool():
     args = arg_parser.parse_args()
-    for (input_path, output_path) in iterate_files(args):
-        xib2code.process_xib(input_path, output_path)
+    if args.jobs < 1:
+        arg_parser.error('--jobs must be positive')
+    try:
+        resolve_backend(args.parser)
+    except ImportError as e:
+        arg_parser.error('--parser ' + args.parser + ': ' + str(e))
+    if args.max_statements is not None and args.max_statements < 1:
+        arg_parser.error('--max-statements must be positive')
+    if args.watch and args.check:
+        arg_parser.error('--watch cannot be combined with --check')
+    if args.cost_report is not None and (args.watch or args.check):
+        arg_parser.error('--cost-report cannot be combined with --watch or --check')
+    if args.validate and (args.watch or args.check or args.cost_report is not None):
+        arg_parser.error('--validate cannot be combined with --watch, --check or --cost-report')
+    if args.output is None and not args.validate and args.cost_report is None:
+        arg_parser.error('the following arguments are required: -o/--output')
+    if args.diagnostics is not None and args.watch:
+        arg_parser.error('--diagnostics cannot be combined with --watch')
+    if args.stream and not args.validate and args.cost_report is None:
+        conflicts = ['--' + name.replace('_', '-') for name in xib2code.streaming_conflicts(conversion_options(args))]
+        if args.image_manifest:
+            conflicts.append('--image-manifest')
+        if conflicts:
+            arg_parser.error('--stream cannot be combined with ' + ', '.join(conflicts))
+    if args.cache_size < 1:
+        arg_parser.error('--cache-size must be positive')
+    if args.cost_limit and args.cost_report is None:
+        arg_parser.error('--cost-limit requires --cost-report')
+    limits = parse_cost_limits(args)
+    files = sorted(iterate_files(args))
+    if args.validate:
+        return validate_files(files, args)
+    if args.check:
+        return check_files(files, args)
+    if args.cost_report is not None:
+        return report_costs(files, args, limits)
+    if args.shared_resources is not None and not args.shared_resources.isidentifier():
+        arg_parser.error('--shared-resources must be a valid class name')
+    manifest = Manifest(manifest_folder(args), xib2code.converter_digest(), output_options(args))
+    manifest.load()
+    if args.force:
+        stale = files
+    else:
+        stale = [job for job in files if not manifest.is_fresh(*job)]
+    options = conversion_options(args)
+    collect_stats = args.stats is not None
+    cache = make_cache(args)
+    cache_hits = Counter()
+    file_reports = []
+    diagnostics = []
+    start = time.perf_counter()
+    try:
+        for ((input_path, output_path), result) in run_jobs(convert_file, stale, args.jobs, options, collect_stats,
+                                                                     args.image_manifest, cache):
+            (input_fingerprint, file_report, problems, cache_hit, shared_values) = result
+            cache_hits[cache_hit] += 1
+            if problems:
+                # Not recorded in the manifest, so that the file is converted again by the next run
+                diagnostics.extend(problems)
+                continue
+            manifest.record(input_path, output_path, input_fingerprint, shared_values,
+                            image_manifest_path(output_path) if args.image_manifest else None)
+            if collect_stats:
+                file_reports.append(file_report)
+            if options.elide_defaults:
+                print('{}: elided {} default assignments'.format(input_path, elided_defaults(file_report)),
+                      file=sys.stderr)
+        for (input_path, output_path) in manifest.removed_inputs():
+            report_removed_input(args, manifest, input_path, output_path)
+        if args.shared_resources is not None:
+            # Up to date files are not converted, their values come from the manifest
+            write_shared_module(args, manifest.shared_values())
+    finally:
+        manifest.save()
+    cache_report = cache and report_cache(args, cache, cache_hits[True], cache_hits[False])
+    if collect_stats:
+        report = batch_report(file_reports, time.perf_counter() - start, len(files) - len(stale))
+        if cache_report is not None:
+            report['cache'] = cache_report
+        with open(args.stats, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    failed = report_diagnostics(args, stale, diagnostics)
+    if args.watch:
+        watch_files(args, manifest, options, cache)
+    return 0 if failed == 0 else 1
 
 if __name__ == '__main__':
-    run_tool()
\ No newline at end of file
+    sys.exit(run_tool())
\ No newline at end of file
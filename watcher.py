@@ -0,0 +1,160 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import time
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+inotify_event = struct.Struct('iIII')
+
+
+def scan_files(folder, recursive, suffix):
+    if recursive:
+        for (dir_path, dir_names, file_names) in os.walk(folder):
+            dir_names[:] = [d for d in dir_names if not d.startswith('.')]
+            for name in file_names:
+                if name.endswith(suffix) and not name.startswith('.'):
+                    yield os.path.join(dir_path, name)
+    else:
+        for entry in os.scandir(folder):
+            if entry.name.endswith(suffix) and not entry.name.startswith('.') and entry.is_file():
+                yield entry.path
+
+
+class InotifyWatcher(object):
+    mask = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    def __init__(self, folder, recursive, suffix):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.folder = folder
+        self.recursive = recursive
+        self.suffix = suffix
+        self.folders = {}
+        self.add_folder(folder)
+
+    def add_folder(self, folder):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(folder), self.mask)
+        if wd < 0:
+            error = ctypes.get_errno()
+            if error == errno.ENOENT:
+                # Removed before we got to it
+                return
+            raise OSError(error, 'inotify_add_watch failed', folder)
+        self.folders[wd] = folder
+        if self.recursive:
+            for entry in os.scandir(folder):
+                if entry.is_dir(follow_symlinks=False) and not entry.name.startswith('.'):
+                    self.add_folder(entry.path)
+
+    def read(self, timeout):
+        (ready, _, _) = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        data = os.read(self.fd, 1 << 16)
+        paths = []
+        offset = 0
+        while offset < len(data):
+            (wd, mask, _, length) = inotify_event.unpack_from(data, offset)
+            offset += inotify_event.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost, treat everything as changed
+                paths.extend(scan_files(self.folder, self.recursive, self.suffix))
+                continue
+            folder = self.folders.get(wd)
+            if folder is None:
+                continue
+            if mask & IN_IGNORED:
+                del self.folders[wd]
+                continue
+            path = os.path.join(folder, name)
+            if mask & IN_ISDIR:
+                if self.recursive and mask & (IN_CREATE | IN_MOVED_TO) and not name.startswith('.'):
+                    self.add_folder(path)
+                    # Files may have been created before the watch was added
+                    paths.extend(scan_files(path, True, self.suffix))
+                continue
+            if name.endswith(self.suffix) and not name.startswith('.'):
+                paths.append(path)
+        return paths
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher(object):
+    def __init__(self, folder, recursive, suffix, interval=0.25):
+        self.folder = folder
+        self.recursive = recursive
+        self.suffix = suffix
+        self.interval = interval
+        self.snapshot = self.scan()
+
+    def scan(self):
+        snapshot = {}
+        for path in scan_files(self.folder, self.recursive, self.suffix):
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            snapshot[path] = (st.st_mtime_ns, st.st_size)
+        return snapshot
+
+    def read(self, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            snapshot = self.scan()
+            paths = [path for (path, state) in snapshot.items() if self.snapshot.get(path) != state]
+            paths.extend(path for path in self.snapshot if path not in snapshot)
+            self.snapshot = snapshot
+            if paths:
+                return paths
+            if deadline is None:
+                time.sleep(self.interval)
+            else:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                time.sleep(min(self.interval, remaining))
+
+    def close(self):
+        pass
+
+
+def make_watcher(folder, recursive, suffix):
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(folder, recursive, suffix)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(folder, recursive, suffix)
+
+
+def watch_changes(watcher, debounce):
+    while True:
+        paths = set(watcher.read(None))
+        if not paths:
+            continue
+        # Editors often save in several steps, wait until the burst is over
+        while True:
+            more = watcher.read(debounce)
+            if not more:
+                break
+            paths.update(more)
+        yield paths
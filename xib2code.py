@@ -1,5 +1,61 @@
 import xml.etree.ElementTree as ET
+import difflib
+import filecmp
+import hashlib
+import io
+import os
+import uuid
 from ViewProcessor import *
+from emitter import emit_document, shared_value_declarations, StreamedBody
+from passes import optimize_document, collect_shared_values, LazySubtreeResolver
+from schema import uikit_classes, uikit_classes_by_tag
+from streaming import StreamReader
+from parsers import parse_document
+from stats import no_stats
+from cost import estimate_cost
+from assets import image_manifest, image_references
+from diagnostics import describe
+
+VERSION = '1.0'
+
+# Sources that determine the generated output. Their digest, rather than VERSION, which is not bumped for every change
+# of the output, tells if an output was generated by this converter.
+converter_sources = ['xib2code.py', 'ViewProcessor.py', 'schema.py', 'decoders.py', 'passes.py', 'emitter.py', 'ir.py',
+                     'assets.py']
+_converter_digest = None
+
+
+def converter_digest() -> str:
+    global _converter_digest
+    if _converter_digest is None:
+        h = hashlib.sha256(VERSION.encode('utf-8'))
+        folder = os.path.dirname(os.path.abspath(__file__))
+        for name in converter_sources:
+            with open(os.path.join(folder, name), 'rb') as f:
+                h.update(b'\0' + name.encode('utf-8') + b'\0' + f.read())
+        _converter_digest = h.hexdigest()
+    return _converter_digest
+
+
+class Options(object):
+    def __init__(self, streaming=False, share_values=None, elide_defaults=False, constraints='add',
+                 lazy_subtrees=False, max_statements=None, shared_resources=None, prefetch_images=False,
+                 parser='auto'):
+        self.streaming = streaming
+        # None, 'local' or 'static'
+        self.share_values = share_values
+        self.elide_defaults = elide_defaults
+        # One of passes.constraint_modes
+        self.constraints = constraints
+        self.lazy_subtrees = lazy_subtrees
+        # Longer methods are split into helper methods
+        self.max_statements = max_statements
+        # Name of the class providing shared colors, fonts and images
+        self.shared_resources = shared_resources
+        # Adds a class method loading the images of the document in the background
+        self.prefetch_images = prefetch_images
+        # One of parsers.parser_backends, streaming always uses ElementTree
+        self.parser = parser
 
 
 class Connection(object):
@@ -38,13 +94,49 @@ class ActionConnection(Connection):
         self.event_type = event_type
 
 
+lazy_label_prefix = 'lazy:'
+lazy_key_path = 'xib2code.lazy'
+
+# Attributes are read in place from the attrib dict of an element. Each handler lists the attributes it reads,
+# and check_attributes() rejects any other ones. Value parsers also accept the 'key' read by parse_value_element().
+document_attributes = frozenset(['type', 'version', 'toolsVersion', 'systemVersion', 'targetRuntime',
+                                 'propertyAccessControl', 'useAutolayout', 'useTraitCollections'])
+placeholder_attributes = frozenset(['placeholderIdentifier', 'id', 'userLabel', 'customClass'])
+custom_object_attributes = frozenset(['id', 'customClass'])
+constraint_attributes = frozenset(['firstItem', 'firstAttribute', 'relation', 'secondItem', 'secondAttribute',
+                                   'constant', 'multiplier', 'id', 'placeholder', 'priority'])
+runtime_attribute_attributes = frozenset(['type', 'keyPath', 'value'])
+fragment_attributes = frozenset(['content'])
+outlet_attributes = frozenset(['id', 'property', 'destination'])
+action_attributes = frozenset(['id', 'selector', 'destination', 'eventType'])
+value_attributes = frozenset(['key'])
+number_attributes = value_attributes | {'value'}
+point_attributes = value_attributes | {'x', 'y'}
+rect_attributes = value_attributes | {'x', 'y', 'width', 'height'}
+inset_attributes = value_attributes | {'minX', 'maxX', 'minY', 'maxY'}
+autoresizing_mask_attributes = value_attributes | {'flexibleMinX', 'widthSizable', 'flexibleMaxX',
+                                                   'flexibleMinY', 'heightSizable', 'flexibleMaxY'}
+white_color_attributes = value_attributes | {'colorSpace', 'alpha', 'white'}
+custom_white_color_attributes = white_color_attributes | {'customColorSpace'}
+rgb_color_attributes = value_attributes | {'colorSpace', 'alpha', 'red', 'green', 'blue'}
+named_font_attributes = value_attributes | {'pointSize', 'name', 'family'}
+system_font_attributes = value_attributes | {'type', 'pointSize', 'weight'}
+font_attributes = value_attributes | {'name', 'size'}
+paragraph_style_attributes = value_attributes | {'alignment', 'lineBreakMode', 'baseWritingDirection'}
+
+
 class Context(object):
-    def __init__(self, output_stream):
+    def __init__(self, options=None):
+        self.options = options or Options()
         self.id_to_var = {}
         self.var_counters = {}
         self.connections = []
         self.connection_collections = {}
-        self.outs = output_stream
+        self.method = Method('setupSubviews')
+        self.document = Document([self.method])
+        # What the passes changed, set by build_document()
+        self.optimizations = {}
+        self.lazy_names = {}
         self.root_view_id = None
         self.doc_version = None
         self.doc_tools_version = None
@@ -54,23 +146,20 @@ class Context(object):
     def process_document(self, doc: ET.Element):
         if doc.tag != 'document':
             raise BadXibFormat()
-        attrs = copy(doc.attrib)
-        doc_type = attrs.pop('type')
+        attrs = doc.attrib
+        doc_type = attrs['type']
         if doc_type != 'com.apple.InterfaceBuilder3.CocoaTouch.XIB':
             raise BadXibFormat()
-        self.doc_version = attrs.pop('version', None)
-        self.doc_tools_version = attrs.pop('toolsVersion', None)
-        self.doc_system_version = attrs.pop('systemVersion', None)
-        self.doc_target_runtime = attrs.pop('targetRuntime', None)
-        ac = attrs.pop('propertyAccessControl', 'none')
+        self.doc_version = attrs.get('version', None)
+        self.doc_tools_version = attrs.get('toolsVersion', None)
+        self.doc_system_version = attrs.get('systemVersion', None)
+        self.doc_target_runtime = attrs.get('targetRuntime', None)
+        ac = attrs.get('propertyAccessControl', 'none')
         if ac != 'none':
             raise UnknownAttributeValue()
-        if attrs.pop('useAutolayout', 'NO') != 'YES':
+        if attrs.get('useAutolayout', 'NO') != 'YES':
             raise UnknownAttributeValue()
-        attrs.pop('useTraitCollections', None)
-        self.check_attributes(attrs)
-
-        self.outs.write('- (void) setupSubviews {\n')
+        self.check_attributes(attrs, document_attributes)
 
         for e in doc:
             if e.tag == 'dependencies':
@@ -85,12 +174,10 @@ class Context(object):
                 # Ignore
                 pass
             else:
-                raise UnknownTag()
+                raise UnknownTag(e)
 
         for c in self.connections:
-            self.write_connection(c)
-
-        self.outs.write('}\n')
+            self.add(self.connection_statement(c))
 
     def process_objects(self, objs):
         self.check_attributes(objs.attrib)
@@ -108,76 +195,71 @@ class Context(object):
                 if obj.tag == 'view':
                     self.process_root_view(obj)
                 else:
-                    raise UnknownTag()
+                    raise UnknownTag(obj)
 
     def process_placeholder(self, p):
-        attrs = copy(p.attrib)
-        kind = attrs.pop('placeholderIdentifier', None)
-        p_id = attrs.pop('id', None)
+        attrs = p.attrib
+        kind = attrs.get('placeholderIdentifier', None)
+        p_id = attrs.get('id', None)
         if kind == 'IBFilesOwner':
             self.id_to_var[p_id] = 'self'
         elif kind == 'IBFirstResponder':
             pass
         else:
             raise UnknownAttributeValue()
-        attrs.pop('userLabel', None)
-        attrs.pop('customClass', None)
-        self.check_attributes(attrs)
+        self.check_attributes(attrs, placeholder_attributes)
 
         for e in p:
             if e.tag == 'connections':
                 self.process_connections(e, parent_id=p_id)
             else:
-                raise UnknownTag()
+                raise UnknownTag(e)
 
     def process_custom_object(self, obj):
-        attrs = copy(obj.attrib)
-        object_id = attrs.pop('id', None)
-        object_class = attrs.pop('customClass')
-        self.check_attributes(attrs)
+        attrs = obj.attrib
+        object_id = attrs.get('id', None)
+        object_class = attrs['customClass']
+        self.check_attributes(attrs, custom_object_attributes)
         name = self.generate_var_name('obj')
         self.id_to_var[object_id] = name
 
-        self.write(object_class + ' *' + name + ' = [[' + object_class + ' alloc] init];')
+        self.add(Alloc(name, object_class, AllocInit(object_class)))
 
         for e in obj:
             if e.tag == 'connections':
                 self.process_connections(e, parent_id=object_id)
             else:
-                raise UnknownTag()
+                raise UnknownTag(e)
 
     def process_root_view(self, view):
-        proc = RootViewProcessor(self)
+        proc = uikit_classes['rootView'].make_processor(self)
         proc.process(view)
 
     def process_subviews(self, subviews, parent_name):
         self.check_attributes(subviews.attrib)
+        body = self.method.body
         for v in subviews:
+            start = len(body)
+            label = v.get('userLabel')
             obj_name = self.process_object(v)
-            self.write('[' + parent_name + ' addSubview:' + obj_name + '];')
+            self.add(AddSubview(parent_name, obj_name))
+            lazy_name = self.lazy_names.pop(obj_name, None)
+            if lazy_name is None and label is not None and label.startswith(lazy_label_prefix):
+                lazy_name = label[len(lazy_label_prefix):]
+            if lazy_name is not None and self.options.lazy_subtrees:
+                # Statements of the subtree are contiguous, and end with adding it to the parent
+                body.append(LazySubtree(lazy_name, obj_name, body[start:]))
+                del body[start:-1]
 
     def process_object(self, obj):
-        if obj.tag == 'view':
-            proc = ViewProcessor(self)
-        elif obj.tag == 'label':
-            proc = LabelProcessor(self)
-        elif obj.tag == 'scrollView':
-            proc = ScrollViewProcessor(self)
-        elif obj.tag == 'button':
-            proc = ButtonProcessor(self)
-        elif obj.tag == 'imageView':
-            proc = ImageViewProcessor(self)
-        elif obj.tag == 'mapView':
-            proc = MapViewProcessor(self)
-        elif obj.tag == 'pageControl':
-            proc = PageControlProcessor(self)
-        else:
-            raise UnknownTag()
-        return proc.process(obj)
+        cls = uikit_classes_by_tag.get(obj.tag)
+        if cls is None:
+            raise UnknownTag(obj)
+        return cls.make_processor(self).process(obj)
 
     def process_view(self, view):
-        attrs = copy(view.attrib)
-        v_id = attrs.pop('id')
+        attrs = view.attrib
+        v_id = attrs['id']
         name = self.generate_var_name('v')
         self.id_to_var[v_id] = name
 
@@ -190,22 +272,22 @@ class Context(object):
                 if c_name is not None:
                     constraint_names.append(c_name)
             else:
-                raise UnknownTag()
-        self.write('[' + parent_name + ' addConstraints:@[' + ', '.join(constraint_names) + ']];')
+                raise UnknownTag(e)
+        self.add(AddConstraints(parent_name, constraint_names))
 
     def process_constraint(self, c, parent_name):
-        attrs = copy(c.attrib)
-        first_id = attrs.pop('firstItem', None)
-        first_attr = attrs.pop('firstAttribute')
-        relation = attrs.pop('relation', 'equal')
-        second_id = attrs.pop('secondItem', None)
-        second_attr = attrs.pop('secondAttribute', None)
-        constant = attrs.pop('constant', '0')
-        multiplier = attrs.pop('multiplier', '1')
-        c_id = attrs.pop('id')
-        is_placeholder = attrs.pop('placeholder', 'NO')
-        priority = attrs.pop('priority', None)
-        self.check_attributes(attrs)
+        attrs = c.attrib
+        first_id = attrs.get('firstItem', None)
+        first_attr = attrs['firstAttribute']
+        relation = attrs.get('relation', 'equal')
+        second_id = attrs.get('secondItem', None)
+        second_attr = attrs.get('secondAttribute', None)
+        constant = attrs.get('constant', '0')
+        multiplier = attrs.get('multiplier', '1')
+        c_id = attrs['id']
+        is_placeholder = attrs.get('placeholder', 'NO')
+        priority = attrs.get('priority', None)
+        self.check_attributes(attrs, constraint_attributes)
         if self.get_bool(is_placeholder):
             return None
 
@@ -217,37 +299,47 @@ class Context(object):
         else:
             first_name = self.id_to_var[first_id]
         if second_id is None:
-            second_name = 'nil'
+            second_name = None
         else:
             second_name = self.id_to_var[second_id]
-        self.write('NSLayoutConstraint *' + c_name + ' = [NSLayoutConstraint constraintWithItem:' + first_name)
-        indent = ' ' * (51 + len(c_name))
-        self.write(indent + ' attribute:' + decode_layout_attribute(first_attr))
-        self.write(indent + ' relatedBy:' + decode_layout_relation(relation))
-        self.write(indent + '    toItem:' + second_name)
-        self.write(indent + ' attribute:' + decode_layout_attribute(second_attr))
-        self.write(indent + 'multiplier:' + multiplier)
-        self.write(indent + '  constant:' + constant + '];')
-
-        if priority is not None:
-            self.write(c_name + '.priority = ' + priority + ';')
-
+        self.add(DefineConstraint(
+            c_name,
+            first=first_name,
+            first_attribute=decode_layout_attribute(first_attr),
+            relation=decode_layout_relation(relation),
+            second=second_name,
+            second_attribute=decode_layout_attribute(second_attr),
+            multiplier=multiplier,
+            constant=constant,
+            priority=priority,
+        ))
         return c_name
 
+    def process_control_state(self, state, proc: ControlProcessor):
+        state_proc = proc.make_state_processor()
+        state_proc.process(state)
+
     def process_user_defined_runtime_attributes(self, attributes, proc):
         self.check_attributes(attributes.attrib)
         for e in attributes:
             if e.tag == 'userDefinedRuntimeAttribute':
                 self.process_user_defined_runtime_attribute(e, proc)
             else:
-                raise UnknownTag()
+                raise UnknownTag(e)
 
     def process_user_defined_runtime_attribute(self, attribute, proc: ViewProcessor):
-        attrs = copy(attribute.attrib)
-        value_type = attrs.pop('type')
-        key_path = decode_string(attrs.pop('keyPath'))
-        value = attrs.pop('value', None)
-        self.check_attributes(attrs)
+        attrs = attribute.attrib
+        value_type = attrs['type']
+        key_path = attrs['keyPath']
+        value = attrs.get('value', None)
+        self.check_attributes(attrs, runtime_attribute_attributes)
+        if key_path == lazy_key_path:
+            # A marker for the converter, not a property of the view
+            if value_type != 'string' or value is None:
+                raise UnknownAttributeValue()
+            self.lazy_names[proc.var_name] = value
+            return
+        key_path = decode_string(key_path)
         if value is not None:
             self.check_elemnts(attribute)
             if value_type == 'string':
@@ -260,65 +352,42 @@ class Context(object):
             val = None
             for e in attribute:
                 if val is not None:
-                    raise UnknownTag()
+                    raise UnknownTag(e)
                 e_val = self.parse_value_element(e, as_object=True)
                 if e_val is None:
-                    raise UnknownTag()
+                    raise UnknownTag(e)
                 (key, val) = e_val
                 if key != 'value':
                     raise UnknownAttributeValue()
-        self.write('[' + proc.var_name + ' setValue:' + val + ' forKeyPath:' + key_path + '];')
+        self.add(SetValueForKeyPath(proc.var_name, key_path, val))
 
     def parse_value_element(self, e, as_object=False):
-        attrs = copy(e.attrib)
-        key = attrs.pop('key', None)
+        attrs = e.attrib
+        key = attrs.get('key', None)
         if key is None:
             return None
-        elif e.tag == 'integer':
-            return key, self.parse_number(attrs, e, as_object)
-        elif e.tag == 'real':
-            return key, self.parse_number(attrs, e, as_object)
-        elif e.tag == 'point':
-            return key, self.parse_point(attrs, e, as_object)
-        elif e.tag == 'rect':
-            return key, self.parse_rect(attrs, e, as_object)
-        elif e.tag == 'inset':
-            return key, self.parse_inset(attrs, e, as_object)
-        elif e.tag == 'autoresizingMask':
-            return key, self.parse_autoresizing_mask(attrs, e, as_object)
-        elif e.tag == 'nil':
-            return key, self.parse_nil(attrs, e)
-        elif e.tag == 'string':
-            return key, self.parse_string(attrs, e)
-        elif e.tag == 'color':
-            return key, self.parse_color(attrs, e)
-        elif e.tag == 'fontDescription':
-            return key, self.parse_font_description(attrs, e)
-        elif e.tag == 'font':
-            return key, self.parse_font(attrs, e)
-        elif e.tag == 'paragraphStyle':
-            return key, self.parse_paragraph_style(attrs, e)
-        elif e.tag == 'attributedString':
-            return key, self.parse_attributed_string(attrs, e)
-        elif e.tag in { 'freeformSimulatedSizeMetrics' }:
-            self.check_attributes(attrs)
-            self.check_elemnts(e)
-            return key, e.tag
-        else:
+        parser = self.value_parsers.get(e.tag)
+        if parser is None:
             return None
+        return key, parser(self, attrs, e, as_object)
+
+    def parse_tag_name(self, attrs: dict, e: ET.Element, as_object=False) -> str:
+        self.check_attributes(attrs, value_attributes)
+        self.check_elemnts(e)
+        return e.tag
 
     def parse_number(self, attrs: dict, e: ET.Element, as_object: bool) -> str:
-        value = attrs.pop('value')
-        self.check_attributes(attrs)
+        value = attrs['value']
+        self.check_attributes(attrs, number_attributes)
         self.check_elemnts(e)
         if as_object:
             value = '@' + value
         return value
 
     def parse_point(self, attrs: dict, e: ET.Element, as_object: bool) -> str:
-        x = attrs.pop('x')
-        y = attrs.pop('y')
-        self.check_attributes(attrs)
+        x = attrs['x']
+        y = attrs['y']
+        self.check_attributes(attrs, point_attributes)
         self.check_elemnts(e)
         value = 'CGPointMake(' + ', '.join([x, y]) + ')'
         if as_object:
@@ -326,11 +395,11 @@ class Context(object):
         return value
 
     def parse_rect(self, attrs: dict, e: ET.Element, as_object: bool) -> str:
-        x = attrs.pop('x')
-        y = attrs.pop('y')
-        w = attrs.pop('width')
-        h = attrs.pop('height')
-        self.check_attributes(attrs)
+        x = attrs['x']
+        y = attrs['y']
+        w = attrs['width']
+        h = attrs['height']
+        self.check_attributes(attrs, rect_attributes)
         self.check_elemnts(e)
         value = 'CGRectMake(' + ', '.join([x, y, w, h]) + ')'
         if as_object:
@@ -338,11 +407,11 @@ class Context(object):
         return value
 
     def parse_inset(self, attrs: dict, e: ET.Element, as_object: bool) -> str:
-        left = attrs.pop('minX')
-        right = attrs.pop('maxX')
-        top = attrs.pop('minY')
-        bottom = attrs.pop('maxY')
-        self.check_attributes(attrs)
+        left = attrs['minX']
+        right = attrs['maxX']
+        top = attrs['minY']
+        bottom = attrs['maxY']
+        self.check_attributes(attrs, inset_attributes)
         self.check_elemnts(e)
         value = 'UIEdgeInsetsMake(' + ', '.join([top, left, bottom, right]) + ')'
         if as_object:
@@ -351,19 +420,19 @@ class Context(object):
 
     def parse_autoresizing_mask(self, attrs: dict, e: ET.Element, as_object: bool) -> str:
         flags = []
-        if self.get_bool(attrs.pop('flexibleMinX', 'NO')):
+        if self.get_bool(attrs.get('flexibleMinX', 'NO')):
             flags.append('UIViewAutoresizingFlexibleLeftMargin')
-        if self.get_bool(attrs.pop('widthSizable', 'NO')):
+        if self.get_bool(attrs.get('widthSizable', 'NO')):
             flags.append('UIViewAutoresizingFlexibleWidth')
-        if self.get_bool(attrs.pop('flexibleMaxX', 'NO')):
+        if self.get_bool(attrs.get('flexibleMaxX', 'NO')):
             flags.append('UIViewAutoresizingFlexibleRightMargin')
-        if self.get_bool(attrs.pop('flexibleMinY', 'NO')):
+        if self.get_bool(attrs.get('flexibleMinY', 'NO')):
             flags.append('UIViewAutoresizingFlexibleTopMargin')
-        if self.get_bool(attrs.pop('heightSizable', 'NO')):
+        if self.get_bool(attrs.get('heightSizable', 'NO')):
             flags.append('UIViewAutoresizingFlexibleHeight')
-        if self.get_bool(attrs.pop('flexibleMaxY', 'NO')):
+        if self.get_bool(attrs.get('flexibleMaxY', 'NO')):
             flags.append('UIViewAutoresizingFlexibleBottomMargin')
-        self.check_attributes(attrs)
+        self.check_attributes(attrs, autoresizing_mask_attributes)
         self.check_elemnts(e)
         if len(flags) == 0:
             value = 'UIViewAutoresizingNone'
@@ -373,118 +442,132 @@ class Context(object):
             value = '@(' + value + ')'
         return value
 
-    def parse_nil(self, attrs: dict, e: ET.Element) -> str:
-        self.check_attributes(attrs)
+    def parse_nil(self, attrs: dict, e: ET.Element, as_object=False) -> str:
+        self.check_attributes(attrs, value_attributes)
         self.check_elemnts(e)
         return 'nil'
 
-    def parse_string(self, attrs: dict, e: ET.Element) -> str:
-        self.check_attributes(attrs)
+    def parse_string(self, attrs: dict, e: ET.Element, as_object=False) -> str:
+        self.check_attributes(attrs, value_attributes)
         self.check_elemnts(e)
         return decode_string(e.text)
 
-    def parse_color(self, attrs: dict, e: ET.Element) -> str:
-        color_space = attrs.pop('colorSpace', None)
+    def parse_color(self, attrs: dict, e: ET.Element, as_object=False) -> ColorExpr:
+        color_space = attrs.get('colorSpace', None)
         if color_space is None:
-            system_color = attrs.pop('cocoaTouchSystemColor')
-            return '[UIColor ' + system_color + ']'
+            system_color = attrs['cocoaTouchSystemColor']
+            return ColorExpr('system', (system_color,))
         elif color_space == 'custom':
-            custom_color_space = attrs.pop('customColorSpace')
+            custom_color_space = attrs['customColorSpace']
             if custom_color_space == 'calibratedWhite':
-                return self.parse_white_color(attrs, e)
+                return self.parse_white_color(attrs, e, custom_white_color_attributes)
             else:
                 raise UnknownAttributeValue()
         elif color_space == 'calibratedWhite':
-            return self.parse_white_color(attrs, e)
+            return self.parse_white_color(attrs, e, white_color_attributes)
         elif color_space == 'calibratedRGB':
             return self.parse_rgb_color(attrs, e)
         else:
             raise UnknownAttributeValue()
 
-    def parse_white_color(self, attrs: dict, e: ET.Element) -> str:
-        alpha = attrs.pop('alpha', '1')
-        white = attrs.pop('white')
-        self.check_attributes(attrs)
+    def parse_white_color(self, attrs: dict, e: ET.Element, consumed) -> ColorExpr:
+        alpha = attrs.get('alpha', '1')
+        white = attrs['white']
+        self.check_attributes(attrs, consumed)
         self.check_elemnts(e)
-        return '[UIColor colorWithWhite:' + white + ' alpha:' + alpha + ']'
-
-    def parse_rgb_color(self, attrs: dict, e: ET.Element) -> str:
-        alpha = attrs.pop('alpha', '1')
-        red = attrs.pop('red')
-        green = attrs.pop('green')
-        blue = attrs.pop('blue')
-        self.check_attributes(attrs)
+        return ColorExpr('white', (white, alpha))
+
+    def parse_rgb_color(self, attrs: dict, e: ET.Element) -> ColorExpr:
+        alpha = attrs.get('alpha', '1')
+        red = attrs['red']
+        green = attrs['green']
+        blue = attrs['blue']
+        self.check_attributes(attrs, rgb_color_attributes)
         self.check_elemnts(e)
-        return '[UIColor colorWithRed:' + red + ' green:' + green + ' blue:' + blue + ' alpha:' + alpha + ']'
+        return ColorExpr('rgb', (red, green, blue, alpha))
 
-    def parse_font_description(self, attrs: dict, e: ET.Element) -> str:
-        font_type = attrs.pop('type', None)
-        font_size = attrs.pop('pointSize')
+    def parse_font_description(self, attrs: dict, e: ET.Element, as_object=False) -> FontExpr:
+        font_type = attrs.get('type', None)
+        font_size = attrs['pointSize']
         if font_type is None:
-            font_name = attrs.pop('name')
-            font_family = attrs.pop('family')
+            font_name = attrs['name']
+            font_family = attrs['family']
             if font_family != font_name:
                 raise UnknownAttributeValue()
-            self.check_attributes(attrs)
+            self.check_attributes(attrs, named_font_attributes)
             self.check_elemnts(e)
-            return '[UIFont fontWithName: ' + decode_string(font_name) + ' size:' + font_size + ']'
+            return FontExpr('named', (font_name, font_size))
         elif font_type == 'system':
-            font_weight = attrs.pop('weight', None)
-            self.check_attributes(attrs)
+            font_weight = attrs.get('weight', None)
+            self.check_attributes(attrs, system_font_attributes)
             self.check_elemnts(e)
             if font_weight is None:
-                return '[UIFont systemFontOfSize:' + font_size + ']'
+                return FontExpr('system', (font_size,))
             else:
                 font_weight = decode_font_weight(font_weight)
-                return '[UIFont systemFontOfSize:' + font_size + ' weight:' + font_weight + ']'
+                return FontExpr('systemWeight', (font_size, font_weight))
         else:
             raise UnknownAttributeValue()
 
-    def parse_font(self, attrs: dict, e: ET.Element) -> str:
-        font_name = attrs.pop('name')
-        font_size = attrs.pop('size')
-        self.check_attributes(attrs)
+    def parse_font(self, attrs: dict, e: ET.Element, as_object=False) -> FontExpr:
+        font_name = attrs['name']
+        font_size = attrs['size']
+        self.check_attributes(attrs, font_attributes)
         self.check_elemnts(e)
-        return '[UIFont fontWithName: ' + decode_string(font_name) + ' size:' + font_size + ']'
+        return FontExpr('named', (font_name, font_size))
 
-    def parse_paragraph_style(self, attrs: dict, e: ET.Element) -> str:
-        alignment = decode_text_alignment(attrs.pop('alignment'))
-        line_break_mode = decode_line_break_mode(attrs.pop('lineBreakMode'))
-        base_writing_direction = decode_writing_direction(attrs.pop('baseWritingDirection'))
-        self.check_attributes(attrs)
+    def parse_paragraph_style(self, attrs: dict, e: ET.Element, as_object=False) -> VarRef:
+        alignment = decode_text_alignment(attrs['alignment'])
+        line_break_mode = decode_line_break_mode(attrs['lineBreakMode'])
+        base_writing_direction = decode_writing_direction(attrs['baseWritingDirection'])
+        self.check_attributes(attrs, paragraph_style_attributes)
         self.check_elemnts(e)
         p_name = self.generate_var_name('p')
-        self.write('NSMutableParagraphStyle *' + p_name + ' = [[NSParagraphStyle defaultParagraphStyle] mutableCopy];')
-        self.write(p_name + '.alignment = ' + alignment + ';')
-        self.write(p_name + '.lineBreakMode = ' + line_break_mode + ';')
-        self.write(p_name + '.baseWritingDirection = ' + base_writing_direction + ';')
-        return p_name
-
-    def parse_attributed_string(self, attrs: dict, s: ET.Element) -> str:
-        self.check_attributes(attrs)
+        self.add(DefineParagraphStyle(p_name, alignment, line_break_mode, base_writing_direction))
+        return VarRef(p_name)
+
+    def parse_attributed_string(self, attrs: dict, s: ET.Element, as_object=False):
+        self.check_attributes(attrs, value_attributes)
         fragments = []
         for e in s:
             if e.tag == 'fragment':
                 fragments.append(e)
             else:
-                raise UnknownTag()
+                raise UnknownTag(e)
         if len(fragments) == 0:
             return '[[NSAttributedString alloc] init]'
         if len(fragments) == 1:
             return self.process_attributed_string_fragment(fragments[0])
         s_name = self.generate_var_name('s')
-        self.write('NSMutableAttributedString *' + s_name + ' = [[NSMutableAttributedString alloc] init];')
+        self.add(DefineAttributedString(s_name))
         for e in fragments:
-            fragment_str = self.process_attributed_string_fragment(e)
-            self.write('[' + s_name + ' appendAttributedString:' + fragment_str + '];')
-        return s_name
+            fragment = self.process_attributed_string_fragment(e)
+            self.add(AppendAttributedString(s_name, fragment))
+        return VarRef(s_name)
+
+    value_parsers = {
+        'integer': parse_number,
+        'real': parse_number,
+        'point': parse_point,
+        'rect': parse_rect,
+        'inset': parse_inset,
+        'autoresizingMask': parse_autoresizing_mask,
+        'nil': parse_nil,
+        'string': parse_string,
+        'color': parse_color,
+        'fontDescription': parse_font_description,
+        'font': parse_font,
+        'paragraphStyle': parse_paragraph_style,
+        'attributedString': parse_attributed_string,
+        'freeformSimulatedSizeMetrics': parse_tag_name,
+    }
 
     def process_attributed_string_fragment(self, fragment: ET.Element):
-        attrs = copy(fragment.attrib)
-        content = attrs.pop('content', None)
+        attrs = fragment.attrib
+        content = attrs.get('content', None)
         if content is not None:
             content = decode_string(content)
-        self.check_attributes(attrs)
+        self.check_attributes(attrs, fragment_attributes)
         attrs_dict = None
         for e in fragment:
             if e.tag == 'string' and content is None:
@@ -497,10 +580,10 @@ class Context(object):
             elif e.tag == 'attributes':
                 attrs_dict = self.process_attributed_string_fragment_attributes(e)
             else:
-                raise UnknownTag()
+                raise UnknownTag(e)
         if attrs_dict is None:
             raise UnknownTag()
-        return '[[NSAttributedString alloc] initWithString:' + content + ' attributes:' + attrs_dict + ']'
+        return AttributedFragmentExpr(content, attrs_dict)
 
     def process_attributed_string_fragment_attributes(self, attributes: ET.Element):
         self.check_attributes(attributes.attrib)
@@ -508,18 +591,13 @@ class Context(object):
         for e in attributes:
             e_val = self.parse_value_element(e)
             if e_val is None:
-                raise UnknownTag()
+                raise UnknownTag(e)
             (key, value) = e_val
             attribute_name = decode_string_attribute_name(key)
-            attributes_info.append(attribute_name + ' : ' + value)
+            attributes_info.append((attribute_name, value))
         dict_name = self.generate_var_name('a')
-        k = len(attributes_info)
-        self.write('NSDictionary *' + dict_name + ' = @{')
-        for attribute_pair in attributes_info:
-            self.write('    ' + attribute_pair + (',' if k > 1 else ''))
-            k -= 1
-        self.write('};')
-        return dict_name
+        self.add(DefineAttributes(dict_name, attributes_info))
+        return VarRef(dict_name)
 
     def get_bool(self, v):
         if v == 'YES':
@@ -538,83 +616,62 @@ class Context(object):
             elif c.tag == 'action':
                 self.process_action(c, parent_id)
             else:
-                raise UnknownTag()
+                raise UnknownTag(c)
 
     def process_outlet(self, outlet, parent_id):
-        attrs = copy(outlet.attrib)
-        attrs.pop('id')
+        attrs = outlet.attrib
         c = OutletConnection(
             parent_id=parent_id,
-            property_name=attrs.pop('property'),
-            destination_id=attrs.pop('destination'),
+            property_name=attrs['property'],
+            destination_id=attrs['destination'],
         )
-        self.check_attributes(attrs)
+        self.check_attributes(attrs, outlet_attributes)
         self.check_elemnts(outlet)
         self.connections.append(c)
 
     def process_outlet_collection(self, outlet, parent_id):
-        attrs = copy(outlet.attrib)
-        attrs.pop('id')
+        attrs = outlet.attrib
         OutletCollectionConnection.add_to_collection(
             self.connections,
             self.connection_collections,
             parent_id=parent_id,
-            property_name=attrs.pop('property'),
-            destination_id=attrs.pop('destination'),
+            property_name=attrs['property'],
+            destination_id=attrs['destination'],
         )
-        self.check_attributes(attrs)
+        self.check_attributes(attrs, outlet_attributes)
         self.check_elemnts(outlet)
 
     def process_action(self, action, parent_id):
-        attrs = copy(action.attrib)
-        attrs.pop('id')
+        attrs = action.attrib
         c = ActionConnection(
             parent_id=parent_id,
-            selector=attrs.pop('selector'),
-            destination_id=attrs.pop('destination'),
-            event_type=decode_control_event(attrs.pop('eventType')),
+            selector=attrs['selector'],
+            destination_id=attrs['destination'],
+            event_type=decode_control_event(attrs['eventType']),
         )
-        self.check_attributes(attrs)
+        self.check_attributes(attrs, action_attributes)
         self.check_elemnts(action)
         self.connections.append(c)
 
-    def write_connection(self, c: Connection):
-        s = ''
+    def connection_statement(self, c: Connection) -> Stmt:
         host_var_name = self.id_to_var[c.parent_id]
-        if isinstance(c, (OutletConnection, OutletCollectionConnection)):
-            if c.property_name[0] == '_':
-                if host_var_name != 'self':
-                    s += host_var_name
-                    s += '->'
-            else:
-                s += host_var_name
-                s += '.'
-            s += c.property_name
-            s += ' = '
-            if isinstance(c, OutletConnection):
-                destination_name = self.id_to_var[c.destination_id]
-                s += destination_name
-            else:
-                destination_names = [self.id_to_var[d_id] for d_id in c.destination_ids]
-                s += '@[' + ', '.join(destination_names) + ']'
-            s += ';'
-        elif isinstance(c, ActionConnection):
+        if isinstance(c, OutletConnection):
+            destination = VarRef(self.id_to_var[c.destination_id])
+            return SetOutlet(host_var_name, c.property_name, destination)
+        elif isinstance(c, OutletCollectionConnection):
+            destinations = ArrayExpr([VarRef(self.id_to_var[d_id]) for d_id in c.destination_ids])
+            return SetOutlet(host_var_name, c.property_name, destinations)
+        else:
             destination_name = self.id_to_var[c.destination_id]
-            s += '['
-            s += host_var_name
-            s += ' addTarget: ' + destination_name
-            s += ' action:@selector(' + c.selector + ')'
-            s += ' forControlEvents:' + c.event_type
-            s += '];'
-        self.write(s)
-
-    def check_attributes(self, attrs):
-        if len(attrs):
-            raise UnknownAttribute()
+            return AddTarget(host_var_name, destination_name, c.selector, c.event_type)
+
+    def check_attributes(self, attrs, consumed=frozenset()):
+        if not consumed.issuperset(attrs):
+            raise UnknownAttribute(', '.join([key for key in attrs if key not in consumed]))
 
     def check_elemnts(self, node):
         for e in node:
-            raise UnknownTag()
+            raise UnknownTag(e)
 
     def generate_var_name(self, prefix):
         n = self.var_counters.get(prefix, 0)
@@ -622,15 +679,321 @@ class Context(object):
         self.var_counters[prefix] = n
         return prefix + str(n)
 
-    def write(self, s: str):
-        self.outs.write('    ')
-        self.outs.write(s)
-        self.outs.write('\n')
+    def add(self, stmt: Stmt):
+        self.method.body.append(stmt)
+
+    def output(self) -> str:
+        return emit_document(self.document)
+
+
+class InstrumentedContext(Context):
+    counted_methods = [
+        'process_document',
+        'process_objects',
+        'process_placeholder',
+        'process_custom_object',
+        'process_root_view',
+        'process_subviews',
+        'process_object',
+        'process_constraints',
+        'process_constraint',
+        'process_control_state',
+        'process_user_defined_runtime_attributes',
+        'process_user_defined_runtime_attribute',
+        'parse_value_element',
+        'process_attributed_string_fragment',
+        'process_attributed_string_fragment_attributes',
+        'process_connections',
+        'process_outlet',
+        'process_outlet_collection',
+        'process_action',
+    ]
+
+    def __init__(self, options, stats):
+        Context.__init__(self, options)
+        self.stats = stats
+
+    def generate_var_name(self, prefix):
+        self.stats.variables[prefix] += 1
+        return Context.generate_var_name(self, prefix)
+
+    def add(self, stmt: Stmt):
+        self.stats.statements += 1
+        Context.add(self, stmt)
+
 
+def counting_element(method):
+    def wrapper(self, e, *args, **kwargs):
+        self.stats.count_element(e)
+        return method(self, e, *args, **kwargs)
+    return wrapper
 
-def process_xib(xib_file, output_file):
-    tree = ET.parse(xib_file)
-    with open(output_file, 'w') as f:
-        ctx = Context(f)
-        ctx.process_document(tree.getroot())
 
+# Plain Context stays free of any instrumentation
+for name in InstrumentedContext.counted_methods:
+    setattr(InstrumentedContext, name, counting_element(getattr(Context, name)))
+
+
+class LocatingContext(Context):
+    # Records in errors the elements they propagate through, to report where a conversion fails
+    pass
+
+
+def locating_element(method):
+    def wrapper(self, e, *args, **kwargs):
+        try:
+            return method(self, e, *args, **kwargs)
+        except Exception as error:
+            add_location(error, e)
+            raise
+    return wrapper
+
+
+for name in InstrumentedContext.counted_methods:
+    setattr(LocatingContext, name, locating_element(getattr(Context, name)))
+
+
+class ValidationContext(Context):
+    # Runs all checks of conversion, without keeping the generated statements
+    def add(self, stmt):
+        pass
+
+
+def process_source(ctx: Context, xib_file, options, stats):
+    if options.streaming:
+        # Parsing happens on demand, and is accounted for in processing
+        with stats.stage('process'):
+            ctx.process_document(StreamReader(xib_file).read_root())
+    else:
+        with stats.stage('parse'):
+            root = parse_document(xib_file, options.parser)
+        with stats.stage('process'):
+            ctx.process_document(root)
+
+
+def make_context(options, stats) -> Context:
+    if stats is None or not stats.instrumented:
+        return Context(options)
+    return InstrumentedContext(options, stats)
+
+
+def build_document(xib_file, options=None, stats=None) -> Context:
+    if options is None:
+        options = Options()
+    ctx = make_context(options, stats)
+    stats = stats or no_stats
+    process_source(ctx, xib_file, options, stats)
+    with stats.stage('optimize'):
+        ctx.optimizations = optimize_document(ctx.document, options)
+        stats.record_optimizations(ctx.optimizations)
+    return ctx
+
+
+# Options that need passes over the whole document, so streaming would have to keep all of it in memory
+whole_document_options = ['share_values', 'elide_defaults', 'lazy_subtrees', 'max_statements', 'shared_resources',
+                          'prefetch_images']
+
+
+def streaming_conflicts(options) -> list:
+    conflicts = [name for name in whole_document_options if getattr(options, name)]
+    if options.constraints != 'add':
+        conflicts.append('constraints')
+    return conflicts
+
+
+def stream_xib(xib_file, f, options, stats=None):
+    # Writes code to f as it is generated, so that only the current branch of the document is kept in memory
+    conflicts = streaming_conflicts(options)
+    if conflicts:
+        raise ValueError('streaming cannot be combined with: ' + ', '.join(conflicts))
+    ctx = make_context(options, stats)
+    body = StreamedBody(ctx.method, f)
+    ctx.method.body = body
+    process_source(ctx, xib_file, options, stats or no_stats)
+    body.close()
+
+
+def convert_xib(xib_file, options=None, stats=None) -> str:
+    if options is not None and options.streaming:
+        out = io.StringIO()
+        stream_xib(xib_file, out, options, stats)
+        return out.getvalue()
+    ctx = build_document(xib_file, options, stats)
+    with (stats or no_stats).stage('emit'):
+        return ctx.output()
+
+
+def shared_values_of_xib(xib_file, options) -> dict:
+    return shared_value_declarations(collect_shared_values(build_document(xib_file, options).document))
+
+
+def diagnose_failure(xib_file, options, error) -> dict:
+    # Conversion keeps no track of elements, so the file is processed once more to find where error happened.
+    # The expat backend knows source lines and columns of all elements.
+    located = error
+    if isinstance(xib_file, str) or hasattr(xib_file, 'seek'):
+        try:
+            if not isinstance(xib_file, str):
+                xib_file.seek(0)
+            LocatingContext(options).process_document(parse_document(xib_file, 'expat'))
+        except Exception as e:
+            if type(e) is type(error):
+                located = e
+    return describe(located, xib_file)
+
+
+def validate_xib(xib_file, options=None) -> list:
+    # Problems that would make the conversion fail, as diagnostics.describe() dictionaries
+    if options is None:
+        options = Options()
+    try:
+        if options.lazy_subtrees:
+            # Lazy subtrees are checked by the pass moving statements into them, which needs the statements
+            ctx = Context(options)
+            process_source(ctx, xib_file, options, no_stats)
+            for method in ctx.document.methods:
+                LazySubtreeResolver(method).run()
+        else:
+            process_source(ValidationContext(options), xib_file, options, no_stats)
+    except Exception as e:
+        return [diagnose_failure(xib_file, options, e)]
+    return []
+
+
+def analyze_xib(xib_file, options=None) -> dict:
+    report = estimate_cost(build_document(xib_file, options).document)
+    report['path'] = xib_file
+    return report
+
+
+def read_output(output_file):
+    try:
+        with open(output_file, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def write_if_changed(output_file, text: str) -> bool:
+    data = text.encode('utf-8')
+    if read_output(output_file) == data:
+        return False
+    tmp_path = output_file + '.' + uuid.uuid4().hex + '.tmp'
+    try:
+        with open(tmp_path, 'xb') as f:
+            f.write(data)
+        os.replace(tmp_path, output_file)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return True
+
+
+def write_streamed_if_changed(output_file, write) -> bool:
+    # Like write_if_changed(), for text written to a file piece by piece by write(f)
+    tmp_path = output_file + '.' + uuid.uuid4().hex + '.tmp'
+    try:
+        with open(tmp_path, 'x', encoding='utf-8', newline='') as f:
+            write(f)
+        if os.path.exists(output_file) and filecmp.cmp(tmp_path, output_file, shallow=False):
+            os.unlink(tmp_path)
+            return False
+        os.replace(tmp_path, output_file)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return True
+
+
+def xib_results(xib_file, options=None, stats=None, images=False) -> dict:
+    # Everything generated for xib_file that does not depend on its path, as stored by cache.OutputCache
+    ctx = build_document(xib_file, options, stats)
+    with (stats or no_stats).stage('emit'):
+        results = {'code': ctx.output(), 'optimizations': dict(ctx.optimizations)}
+        if images:
+            results['images'] = image_references(ctx.document)
+        if ctx.options.shared_resources is not None:
+            # The shared module is written from the values of all files
+            results['shared'] = shared_value_declarations(collect_shared_values(ctx.document))
+    return results
+
+
+def cache_options(options, images) -> dict:
+    # Options that change the results. The parser and streaming do not.
+    values = {name: value for (name, value) in vars(options or Options()).items()
+              if name not in ('streaming', 'parser')}
+    values['images'] = images
+    return values
+
+
+def cached_xib_results(cache, xib_file, options=None, stats=None, images=False) -> dict:
+    with open(xib_file, 'rb') as f:
+        data = f.read()
+    key = cache.key(data, converter_digest(), cache_options(options, images))
+    required = ['code', 'optimizations'] + (['images'] if images else [])
+    if options is not None and options.shared_resources is not None:
+        required.append('shared')
+    results = cache.load(key, required)
+    if results is None:
+        results = xib_results(io.BytesIO(data), options, stats, images)
+        cache.store(key, results)
+    elif stats is not None:
+        stats.record_optimizations(results['optimizations'])
+    return results
+
+
+def conversion_results(xib_file, options=None, stats=None, images=False, cache=None) -> dict:
+    if cache is None:
+        return xib_results(xib_file, options, stats, images)
+    return cached_xib_results(cache, xib_file, options, stats, images)
+
+
+def results_outputs(xib_file, output_file, results, image_manifest_file=None) -> list:
+    # (path, text) pairs of all files generated for xib_file
+    outputs = [(output_file, results['code'])]
+    if image_manifest_file is not None:
+        outputs.append((image_manifest_file, image_manifest(xib_file, results['images'])))
+    return outputs
+
+
+def xib_outputs(xib_file, output_file, options=None, stats=None, image_manifest_file=None, cache=None) -> list:
+    results = conversion_results(xib_file, options, stats, image_manifest_file is not None, cache)
+    return results_outputs(xib_file, output_file, results, image_manifest_file)
+
+
+def write_outputs(outputs, stats=None) -> bool:
+    with (stats or no_stats).stage('write'):
+        changed = [write_if_changed(path, text) for (path, text) in outputs]
+    return any(changed)
+
+
+def process_xib(xib_file, output_file, options=None, stats=None, image_manifest_file=None, cache=None) -> bool:
+    if options is not None and options.streaming:
+        # Results of streaming are never kept in memory, so they are not cached
+        if image_manifest_file is not None:
+            raise ValueError('streaming cannot be combined with an image manifest')
+        return write_streamed_if_changed(output_file, lambda f: stream_xib(xib_file, f, options, stats))
+    return write_outputs(xib_outputs(xib_file, output_file, options, stats, image_manifest_file, cache), stats)
+
+
+def diff_output(output_file, expected: str) -> str:
+    actual = read_output(output_file)
+    if actual == expected.encode('utf-8'):
+        return ''
+    if actual is None:
+        actual_lines = []
+    else:
+        actual_lines = actual.decode('utf-8', errors='replace').splitlines(keepends=True)
+    diff = difflib.unified_diff(actual_lines, expected.splitlines(keepends=True),
+                                fromfile=output_file, tofile=output_file + ' (expected)')
+    return ''.join(diff)
+
+
+def diff_outputs(outputs) -> str:
+    return ''.join([diff_output(path, text) for (path, text) in outputs])
+
+
+def check_xib(xib_file, output_file, options=None, image_manifest_file=None) -> str:
+    return diff_outputs(xib_outputs(xib_file, output_file, options, image_manifest_file=image_manifest_file))
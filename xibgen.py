@@ -0,0 +1,316 @@
+import argparse
+import random
+from xml.sax.saxutils import quoteattr
+
+arg_parser = argparse.ArgumentParser(description='Generate synthetic XIB files for benchmarking')
+arg_parser.add_argument('-o', '--output', metavar='OUT', required=True,
+                        help='Output file')
+arg_parser.add_argument('-n', '--views', metavar='N', type=int, default=100,
+                        help='Number of views, not counting the root view')
+arg_parser.add_argument('-d', '--depth', metavar='N', type=int, default=4,
+                        help='Maximum nesting depth of subviews')
+arg_parser.add_argument('-c', '--constraints', metavar='K', type=float, default=2.0,
+                        help='Average number of constraints per view')
+arg_parser.add_argument('-f', '--fragments', metavar='N', type=int, default=2,
+                        help='Number of fragments in attributed strings, 0 to use plain text only')
+arg_parser.add_argument('-b', '--button-states', metavar='N', type=int, default=2,
+                        help='Number of states with a title per button, up to 4')
+arg_parser.add_argument('-l', '--outlets', metavar='N', type=int, default=10,
+                        help='Number of outlets of the file owner')
+arg_parser.add_argument('-m', '--missing-assets', metavar='P', type=float, default=0.0,
+                        help='Fraction of custom fonts and images naming assets that do not exist, for which UIKit '
+                             'returns nil at runtime')
+arg_parser.add_argument('--seed', metavar='N', type=int, default=0,
+                        help='Random seed')
+
+leaf_tags = ['label', 'label', 'label', 'button', 'button', 'imageView', 'pageControl', 'switch', 'mapView']
+container_tags = ['view', 'view', 'view', 'scrollView']
+state_names = ['normal', 'highlighted', 'selected', 'disabled']
+edge_attributes = ['leading', 'trailing', 'top', 'bottom', 'centerX', 'centerY']
+size_attributes = ['width', 'height']
+relations = [None, None, None, 'greaterThanOrEqual', 'lessThanOrEqual']
+words = ['Lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing', 'elit', '"sed"', "don't",
+         'eiusmod', 'tempor', 'incididunt', 'labore', 'dolore', 'magna', 'aliqua']
+
+
+class Node(object):
+    def __init__(self, xib_id, tag, depth):
+        self.xib_id = xib_id
+        self.tag = tag
+        self.depth = depth
+        self.children = []
+        self.constraints = []
+
+
+class XibGenerator(object):
+    def __init__(self, views=100, depth=4, constraints=2.0, fragments=2, button_states=2, outlets=10,
+                 missing_assets=0.0, seed=0):
+        self.views = views
+        self.depth = max(depth, 1)
+        self.constraints = constraints
+        self.fragments = fragments
+        self.button_states = min(button_states, len(state_names))
+        self.outlets = outlets
+        self.missing_assets = missing_assets
+        self.random = random.Random(seed)
+        self.next_id = 0
+        self.lines = []
+        self.indent = 0
+
+    def new_id(self):
+        self.next_id += 1
+        return 'g{:05d}'.format(self.next_id)
+
+    def build_tree(self):
+        root = Node(self.new_id(), 'view', 0)
+        containers = [root]
+        nodes = []
+        # A chain of containers guarantees the requested depth
+        parent = root
+        while parent.depth + 1 < self.depth and len(nodes) < self.views:
+            node = Node(self.new_id(), self.random.choice(container_tags), parent.depth + 1)
+            parent.children.append(node)
+            nodes.append(node)
+            containers.append(node)
+            parent = node
+        while len(nodes) < self.views:
+            parent = self.random.choice(containers)
+            if parent.depth + 1 < self.depth and self.random.random() < 0.25:
+                node = Node(self.new_id(), self.random.choice(container_tags), parent.depth + 1)
+                containers.append(node)
+            else:
+                node = Node(self.new_id(), self.random.choice(leaf_tags), parent.depth + 1)
+            parent.children.append(node)
+            nodes.append(node)
+        self.add_constraints(root)
+        return root, nodes
+
+    def add_constraints(self, parent):
+        count = self.constraints * len(parent.children)
+        whole = int(count)
+        if self.random.random() < count - whole:
+            whole += 1
+        for _ in range(whole):
+            child = self.random.choice(parent.children)
+            kind = self.random.random()
+            if kind < 0.2:
+                # Size of the view itself, stored in the view
+                child.constraints.append((None, self.random.choice(size_attributes), None, None))
+            elif kind < 0.4 and len(parent.children) > 1:
+                sibling = self.random.choice(parent.children)
+                parent.constraints.append((child, 'top', sibling, 'bottom'))
+            else:
+                attribute = self.random.choice(edge_attributes)
+                parent.constraints.append((child, attribute, parent, attribute))
+        for child in parent.children:
+            if child.children:
+                self.add_constraints(child)
+
+    def write(self, line):
+        self.lines.append('    ' * self.indent + line)
+
+    def open(self, line):
+        self.write(line)
+        self.indent += 1
+
+    def close(self, line):
+        self.indent -= 1
+        self.write(line)
+
+    def text(self, n):
+        return ' '.join(self.random.choice(words) for _ in range(n))
+
+    def frame(self):
+        return '<rect key="frame" x="{}" y="{}" width="{}" height="{}"/>'.format(
+            self.random.randint(0, 300), self.random.randint(0, 600),
+            self.random.randint(20, 375), self.random.randint(20, 200))
+
+    def color(self, key):
+        kind = self.random.randrange(4)
+        if kind == 0:
+            return '<color key="{}" cocoaTouchSystemColor="darkTextColor"/>'.format(key)
+        if kind == 1:
+            return '<color key="{}" white="{}" alpha="1" colorSpace="calibratedWhite"/>'.format(
+                key, self.random.choice(['0.0', '0.5', '1']))
+        return '<color key="{}" red="{}" green="{}" blue="0.25" alpha="1" colorSpace="calibratedRGB"/>'.format(
+            key, self.random.choice(['0.0', '0.2', '1']), self.random.choice(['0.0', '0.5', '1']))
+
+    def missing(self):
+        # Random numbers are only drawn when asked for missing assets, so that other files stay the same
+        return self.missing_assets > 0 and self.random.random() < self.missing_assets
+
+    def font(self, key):
+        if self.random.random() < 0.7:
+            return '<fontDescription key="{}" type="system" pointSize="{}"/>'.format(
+                key, self.random.choice([12, 14, 17]))
+        if self.missing():
+            return '<fontDescription key="{}" name="MissingFont" family="MissingFont" pointSize="{}"/>'.format(
+                key, self.random.choice([12, 14, 17]))
+        return '<fontDescription key="{}" name="Helvetica" family="Helvetica" pointSize="{}"/>'.format(
+            key, self.random.choice([12, 14, 17]))
+
+    def write_constraint(self, constraint):
+        (first, first_attribute, second, second_attribute) = constraint
+        attrs = ''
+        if first is not None:
+            attrs += ' firstItem="{}"'.format(first.xib_id)
+        attrs += ' firstAttribute="{}"'.format(first_attribute)
+        relation = self.random.choice(relations)
+        if relation is not None:
+            attrs += ' relation="{}"'.format(relation)
+        if second is not None:
+            attrs += ' secondItem="{}" secondAttribute="{}"'.format(second.xib_id, second_attribute)
+        attrs += ' constant="{}"'.format(self.random.randint(0, 40))
+        if self.random.random() < 0.2:
+            attrs += ' priority="{}"'.format(self.random.choice([250, 750, 999]))
+        self.write('<constraint{} id="{}"/>'.format(attrs, self.new_id()))
+
+    def write_view(self, node, root=False):
+        if root:
+            self.open('<view contentMode="scaleToFill" id="{}">'.format(node.xib_id))
+            self.write('<rect key="frame" x="0.0" y="0.0" width="375" height="667"/>')
+            self.write('<autoresizingMask key="autoresizingMask" widthSizable="YES" heightSizable="YES"/>')
+        else:
+            getattr(self, 'open_' + node.tag)(node)
+        if node.children:
+            self.open('<subviews>')
+            for child in node.children:
+                self.write_view(child)
+            self.close('</subviews>')
+        if node.tag in ('view', 'scrollView'):
+            self.write(self.color('backgroundColor'))
+        if node.constraints:
+            self.open('<constraints>')
+            for constraint in node.constraints:
+                self.write_constraint(constraint)
+            self.close('</constraints>')
+        if node.tag == 'button':
+            self.open('<connections>')
+            self.write('<action selector="onTap:" destination="-1" eventType="touchUpInside" id="{}"/>'.format(
+                self.new_id()))
+            self.close('</connections>')
+        if root:
+            self.write('<point key="canvasLocation" x="33.5" y="53.5"/>')
+        self.close('</{}>'.format(node.tag))
+
+    def open_view(self, node):
+        self.open('<view contentMode="scaleToFill" translatesAutoresizingMaskIntoConstraints="NO" id="{}">'.format(
+            node.xib_id))
+        self.write(self.frame())
+
+    def open_scrollView(self, node):
+        self.open('<scrollView clipsSubviews="YES" multipleTouchEnabled="YES" contentMode="scaleToFill" '
+                  'pagingEnabled="YES" showsHorizontalScrollIndicator="NO" '
+                  'translatesAutoresizingMaskIntoConstraints="NO" id="{}">'.format(node.xib_id))
+        self.write(self.frame())
+
+    def open_label(self, node):
+        attributed = self.fragments > 0 and self.random.random() < 0.3
+        common = ('opaque="NO" userInteractionEnabled="NO" contentMode="left" horizontalHuggingPriority="251" '
+                  'verticalHuggingPriority="251" lineBreakMode="tailTruncation" baselineAdjustment="alignBaselines" '
+                  'adjustsFontSizeToFit="NO" translatesAutoresizingMaskIntoConstraints="NO"')
+        if attributed:
+            self.open('<label {} usesAttributedText="YES" numberOfLines="0" id="{}">'.format(common, node.xib_id))
+        else:
+            self.open('<label {} text={} textAlignment="natural" id="{}">'.format(
+                common, quoteattr(self.text(self.random.randint(1, 6))), node.xib_id))
+        self.write(self.frame())
+        if attributed:
+            self.open('<attributedString key="attributedText">')
+            for _ in range(self.fragments):
+                self.open('<fragment content={}>'.format(quoteattr(self.text(self.random.randint(1, 12)) + ' ')))
+                self.open('<attributes>')
+                self.write(self.color('NSColor'))
+                self.write('<font key="NSFont" name="Helvetica" size="{}"/>'.format(self.random.choice([12, 14])))
+                self.write('<paragraphStyle key="NSParagraphStyle" alignment="natural" lineBreakMode="wordWrapping" '
+                           'baseWritingDirection="natural"/>')
+                self.close('</attributes>')
+                self.close('</fragment>')
+            self.close('</attributedString>')
+        else:
+            self.write(self.font('fontDescription'))
+            self.write(self.color('textColor'))
+        self.write('<nil key="highlightedColor"/>')
+
+    def open_button(self, node):
+        self.open('<button opaque="NO" contentMode="scaleToFill" contentHorizontalAlignment="center" '
+                  'contentVerticalAlignment="center" buttonType="roundedRect" lineBreakMode="middleTruncation" '
+                  'translatesAutoresizingMaskIntoConstraints="NO" id="{}">'.format(node.xib_id))
+        self.write(self.frame())
+        for state in state_names[:self.button_states]:
+            self.write('<state key="{}" title={}/>'.format(state, quoteattr(self.text(2))))
+
+    def open_imageView(self, node):
+        prefix = 'missing_image_' if self.missing() else 'image_'
+        self.open('<imageView userInteractionEnabled="NO" contentMode="scaleAspectFit" image="{}{}" '
+                  'translatesAutoresizingMaskIntoConstraints="NO" id="{}">'.format(
+                      prefix, self.random.randint(1, 20), node.xib_id))
+        self.write(self.frame())
+
+    def open_pageControl(self, node):
+        self.open('<pageControl opaque="NO" contentMode="scaleToFill" contentHorizontalAlignment="center" '
+                  'contentVerticalAlignment="center" numberOfPages="3" '
+                  'translatesAutoresizingMaskIntoConstraints="NO" id="{}">'.format(node.xib_id))
+        self.write(self.frame())
+
+    def open_switch(self, node):
+        self.open('<switch opaque="NO" contentMode="scaleToFill" horizontalHuggingPriority="750" '
+                  'verticalHuggingPriority="750" contentHorizontalAlignment="center" contentVerticalAlignment="center" '
+                  'on="YES" translatesAutoresizingMaskIntoConstraints="NO" id="{}">'.format(node.xib_id))
+        self.write(self.frame())
+
+    def open_mapView(self, node):
+        self.open('<mapView clipsSubviews="YES" multipleTouchEnabled="YES" contentMode="scaleToFill" '
+                  'mapType="standard" translatesAutoresizingMaskIntoConstraints="NO" id="{}">'.format(node.xib_id))
+        self.write(self.frame())
+
+    def write_connections(self, nodes):
+        outlets = min(self.outlets, len(nodes))
+        if outlets == 0:
+            return
+        buttons = [n for n in nodes if n.tag == 'button']
+        self.open('<connections>')
+        for i in range(outlets):
+            node = nodes[self.random.randrange(len(nodes))]
+            self.write('<outlet property="view{}" destination="{}" id="{}"/>'.format(i + 1, node.xib_id,
+                                                                                   self.new_id()))
+        for node in buttons[:outlets]:
+            self.write('<outletCollection property="buttons" destination="{}" id="{}"/>'.format(node.xib_id,
+                                                                                             self.new_id()))
+        self.close('</connections>')
+
+    def generate(self):
+        (root, nodes) = self.build_tree()
+        self.lines = ['<?xml version="1.0" encoding="UTF-8"?>']
+        self.open('<document type="com.apple.InterfaceBuilder3.CocoaTouch.XIB" version="3.0" toolsVersion="12121" '
+                  'systemVersion="16G29" targetRuntime="iOS.CocoaTouch" propertyAccessControl="none" '
+                  'useAutolayout="YES" useTraitCollections="YES">')
+        self.open('<dependencies>')
+        self.write('<deployment identifier="iOS"/>')
+        self.close('</dependencies>')
+        self.open('<objects>')
+        self.open('<placeholder placeholderIdentifier="IBFilesOwner" id="-1" userLabel="File\'s Owner" '
+                  'customClass="GeneratedView">')
+        self.write_connections(nodes)
+        self.close('</placeholder>')
+        self.write('<placeholder placeholderIdentifier="IBFirstResponder" id="-2" customClass="UIResponder"/>')
+        self.write_view(root, root=True)
+        self.close('</objects>')
+        self.close('</document>')
+        return '\n'.join(self.lines) + '\n'
+
+
+def generate_xib(path, **params):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(XibGenerator(**params).generate())
+
+
+def run_generator():
+    args = arg_parser.parse_args()
+    generate_xib(args.output, views=args.views, depth=args.depth, constraints=args.constraints,
+                 fragments=args.fragments, button_states=args.button_states, outlets=args.outlets,
+                 missing_assets=args.missing_assets, seed=args.seed)
+
+
+if __name__ == '__main__':
+    run_generator()